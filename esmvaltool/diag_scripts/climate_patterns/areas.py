@@ -0,0 +1,279 @@
+"""Script defining the areas over which the regression predictor is averaged.
+
+Patterns are regressed against the near-surface air temperature averaged
+over an area: the globe, its land or ocean, a named latitude band, or a
+custom mask read from a NetCDF file. The temperature of every area chosen
+is averaged in one pass over the data, as a single product of the fields
+with the weights of all areas, so each extra area costs one more column
+of weights rather than another pass over the timeseries.
+
+Author
+------
+Gregory Munday (Met Office, UK)
+"""
+
+import logging
+import os
+from pathlib import Path
+
+import iris
+import numpy as np
+import sub_functions as sf
+
+logger = logging.getLogger(Path(__file__).stem)
+
+# areas weighted by the area of land or ocean in every grid cell
+SURFACE_AREAS = ("global", "land", "ocean")
+
+# named latitude bands, (minimum latitude, maximum latitude)
+REGIONS = {
+    "northern_hemisphere": (0.0, 90.0),
+    "southern_hemisphere": (-90.0, 0.0),
+    "tropics": (-30.0, 30.0),
+    "northern_extratropics": (30.0, 90.0),
+    "southern_extratropics": (-90.0, -30.0),
+    "arctic": (60.0, 90.0),
+}
+
+MASK_SUFFIX = ".nc"
+
+
+def area_name(area):
+    """Name an area: the name of a region, or the file name of a mask.
+
+    Parameters
+    ----------
+    area : str
+        name of an area, or path to a mask file
+
+    Returns
+    -------
+    name : str
+        name of the area, e.g. sahel for /masks/sahel.nc
+    """
+    if area.endswith(MASK_SUFFIX):
+        return Path(area).stem
+
+    return area
+
+
+def parse_areas(area, mask_dir=None):
+    """Check the areas chosen in the recipe, and name them.
+
+    Parameters
+    ----------
+    area : str or list
+        area, or list of areas, from the recipe
+    mask_dir : str
+        directory of mask files given as relative paths, e.g. the
+        auxiliary_data_dir of ESMValTool
+
+    Returns
+    -------
+    areas : dict
+        area, or absolute path to the mask file, by name, in the order
+        chosen
+
+    Raises
+    ------
+    ValueError
+        if an area is unknown, no area is chosen, or two areas have the
+        same name
+    """
+    chosen = [area] if isinstance(area, str) else list(area or [])
+    if not chosen:
+        raise ValueError("No area chosen, choose at least 'global'")
+
+    areas = {}
+    for item in chosen:
+        item = os.fspath(item)
+        name = area_name(item)
+        if item.endswith(MASK_SUFFIX):
+            if mask_dir is not None:
+                item = os.path.join(mask_dir, os.path.expanduser(item))
+        elif name not in SURFACE_AREAS and name not in REGIONS:
+            raise ValueError(
+                f"Unknown area '{item}', choose from "
+                f"{SURFACE_AREAS + tuple(REGIONS)} or a {MASK_SUFFIX} mask"
+            )
+        if name in areas:
+            raise ValueError(f"Area '{name}' chosen more than once")
+        areas[name] = item
+
+    return areas
+
+
+def load_mask(path, cube):
+    """Load a mask as the fraction of every grid cell inside its area.
+
+    Masks are fractions from 0 to 1, or percentages if their units are
+    %, with masked cells outside the area. Masks on the full grid are
+    cut to the latitudes of the cube, e.g. without Antarctica.
+
+    Parameters
+    ----------
+    path : str
+        path to the mask file
+    cube : cube
+        cube on the grid of the patterns
+
+    Returns
+    -------
+    fraction : arr
+        (lat, lon) fraction of every grid cell inside the area
+
+    Raises
+    ------
+    ValueError
+        if the mask is not on the grid of the cube
+    """
+    mask = sf.load_cube(path)
+    lat = cube.coord("latitude").points
+    tolerance = 1e-6 * max(1.0, np.abs(lat).max())
+    mask = mask.extract(
+        iris.Constraint(
+            latitude=lambda cell: (
+                lat.min() - tolerance <= cell.point <= lat.max() + tolerance
+            )
+        )
+    )
+    if mask is None or not all(
+        mask.coord(name).shape == cube.coord(name).shape
+        and np.allclose(mask.coord(name).points, cube.coord(name).points)
+        for name in ("latitude", "longitude")
+    ):
+        raise ValueError(
+            f"Mask {path} is not on the grid of the patterns, "
+            f"{cube.coord('latitude').shape + cube.coord('longitude').shape}"
+        )
+
+    fraction = np.ma.filled(mask.data, 0.0).astype(np.float64)
+    if mask.units == "%":
+        fraction = fraction / 100.0
+    dims = mask.coord_dims("latitude") + mask.coord_dims("longitude")
+    if dims != (0, 1):
+        fraction = fraction.T
+
+    return fraction
+
+
+def area_weights(cube, areas, ocean_frac=None, land_frac=None):
+    """Stack the normalised weights of several areas of a grid.
+
+    Parameters
+    ----------
+    cube : cube
+        cube on the grid, with latitude and longitude coords
+    areas : dict
+        areas or paths to mask files, by name, as returned by
+        ``parse_areas``
+    ocean_frac : cube
+        gridded ocean fraction, for the ocean area
+    land_frac : cube
+        gridded land fraction, for the land area
+
+    Returns
+    -------
+    weights : arr
+        (lat * lon, area) weights, every column summing to one
+    renormalised : arr
+        (area,) booleans, True for areas whose means leave masked cells
+        out, rather than counting them towards the area
+
+    Raises
+    ------
+    ValueError
+        if an area has no grid cells
+    """
+    grid = sf.grid_weights(cube, ocean_frac, land_frac)
+    global_weights = grid.weights["global"]
+    lat = np.broadcast_to(
+        cube.coord("latitude").points[:, np.newaxis], global_weights.shape
+    )
+
+    columns = []
+    for name, area in areas.items():
+        if area in SURFACE_AREAS:
+            columns.append(grid.weights[area])
+            continue
+        if area in REGIONS:
+            min_lat, max_lat = REGIONS[area]
+            column = np.where(
+                (lat >= min_lat) & (lat <= max_lat), global_weights, 0.0
+            )
+        else:
+            column = global_weights * load_mask(area, cube)
+        if not column.sum() > 0.0:
+            raise ValueError(f"Area '{name}' has no cells on the grid")
+        columns.append(column / column.sum())
+
+    weights = np.stack([column.ravel() for column in columns], axis=1)
+    # land and ocean means count masked cells towards the area, as
+    # sub_functions.area_avg_landsea does
+    renormalised = np.array(
+        [area not in ("land", "ocean") for area in areas.values()]
+    )
+
+    return weights, renormalised
+
+
+def weighted_means(sums, renormalised):
+    """Calculate the means of every field over several areas.
+
+    Parameters
+    ----------
+    sums : arr
+        (time, 2, area) sums of weighted values and of normalised
+        weights, as returned by ``sub_functions.weighted_sums``
+    renormalised : arr
+        (area,) booleans, True to average over unmasked cells only
+
+    Returns
+    -------
+    means : arr
+        (time, area) array of means, NaN where all cells of an area are
+        masked
+    """
+    total, area = sums[:, 0], sums[:, 1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        means = np.where(renormalised, total / area, total)
+
+    return np.where(area > 0.0, means, np.nan)
+
+
+def area_means(cube, areas, ocean_frac=None, land_frac=None):
+    """Average a cube over several areas at once.
+
+    Lazy cubes are averaged chunk by chunk, along time or in tiles,
+    still in one pass over the data for all areas.
+
+    Parameters
+    ----------
+    cube : cube
+        (time, lat, lon) cube, e.g. of near-surface air temperature
+    areas : dict
+        areas or paths to mask files, by name, as returned by
+        ``parse_areas``
+    ocean_frac : cube
+        gridded ocean fraction, for the ocean area
+    land_frac : cube
+        gridded land fraction, for the land area
+
+    Returns
+    -------
+    means : dict
+        (time,) mean timeseries of every area, masked where all its cells
+        are masked, by name
+    """
+    weights, renormalised = area_weights(cube, areas, ocean_frac, land_frac)
+    if cube.has_lazy_data():
+        sums = sf.spatial_sums(cube.lazy_data(), weights).compute()
+    else:
+        sums = sf.weighted_sums(cube.data, weights)
+    means = weighted_means(sums, renormalised)
+    logger.debug("Averaged %s over %s", cube.var_name, ", ".join(areas))
+
+    return {
+        name: np.ma.masked_invalid(means[:, i])
+        for i, name in enumerate(areas)
+    }
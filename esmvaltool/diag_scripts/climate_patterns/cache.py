@@ -0,0 +1,276 @@
+"""Script containing an on-disk cache of climatologies and anomalies.
+
+Entries are content-addressed: their key is a hash of the checksums of
+the input files and of the options that change the result, so reruns
+with the same inputs skip straight to the regression. The least recently
+used entries are evicted when the cache grows beyond its size limit,
+except for the entries of the current run, which may still be read.
+
+Author
+------
+Gregory Munday (Met Office, UK)
+"""
+
+import hashlib
+import json
+import logging
+import os
+from concurrent import futures
+from pathlib import Path
+
+import iris
+import yaml
+
+logger = logging.getLogger(Path(__file__).stem)
+
+# bump to invalidate existing entries when the cached calculation changes
+CACHE_VERSION = 1
+
+
+def file_checksum(filename, block_size=2**24):
+    """Calculate the SHA-256 checksum of a file's contents.
+
+    Parameters
+    ----------
+    filename : path
+        path to the file
+    block_size : int
+        number of bytes read at once
+
+    Returns
+    -------
+    checksum : str
+        hexadecimal checksum
+    """
+    checksum = hashlib.sha256()
+    with open(filename, "rb") as file:
+        for block in iter(lambda: file.read(block_size), b""):
+            checksum.update(block)
+
+    return checksum.hexdigest()
+
+
+class AnomalyCache:
+    """Cache of climatology and anomaly cubes, stored as NetCDF files.
+
+    Parameters
+    ----------
+    cache_dir : path
+        directory of the cache, may be shared between runs
+    max_size : int
+        maximum size of the cache, in MB
+    """
+
+    def __init__(self, cache_dir, max_size=10000):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.in_use = set()
+        self._checksum_file = self.cache_dir / "checksums.yml"
+        self._checksums = {}
+        if self._checksum_file.exists():
+            with open(self._checksum_file, encoding="utf-8") as file:
+                try:
+                    self._checksums = yaml.safe_load(file) or {}
+                except yaml.YAMLError as exc:
+                    # the checksums are only remembered to save time
+                    logger.warning(
+                        "Ignoring unreadable %s: %s", self._checksum_file, exc
+                    )
+
+    def checksums(self, filenames):
+        """Calculate the checksums of files, concurrently.
+
+        Checksums are remembered by path, size and modification time, so
+        unchanged files are only read once.
+
+        Parameters
+        ----------
+        filenames : list
+            paths to the files
+
+        Returns
+        -------
+        checksums : list
+            hexadecimal checksums, in the order of the files
+        """
+        stamps = {}
+        missing = []
+        for filename in filenames:
+            stat = os.stat(filename)
+            stamps[filename] = f"{stat.st_size}:{stat.st_mtime_ns}"
+            known = self._checksums.get(str(filename), {})
+            if known.get("stamp") != stamps[filename]:
+                missing.append(filename)
+
+        if missing:
+            with futures.ThreadPoolExecutor() as executor:
+                for filename, checksum in zip(
+                    missing, executor.map(file_checksum, missing)
+                ):
+                    self._checksums[str(filename)] = {
+                        "stamp": stamps[filename],
+                        "checksum": checksum,
+                    }
+            # other runs sharing the cache may read the file meanwhile
+            tmp_path = self._checksum_file.with_name(
+                f"{self._checksum_file.name}.{os.getpid()}.tmp"
+            )
+            with open(tmp_path, "w", encoding="utf-8") as file:
+                yaml.safe_dump(self._checksums, file)
+            os.replace(tmp_path, self._checksum_file)
+
+        return [
+            self._checksums[str(filename)]["checksum"]
+            for filename in filenames
+        ]
+
+    def key(self, filenames, **options):
+        """Make the cache key of an entry.
+
+        Parameters
+        ----------
+        filenames : list
+            input files of the entry
+        **options : any
+            JSON-serialisable options that change the cached result
+
+        Returns
+        -------
+        key : str
+            hexadecimal cache key
+        """
+        content = {
+            "version": CACHE_VERSION,
+            "checksums": self.checksums(filenames),
+            "options": options,
+        }
+        return hashlib.sha256(
+            json.dumps(content, sort_keys=True).encode()
+        ).hexdigest()
+
+    def _paths(self, key):
+        return (
+            self.cache_dir / f"{key}_clim.nc",
+            self.cache_dir / f"{key}_anom.nc",
+        )
+
+    def contains(self, key):
+        """Check whether an entry is cached, and count the hit or miss.
+
+        Parameters
+        ----------
+        key : str
+            cache key
+
+        Returns
+        -------
+        cached : bool
+            True if the entry is cached
+        """
+        self.in_use.add(key)
+        paths = self._paths(key)
+        if all(path.exists() for path in paths):
+            self.hits += 1
+            for path in paths:
+                # marks the entry as recently used, for eviction
+                path.touch()
+            return True
+
+        self.misses += 1
+        return False
+
+    def get(self, key):
+        """Load a cached entry.
+
+        Parameters
+        ----------
+        key : str
+            cache key
+
+        Returns
+        -------
+        clim_cube : cube
+            climatology cube
+        anom_cube : cube
+            anomaly cube
+        """
+        clim_path, anom_path = self._paths(key)
+        logger.debug("Loading cached %s", anom_path)
+
+        return iris.load_cube(clim_path), iris.load_cube(anom_path)
+
+    def put(self, key, clim_cube, anom_cube):
+        """Store an entry, then evict old entries beyond the size limit.
+
+        HDF5 is not thread-safe, so callers writing other NetCDF files
+        from other threads at the same time hold a lock around this.
+
+        Parameters
+        ----------
+        key : str
+            cache key
+        clim_cube : cube
+            climatology cube
+        anom_cube : cube
+            anomaly cube
+
+        Returns
+        -------
+        None
+        """
+        for cube, path in zip((clim_cube, anom_cube), self._paths(key)):
+            # writing under a temporary name, so readers never see a
+            # partial file
+            tmp_path = path.with_name(f"{path.stem}.{os.getpid()}.tmp")
+            iris.save(cube, str(tmp_path), saver="nc")
+            os.replace(tmp_path, path)
+        self.evict()
+
+    def evict(self):
+        """Remove the least recently used entries beyond the size limit.
+
+        Entries in use by the current run are kept.
+
+        Returns
+        -------
+        None
+        """
+        entries = {}
+        for path in self.cache_dir.glob("*.nc"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            key = path.stem.rsplit("_", 1)[0]
+            size, used = entries.get(key, (0, 0))
+            entries[key] = (size + stat.st_size, max(used, stat.st_mtime))
+
+        total = sum(size for size, _ in entries.values())
+        for key, (size, _) in sorted(
+            entries.items(), key=lambda item: item[1][1]
+        ):
+            if total <= self.max_size * 1024**2:
+                break
+            if key in self.in_use:
+                continue
+            logger.info("Evicting cache entry %s", key)
+            for path in self._paths(key):
+                path.unlink(missing_ok=True)
+            total -= size
+
+    def log_stats(self):
+        """Log the cache hit/miss statistics.
+
+        Returns
+        -------
+        None
+        """
+        logger.info(
+            "Climatology/anomaly cache %s: %s hits, %s misses",
+            self.cache_dir,
+            self.hits,
+            self.misses,
+        )
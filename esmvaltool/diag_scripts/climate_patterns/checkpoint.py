@@ -0,0 +1,236 @@
+"""Script checkpointing the outputs of every model of a run.
+
+Once all tasks of a model have finished, a manifest is written in its
+work_dir directory, listing the files saved for the model and a key of
+what they were made from: the datasets of the model, and the options
+changing its outputs. A rerun resuming from that work_dir skips every
+model whose manifest has the same key and whose files are all still
+there, copying them over instead, so only the missing, failed or changed
+models are computed again.
+
+Author
+------
+Gregory Munday (Met Office, UK)
+"""
+
+import hashlib
+import logging
+import os
+import shutil
+from pathlib import Path
+
+import yaml
+
+logger = logging.getLogger(Path(__file__).stem)
+
+MANIFEST_FILE = "manifest.yml"
+
+# bump to invalidate existing manifests when the outputs change
+CHECKPOINT_VERSION = 1
+
+# facets of the datasets identifying the data of a model
+DATASET_FACETS = (
+    "dataset",
+    "short_name",
+    "exp",
+    "ensemble",
+    "mip",
+    "grid",
+    "start_year",
+    "end_year",
+)
+
+# files written after the manifest, or rewritten by every run
+UNCHECKED_FILES = (MANIFEST_FILE, "stages.csv")
+
+
+def run_key(datasets, options):
+    """Make a key identifying the outputs of a model.
+
+    Parameters
+    ----------
+    datasets : list
+        metadata of the datasets of the model, from the config dictionary
+    options : dict
+        options of the recipe changing the outputs of the model
+
+    Returns
+    -------
+    key : str
+        hexadecimal hash of the facets of the datasets and the options
+    """
+    facets = sorted(
+        [str(dataset.get(facet)) for facet in DATASET_FACETS]
+        for dataset in datasets
+    )
+    content = yaml.safe_dump(
+        {
+            "version": CHECKPOINT_VERSION,
+            "datasets": facets,
+            "options": options,
+        },
+        sort_keys=True,
+    )
+
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def list_files(directory):
+    """List the files in a directory and its subdirectories, with sizes.
+
+    Parameters
+    ----------
+    directory : path
+        directory to list; an empty listing if it does not exist
+
+    Returns
+    -------
+    files : dict
+        size in bytes of every file, by path relative to the directory
+    """
+    directory = Path(directory)
+    if not directory.is_dir():
+        return {}
+
+    return {
+        str(path.relative_to(directory)): path.stat().st_size
+        for path in sorted(directory.rglob("*"))
+        if path.is_file() and path.name not in UNCHECKED_FILES
+    }
+
+
+def write_manifest(model, key, work_dir, plot_dir, runs):
+    """Write the manifest of a model whose tasks have all finished.
+
+    Parameters
+    ----------
+    model : str
+        model name
+    key : str
+        key of the outputs, as returned by ``run_key``
+    work_dir : path
+        directory of the model in work_dir
+    plot_dir : path
+        directory of the model in plot_dir
+    runs : dict
+        directory of the patterns, relative to work_dir, per area, per
+        scenario
+
+    Returns
+    -------
+    path : path
+        path to the manifest
+    """
+    manifest = {
+        "model": model,
+        "key": key,
+        "plot_dir": os.path.abspath(plot_dir),
+        "runs": runs,
+        "work_files": list_files(work_dir),
+        "plot_files": list_files(plot_dir),
+    }
+    path = Path(work_dir) / MANIFEST_FILE
+    # written under another name first, so a crash leaves no manifest
+    temporary = path.with_suffix(".tmp")
+    with open(temporary, "w", encoding="utf-8") as file:
+        yaml.safe_dump(manifest, file, sort_keys=False)
+    os.replace(temporary, path)
+    logger.info("Checkpointed %s in %s", model, path)
+
+    return path
+
+
+def complete_models(resume_from, keys):
+    """Find the models completed by a previous run, with the same key.
+
+    Parameters
+    ----------
+    resume_from : path
+        work_dir of the previous run
+    keys : dict
+        key of the outputs of every model of this run, as returned by
+        ``run_key``
+
+    Returns
+    -------
+    manifests : dict
+        manifest of every complete model, with the directory of the model
+        in the previous work_dir ("work_dir"), by model name
+    """
+    manifests = {}
+    for path in sorted(Path(resume_from).glob(f"*/{MANIFEST_FILE}")):
+        with open(path, encoding="utf-8") as file:
+            manifest = yaml.safe_load(file) or {}
+        model = manifest.get("model")
+        if model not in keys:
+            continue
+        if manifest.get("key") != keys[model]:
+            logger.info("Recomputing %s, its data or options changed", model)
+            continue
+        manifest["work_dir"] = str(path.parent)
+        missing = []
+        for directory, files in (
+            (manifest["work_dir"], manifest["work_files"]),
+            (manifest["plot_dir"], manifest["plot_files"]),
+        ):
+            found = list_files(directory)
+            missing.extend(
+                name for name, size in files.items()
+                if found.get(name) != size
+            )
+        if missing:
+            logger.info(
+                "Recomputing %s, %s of its files are missing or changed",
+                model,
+                len(missing),
+            )
+            continue
+        manifests[model] = manifest
+
+    return manifests
+
+
+def restore_model(manifest, work_path, plot_path):
+    """Copy the files of a complete model into the directories of a run.
+
+    Nothing is copied if the run resumes from its own work_dir.
+
+    Parameters
+    ----------
+    manifest : dict
+        manifest of the model, as returned by ``complete_models``
+    work_path : path
+        path to the work_dir of this run
+    plot_path : path
+        path to the plot_dir of this run
+
+    Returns
+    -------
+    work_dir : path
+        directory of the model in the work_dir of this run
+    copied : list
+        paths to the files copied into work_dir
+    """
+    name = os.path.basename(manifest["work_dir"])
+    work_dir = os.path.join(work_path, name)
+    plot_dir = os.path.join(plot_path, name)
+    if os.path.abspath(manifest["work_dir"]) == os.path.abspath(work_dir):
+        return work_dir, []
+
+    copied = []
+    for source, target, files in (
+        (manifest["work_dir"], work_dir, manifest["work_files"]),
+        (manifest["plot_dir"], plot_dir, manifest["plot_files"]),
+    ):
+        for file_name in files:
+            path = os.path.join(target, file_name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            shutil.copy2(os.path.join(source, file_name), path)
+            if target == work_dir:
+                copied.append(path)
+    write_manifest(
+        manifest["model"], manifest["key"], work_dir, plot_dir,
+        manifest["runs"],
+    )
+
+    return work_dir, copied
@@ -24,37 +24,189 @@ imogen_mode: bool, optional (default: off)
 output_r2_scores: bool, optional (default: off)
     options: on, off
     def: outputs determinant values per variable to measure pattern robustness
+area: str or list, optional (default: global)
+    options: global, land, ocean, northern_hemisphere, southern_hemisphere,
+             tropics, northern_extratropics, southern_extratropics, arctic,
+             or the path to a mask NetCDF file on the grid of the patterns,
+             relative to auxiliary_data_dir
+    def: area, or list of areas, over which near-surface air temperature is
+         averaged as the regression predictor. All areas are averaged in
+         one pass and share the climatologies and anomalies; with more than
+         one, the patterns of every area are saved in a subdirectory named
+         after it, e.g. after the mask file without .nc
+regression_estimator: str, optional (default: ols)
+    options: ols, ols_intercept, theil_sen, huber
+    def: estimator of the regression slopes: least squares through the
+         origin, least squares with an intercept, or the outlier-resistant
+         Theil-Sen (median of pairwise slopes) and Huber estimators.
+         Recorded in the attributes of the patterns and scores
+running_mean_years: int, optional (default: 1)
+    options: any int, up to the length of the scenario in years
+    def: regresses N-year running means of every month rather than
+         yearly values, smoothing out interannual variability. Neither this
+         nor a regression_estimator other than ols can be combined with
+         'lazy: on' or 'incremental: on'
+bootstrap: bool, optional (default: off)
+    options: on, off
+    def: bootstraps the standard error and percentiles of the pattern
+         slopes of every grid cell and month, saved in uncertainty.nc next
+         to the patterns. Resamples are evaluated in batches as matrix
+         products, so only the ols and ols_intercept estimators are
+         supported, and not with 'lazy: on' (unless 'tiled: on') or
+         'incremental: on'
+bootstrap_resamples: int, optional (default: 1000)
+    options: any int, at least 2
+    def: number of bootstrap resamples; run time and memory grow with it
+bootstrap_block_years: int, optional (default: 1)
+    options: any int, up to the length of the scenario in years
+    def: resamples blocks of this many consecutive years (moving block
+         bootstrap), keeping the autocorrelation of the residuals; 1 is
+         the plain bootstrap
+bootstrap_percentiles: list, optional (default: [5, 95])
+    options: list of percentiles, from 0 to 100
+    def: percentiles of the bootstrapped slopes, with 'bootstrap: on'
 parallelise: bool, optional (default: off)
     options: on, off
-    def: parallelises code to run N models at once
+    def: parallelises code to run (model, variable) tasks at once
 parallel_threads: int, optional (default: null)
     options: any int, up to the amount of CPU cores accessible by user
     def: number of threads/cores to parallelise over. If 'parallelise: on' and
          'parallel_threads': null, diagnostic will automatically parallelise
          over N-1 accessible threads
+parallel_backend: str, optional (default: process)
+    options: process, thread
+    def: runs parallel tasks in worker processes or threads. Processes run
+         all tasks of a model, so its data stay in one process; with more
+         workers than models, the tasks of a model also run on threads
+worker_memory_limit: int, optional (default: null)
+    options: any int, in MB
+    def: maximum memory per worker process, with 'parallel_backend: process'
+retries: int, optional (default: 0)
+    options: any int
+    def: number of times a failed task is run again, e.g. after its worker
+         process was killed for its memory, before its model fails. A
+         failed model does not stop the others, its tasks are skipped and
+         listed in run_report.yml, and the run fails once all others finish
+resume_from: str, optional (default: null)
+    options: any path
+    def: work_dir of a previous run; models it completed, with the same
+         input data and options, are copied over rather than computed, so
+         a failed or interrupted run only computes the remaining models
+single_pass_regression: bool, optional (default: off)
+    options: on, off
+    def: regresses all months and variables in a single vectorised step,
+         rather than month by month per variable (needs more memory)
+lazy: bool, optional (default: off)
+    options: on, off
+    def: keeps data lazy and streams it in chunks along time, so memory use
+         is bounded by chunk_budget rather than the length of the record
+chunk_budget: int, optional (default: 256)
+    options: any int, in MB
+    def: maximum size of a single chunk of data when 'lazy: on', or of a
+         single tile when 'tiled: on'
+tiled: bool, optional (default: off)
+    options: on, off
+    def: keeps data lazy in spatial tiles, each holding the whole
+         timeseries of its cells, and regresses tile by tile on parallel
+         threads, so native-resolution grids need no regridding and
+         memory use is bounded by chunk_budget per thread. Unlike
+         'lazy: on', all regression estimators and running means work
+cache: bool, optional (default: off)
+    options: on, off
+    def: caches climatologies and anomalies on disk, keyed on the contents
+         of the input files, so reruns skip straight to the regression
+cache_dir: str, optional (default: null)
+    options: any path
+    def: directory of the cache, shared between runs; if null, a cache
+         directory in work_dir is used, which only lasts for one run
+cache_size: int, optional (default: 10000)
+    options: any int, in MB
+    def: maximum size of the cache, least recently used entries are evicted
+incremental: bool, optional (default: off)
+    options: on, off
+    def: keeps the regression statistics of every model in a sidecar file,
+         and folds only new scenario years or new ensemble members into
+         them, instead of regressing the whole timeseries again
+statistics_dir: str, optional (default: null)
+    options: any path
+    def: directory of the regression statistics, shared between runs; if
+         null, work_dir is used, which only lasts for one run
+scenarios: list, optional (default: null)
+    options: list of scenarios, e.g. [ssp126, ssp245, ssp370, ssp585]
+    def: scenarios to build patterns for, from the exp of the input data,
+         e.g. historical-ssp126; if null, all scenarios in the input data.
+         Climatologies are made once from the historical period and shared
+         by all scenarios, whose outputs are saved in per-scenario
+         subdirectories when there are more than one
+output_compression: str, optional (default: none)
+    options: none, zlib
+    def: compresses the output NetCDF files, chunked one month at a time
+         as JULES-IMOGEN reads them
+output_complevel: int, optional (default: 4)
+    options: 1 to 9
+    def: zlib compression level, with 'output_compression: zlib'
+output_dtype: str, optional (default: null)
+    options: null, float32, int16
+    def: data type of the output NetCDF files; int16 packs the data with a
+         scale factor and offset. If null, the data type is kept
+ensemble_statistics: bool, optional (default: off)
+    options: on, off
+    def: saves the multi-model mean, standard deviation, percentiles and
+         sign agreement of the patterns of all models, per scenario
+ensemble_percentiles: list, optional (default: [5, 50, 95])
+    options: list of percentiles, from 0 to 100
+    def: percentiles of the patterns across models, with
+         'ensemble_statistics: on'
+plots: bool, optional (default: on)
+    options: on, off
+    def: draws the figures of every model, each in its own task
+plots_from: str, optional (default: null)
+    options: any path
+    def: work_dir of a previous run, e.g. with 'plots: off'; only the
+         figures of its saved outputs are drawn, and no data are loaded
 """
 
 import logging
+import os
+import threading
+import time
 from pathlib import Path
 
+import areas as ar
+import checkpoint as ckpt
+import ensemble as ens
+import incremental as inc
+import instrumentation as inst
 import iris
 import iris.coord_categorisation
 import iris.cube
 import numpy as np
-import sklearn.linear_model
+import plotting
+import regression_engine as reg
 import sub_functions as sf
-from plotting import plot_cp_timeseries, plot_patterns, plot_scores
+import yaml
+from cache import AnomalyCache
 from rename_variables import (
     rename_anom_variables,
     rename_clim_variables,
     rename_regression_variables,
     rename_variables_base,
 )
+from scheduler import Scheduler
 
 from esmvaltool.diag_scripts.shared import ProvenanceLogger, run_diagnostic
 
 logger = logging.getLogger(Path(__file__).stem)
 
+# matplotlib's font rendering is not thread-safe, so only one thread of a
+# process draws figures at a time
+PLOT_LOCK = threading.Lock()
+
+# HDF5 is not thread-safe, so only one thread of a process writes at a time
+WRITE_LOCK = threading.Lock()
+
+CLIMATOLOGY_WINDOW = (1850, 1889)
+
 
 def climatology(cube, syr=1850, eyr=1889):
     """Handle aggregation to make climatology.
@@ -151,7 +303,7 @@ def diurnal_temp_range(cubelist):
     range_cube = cubelist[0] - cubelist[1]
 
     # check in case cubes are wrong way around
-    if np.mean(range_cube.data) < 0:
+    if range_cube.core_data().mean() < 0:
         range_cube = -range_cube
 
     range_cube.rename("Diurnal Range")
@@ -177,18 +329,13 @@ def calculate_diurnal_range(clim_list, ts_list):
     ts_list_final : cubelist
         cubelist of standard timeseries cubes including diurnal range
     """
-    temp_range_list_clim = iris.cube.CubeList([])
-    temp_range_list_ts = iris.cube.CubeList([])
-    comb_list = [clim_list, ts_list]
-
-    for cube_list in comb_list:
-        for cube in cube_list:
-            if (cube.var_name in ("tasmax", "tasmin")) and cube in clim_list:
-                temp_range_list_clim.append(cube)
-            elif (cube.var_name in ("tasmax", "tasmin")) and cube in ts_list:
-                temp_range_list_ts.append(cube)
-            else:
-                pass
+    # selecting by list rather than cube equality, which compares data
+    temp_range_list_clim = iris.cube.CubeList(
+        [cube for cube in clim_list if cube.var_name in ("tasmax", "tasmin")]
+    )
+    temp_range_list_ts = iris.cube.CubeList(
+        [cube for cube in ts_list if cube.var_name in ("tasmax", "tasmin")]
+    )
 
     derived_diurnal_clim = diurnal_temp_range(temp_range_list_clim)
     derived_diurnal_ts = diurnal_temp_range(temp_range_list_ts)
@@ -244,6 +391,67 @@ def append_diurnal_range(derived_diurnal_clim,
     return clim_list_final, ts_list_final
 
 
+def subtract_climatology(cube, clim_cube):
+    """Subtract the monthly climatology from a timeseries cube, in place.
+
+    Lazy cubes stay lazy: the climatology is subtracted chunk by chunk.
+
+    Parameters
+    ----------
+    cube : cube
+        timeseries cube with a month_number coord
+    clim_cube : cube
+        monthly climatology cube
+
+    Returns
+    -------
+    cube : cube
+        cube of anomalies
+    """
+    # -1 because months are numbered 1..12
+    i_months = cube.coord("month_number").points - 1
+
+    if not cube.has_lazy_data():
+        cube.data -= clim_cube[i_months].data
+        return cube
+
+    cube.data = cube.lazy_data().map_blocks(
+        subtract_block,
+        clim_data=clim_cube.data,
+        i_months=i_months,
+        dtype=cube.dtype,
+    )
+
+    return cube
+
+
+def subtract_block(block, clim_data, i_months, block_info=None):
+    """Subtract the climatology from one chunk of a lazy timeseries.
+
+    Parameters
+    ----------
+    block : arr
+        chunk of the timeseries
+    clim_data : arr
+        monthly climatology array
+    i_months : arr
+        month index (0..11) of every timestep of the whole timeseries
+    block_info : dict
+        chunk location, passed by dask
+
+    Returns
+    -------
+    block : arr
+        chunk of anomalies
+    """
+    location = block_info[0]["array-location"]
+    index = (i_months[slice(*location[0])],) + tuple(
+        slice(*loc) for loc in location[1:]
+    )
+
+    return block - clim_data[index]
+
+
 def calculate_anomaly(clim_list, ts_list):
     """Calculate variables as anomalies, and adds diurnal range as variable.
 
@@ -272,66 +480,34 @@ def calculate_anomaly(clim_list, ts_list):
     # calc the anom by subtracting the monthly climatology from
     # the time series
     for i, _ in enumerate(ts_list_final):
-        i_months = (
-            anom_list_final[i].coord("month_number").points - 1
-        )  # -1 because months are numbered 1..12
-        anom_list_final[i].data -= clim_list_final[i][i_months].data
+        subtract_climatology(anom_list_final[i], clim_list_final[i])
 
     return clim_list_final, anom_list_final
 
 
-def regression(tas, cube_data, ocean_frac, land_frac, area="global"):
-    """Calculate coeffs of regression between global surf temp and variable.
+def global_predictor(tas, ocean_frac, land_frac, area="global"):
+    """Calculate the area-averaged temperature used as regression predictor.
 
     Parameters
     ----------
     tas : cube
         near-surface air temperature
-    cube_data : arr
-        cube.data array of a variable
     ocean_frac: cube
         gridded ocean fraction
     land_frac: cube
         gridded land fraction
     area: str
-        area over which to calculate patterns
+        area over which to calculate patterns, see ``areas.parse_areas``
 
     Returns
     -------
-    slope_array : arr
-        array of grid cells with same shape as initial cube,
-        containing the regression slope
-    score_array : arr
-        array of grid cells with same shape as initial cube,
-        containing the regression score as a measure of robustness
+    tas_data : arr
+        array of area-averaged temperature, one value per timestep
     """
-    slope_array = np.full(tas.data.shape[1:], np.nan)
-    score_array = np.full(tas.data.shape[1:], np.nan)
-
-    if area == "land":
-        # calculate average warming over land
-        tas_data = sf.area_avg_landsea(
-            tas, ocean_frac, land_frac, land=True, return_cube=False
-        )
-    else:
-        # calculate global average warming
-        tas_data = sf.area_avg(tas, return_cube=False)
-
-    for i in range(tas.data.shape[1]):
-        for j in range(tas.data.shape[2]):
-            if tas.data[0, i, j] is not np.ma.masked:
-                model = sklearn.linear_model.LinearRegression(
-                    fit_intercept=False, copy_X=True
-                )
-
-                x_val = tas_data.reshape(-1, 1)
-                y_val = cube_data[:, i, j]
+    areas = ar.parse_areas(area)
+    tas_data = ar.area_means(tas, areas, ocean_frac, land_frac)
 
-                model.fit(x_val, y_val)
-                slope_array[i, j] = model.coef_
-                score_array[i, j] = model.score(x_val, y_val)
-
-    return slope_array, score_array
+    return tas_data[ar.area_name(area)]
 
 
 def regression_units(tas, cube):
@@ -354,15 +530,31 @@ def regression_units(tas, cube):
     return units
 
 
-def calculate_regressions(anom_list, ocean_frac, land_frac, area, yrs=85):
-    """Facilitate the calculation of regression coeffs (climate patterns).
+def month_indices(month_points):
+    """Calculate the indices that sort monthly timesteps by month, then year.
 
-    Also creates of a new cube of patterns per variable.
+    Parameters
+    ----------
+    month_points : arr
+        month number (1..12) of every timestep, complete years only
+
+    Returns
+    -------
+    indices : arr
+        (month, year) array of time indices
+    """
+    indices = np.argsort(month_points, kind="stable").reshape(12, -1)
+
+    return indices
+
+
+def regression_predictor(tas, ocean_frac, land_frac, area, yrs=85):
+    """Calculate the predictor shared by the regressions of all variables.
 
     Parameters
     ----------
-    anom_list : cubelist
-        cube list of variables as anomalies
+    tas : cube
+        near-surface air temperature anomaly
     ocean_frac: cube
         gridded ocean fraction
     land_frac: cube
@@ -374,362 +566,2905 @@ def calculate_regressions(anom_list, ocean_frac, land_frac, area, yrs=85):
 
     Returns
     -------
-    regr_var_list : cubelist
-        cube list of newly created regression slope value cubes, for each var
-    score_list : cubelist
-        cube list of newly created regression score cubes, for each var
+    predictor : dict
+        area-averaged temperature of every timestep ("tas_data"), month
+        number of every timestep ("months") and the first field of every
+        month ("tas"), which sets the grid, units and mask of patterns
     """
-    regr_var_list = iris.cube.CubeList([])
-    score_list = iris.cube.CubeList([])
-    months = yrs * 12
-
-    for cube in anom_list:
-        if cube.var_name == "tl1_anom":
-            # convert years to months when selecting
-            tas = cube[-months:]
-
-    for cube in anom_list:
-        cube_ssp = cube[-months:]
-        month_list = iris.cube.CubeList([])
-        score_month_list = iris.cube.CubeList([])
-
-        # extracting months, regressing, and merging
-        for i in range(1, 13):
-            month_constraint = iris.Constraint(imogen_drive=i)
-            month_cube_ssp = cube_ssp.extract(month_constraint)
-            month_tas = tas.extract(month_constraint)
+    # convert years to months when selecting
+    tas_data = global_predictor(
+        tas[-yrs * 12:], ocean_frac, land_frac, area=area
+    )
 
-            regr_array, score_array = regression(
-                month_tas,
-                month_cube_ssp.data,
-                ocean_frac,
-                land_frac,
-                area=area
-            )
+    return make_predictor(tas, tas_data, yrs=yrs)
 
-            # re-creating cube
-            if cube.var_name in ("swdown_anom", "lwdown_anom"):
-                units = "W m-2 K-1"
-            else:
-                units = regression_units(tas, cube_ssp)
-
-            # assigning dim_coords
-            coord1 = tas.coord(contains_dimension=1)
-            coord2 = tas.coord(contains_dimension=2)
-            dim_coords_and_dims = [(coord1, 0), (coord2, 1)]
-
-            # assigning aux_coord
-            coord_month = iris.coords.AuxCoord(i, var_name="imogen_drive")
-            aux_coords_and_dims = [(coord_month, ())]
-
-            cube = rename_regression_variables(cube)
-
-            # creating cube of regression values
-            regr_cube = iris.cube.Cube(
-                regr_array,
-                units=units,
-                dim_coords_and_dims=dim_coords_and_dims,
-                aux_coords_and_dims=aux_coords_and_dims,
-                var_name=cube.var_name,
-                standard_name=cube.standard_name,
-            )
 
-            # calculating cube of r2 scores
-            score_cube = iris.cube.Cube(
-                score_array,
-                units="R2",
-                dim_coords_and_dims=dim_coords_and_dims,
-                aux_coords_and_dims=aux_coords_and_dims,
-                var_name=cube.var_name,
-                standard_name=cube.standard_name,
-            )
+def make_predictor(tas, tas_data, yrs=85):
+    """Make the regression predictor from area-averaged temperature.
 
-            month_list.append(regr_cube)
-            score_month_list.append(score_cube)
+    Parameters
+    ----------
+    tas : cube
+        near-surface air temperature anomaly
+    tas_data : arr
+        area-averaged temperature of, at least, the last yrs years
+    yrs : int
+        int to specify length of scenario
 
-        conc_cube = month_list.merge_cube()
-        regr_var_list.append(conc_cube)
+    Returns
+    -------
+    predictor : dict
+        regression predictor, as returned by ``regression_predictor``
+    """
+    tas = tas[-yrs * 12:]
+    months = tas.coord("imogen_drive").points
+    month_tas = tas[month_indices(months)[:, 0]]
+
+    predictor = {
+        "tas_data": tas_data[-yrs * 12:],
+        "months": months,
+        "tas": month_tas.copy(data=month_tas.data),
+    }
 
-        conc_score_cube = score_month_list.merge_cube()
-        score_list.append(conc_score_cube)
+    return predictor
 
-    return regr_var_list, score_list
 
+def regress_variable(cube, predictor, yrs=85, lazy=False, estimator="ols",
+                     running_mean=1, tiled=False, bootstrap=None):
+    """Calculate the regression coeffs (climate patterns) of one variable.
 
-def write_scores(scores, work_path):
-    """Save the global average regression scores per variable in a text file.
+    Bootstrapped uncertainties are estimated from the same array of
+    every month, or tile, as the patterns.
 
     Parameters
     ----------
-    scores : cubelist
-        cube list of regression score cubes, for each variable
-    work_path : path
-        path to work_dir, to save scores
+    cube : cube
+        cube of a variable as anomalies
+    predictor : dict
+        regression predictor, as returned by ``regression_predictor``
+    yrs : int
+        int to specify length of scenario
+    lazy : bool
+        accumulate the regression chunk by chunk, for lazy anomalies,
+        by no-intercept least squares only
+    estimator : str
+        regression estimator, one of ``regression_engine.ESTIMATORS``
+    running_mean : int
+        number of years of the running means regressed, per month
+    tiled : bool
+        fit lazy anomalies tile by tile, with any estimator
+    bootstrap : dict
+        resamples, block_length and percentiles of the bootstrapped
+        uncertainties, as returned by ``regression_method``; None for no
+        bootstrap
 
     Returns
     -------
-    None
+    regr_cube : cube
+        cube of regression slope values, per month
+    score_cube : cube
+        cube of regression scores, per month
+    uncertainty_cubes : cubelist
+        cubes of the bootstrapped standard error and percentiles of the
+        slopes, only if bootstrapped
     """
-    for cube in scores:
-        score = sf.area_avg(cube, return_cube=False)
-        mean_score = np.mean(score)
-        data = f"{mean_score:10.3f}"
-        name = cube.var_name
-        # saving scores
-        with open(work_path + "scores", "a", encoding='utf-8') as file:
-            file.write(name + ": " + data + "\n")
-            file.close()
+    cube_ssp = cube[-yrs * 12:]
+    cell_mask = np.ma.getmaskarray(predictor["tas"].data)
+    if bootstrap:
+        function = reg.fit_and_bootstrap
+        n_outputs = 3 + len(bootstrap["percentiles"])
+    else:
+        function = reg.fit
+        n_outputs = 2
+    kwargs = dict(
+        bootstrap or {}, estimator=estimator, running_mean=running_mean
+    )
+
+    if tiled:
+        fits = reg.tiled_apply(
+            function,
+            n_outputs,
+            predictor["tas_data"],
+            cube_ssp.lazy_data(),
+            predictor["months"] - 1,
+            12,
+            cell_mask=cell_mask,
+            **kwargs,
+        ).compute()
+    elif lazy:
+        stats = variable_statistics(cube, predictor, yrs=yrs)
+        fits = np.stack(
+            reg.ols_from_statistics(
+                np.moveaxis(stats, 1, 0), cell_mask=cell_mask
+            ),
+            axis=1,
+        )
+    else:
+        fits = np.full((12, n_outputs) + cell_mask.shape[1:], np.nan)
 
+        # extracting months and regressing
+        for i in range(1, 13):
+            month_cube_ssp = cube_ssp.extract(iris.Constraint(imogen_drive=i))
+            in_month = predictor["months"] == i
 
-def cube_saver(list_of_cubelists, work_path, name_list, mode):
-    """Save desired cubelists to work_dir, depending on switch settings.
+            fits[i - 1] = function(
+                predictor["tas_data"][in_month],
+                month_cube_ssp.data,
+                cell_mask=cell_mask[i - 1],
+                **kwargs,
+            )
+
+    pattern_cubes = make_pattern_cube(
+        cube,
+        predictor["tas"],
+        fits[:, 0],
+        fits[:, 1],
+        estimator=estimator,
+        running_mean=running_mean,
+    )
+    if bootstrap:
+        pattern_cubes += (
+            uncertainty_cubes(
+                pattern_cubes[0], np.moveaxis(fits[:, 2:], 1, 0), bootstrap
+            ),
+        )
+
+    return pattern_cubes
+
+
+def variable_statistics(cube, predictor, yrs=85):
+    """Calculate the monthly regression statistics of one variable.
 
     Parameters
     ----------
-    list_of_cubelists : list
-        list containing desired cubelists
-    work_path : path
-        path to work_dir, to save cubelists
-    name_list : list
-        list of filename strings for saving
-    mode : str
-        switch option passed through by ESMValTool config dict
+    cube : cube
+        cube of a variable as anomalies
+    predictor : dict
+        regression predictor, as returned by ``regression_predictor``
+    yrs : int
+        int to specify length of scenario
 
     Returns
     -------
-    None
+    stats : arr
+        (month, statistic, lat, lon) array of sufficient statistics,
+        accumulated chunk by chunk along time
     """
-    if mode == "imogen_scores":
-        for i in range(0, 4):
-            iris.save(list_of_cubelists[i], work_path + name_list[i])
+    stats = reg.grouped_statistics(
+        predictor["tas_data"],
+        cube[-yrs * 12:].lazy_data(),
+        predictor["months"] - 1,
+        12,
+    ).compute()
 
-    if mode == "imogen":
-        for i in range(0, 3):
-            iris.save(list_of_cubelists[i], work_path + name_list[i])
+    return stats
 
-    if mode == "scores":
-        for i in range(2, 4):
-            for cube in list_of_cubelists[i]:
-                rename_variables_base(cube)
-            iris.save(list_of_cubelists[i], work_path + name_list[i])
-
-    if mode == "base":
-        for cube in list_of_cubelists[2]:
-            rename_variables_base(cube)
-        iris.save(list_of_cubelists[2], work_path + name_list[2])
 
+def regress_variables_single_pass(anom_list, predictor, yrs=85,
+                                  estimator="ols", running_mean=1,
+                                  bootstrap=None):
+    """Calculate regression coeffs for all months and variables at once.
 
-def save_outputs(
-    clim_list_final,
-    anom_list_final,
-    regressions,
-    scores,
-    imogen_mode,
-    r2_scores,
-    plot_path,
-    work_path,
-):
-    """Save data and plots to relevant directories.
+    Stacks the anomalies of all variables into one
+    (year, month, var, lat, lon) array and regresses it against the
+    (year, month) area-averaged temperature in a single vectorised step,
+    instead of extracting one cube per month and variable.
 
     Parameters
     ----------
-    clim_list_final : cubelist
-        cube list of all variable climatologies
-    anom_list_final : cubelist
-        cube list of all variable anomalies
-    regressions : cubelist
-        cube list of all variable regression slopes
-    scores : cubelist
-        cube list of all variable regression scores
-    imogen_mode : bool
-        imogen_mode on or off
-    r2_scores : bool
-        determinant output on or off
-    plot_path : str
-        path to plot_dir
-    work_path : str
-        path to work_dir
+    anom_list : cubelist
+        cube list of variables as anomalies
+    predictor : dict
+        regression predictor, as returned by ``regression_predictor``
+    yrs : int
+        int to specify length of scenario
+    estimator : str
+        regression estimator, one of ``regression_engine.ESTIMATORS``
+    running_mean : int
+        number of years of the running means regressed, per month
+    bootstrap : dict
+        resamples, block_length and percentiles of the bootstrapped
+        uncertainties, as returned by ``regression_method``; None for no
+        bootstrap
 
     Returns
     -------
-    None
+    pattern_cubes : list
+        list of (regression slope, regression score) cubes, for each var,
+        and the cubes of their uncertainties, if bootstrapped
     """
-    list_of_cubelists = [clim_list_final, anom_list_final, regressions, scores]
-    name_list = [
-        "climatology_variables.nc",
-        "anomaly_variables.nc",
-        "patterns.nc",
-        "scores.nc",
-    ]
+    indices = month_indices(predictor["months"])
 
-    # saving data + plotting
-    if imogen_mode is True:
-        if r2_scores is True:
-            plot_scores(list_of_cubelists[3], plot_path)
-            write_scores(scores, work_path)
-            plot_cp_timeseries(list_of_cubelists, plot_path)
-            cube_saver(
-                list_of_cubelists,
-                work_path,
-                name_list,
-                mode="imogen_scores"
-            )
+    # (year, month) predictor and (year, month, var, lat, lon) responses
+    tas_data = predictor["tas_data"][indices].T
+    cube_data = np.ma.stack(
+        [cube[-yrs * 12:].data[indices.T] for cube in anom_list], axis=2
+    )
+    cell_mask = np.ma.getmaskarray(predictor["tas"].data)[:, np.newaxis]
+
+    function = reg.fit_and_bootstrap if bootstrap else reg.fit
+    fits = function(
+        tas_data,
+        cube_data,
+        estimator=estimator,
+        cell_mask=cell_mask,
+        running_mean=running_mean,
+        **(bootstrap or {}),
+    )
 
-        else:
-            plot_cp_timeseries(list_of_cubelists, plot_path)
-            cube_saver(list_of_cubelists, work_path, name_list, mode="imogen")
+    pattern_cubes = []
+    for j, cube in enumerate(anom_list):
+        cubes = make_pattern_cube(
+            cube,
+            predictor["tas"],
+            fits[0][:, j],
+            fits[1][:, j],
+            estimator=estimator,
+            running_mean=running_mean,
+        )
+        if bootstrap:
+            cubes += (uncertainty_cubes(cubes[0], fits[2:, :, j], bootstrap),)
+        pattern_cubes.append(cubes)
 
-    else:
-        if r2_scores is True:
-            plot_scores(list_of_cubelists[3], plot_path)
-            write_scores(scores, work_path)
-            plot_patterns(list_of_cubelists[2], plot_path)
-            cube_saver(list_of_cubelists, work_path, name_list, mode="scores")
+    return pattern_cubes
 
-        else:
-            plot_patterns(list_of_cubelists[2], plot_path)
-            cube_saver(list_of_cubelists, work_path, name_list, mode="base")
 
+def make_pattern_cube(cube, tas, regr_array, score_array, estimator="ols",
+                      running_mean=1):
+    """Create pattern and score cubes of one variable from monthly arrays.
 
-def get_provenance_record():
-    """Create a provenance record describing the diagnostic data and plot.
+    The estimator and running mean of the regression are recorded in the
+    attributes of both cubes.
 
     Parameters
     ----------
-    None
+    cube : cube
+        cube of the variable as anomalies
+    tas : cube
+        near-surface air temperature anomaly, one field per month
+    regr_array : arr
+        (month, lat, lon) array of regression slopes
+    score_array : arr
+        (month, lat, lon) array of regression scores
+    estimator : str
+        regression estimator of the slopes
+    running_mean : int
+        number of years of the running means regressed
 
     Returns
     -------
-    record : dict
-        provenance record
+    regr_cube : cube
+        cube of regression slope values, per month
+    score_cube : cube
+        cube of regression scores, per month
     """
-    record = {
-        "caption": ["Generating Climate Patterns from CMIP6 Models"],
-        "statistics": ["mean", "other"],
-        "domains": ["global"],
-        "themes": ["carbon"],
-        "realms": ["atmos"],
-        "authors": ["munday_gregory"],
+    if cube.var_name in ("swdown_anom", "lwdown_anom"):
+        units = "W m-2 K-1"
+    else:
+        units = regression_units(tas, cube)
+
+    # renaming a data-less cube, so the anomaly cube keeps its names
+    names = rename_regression_variables(
+        iris.cube.Cube(
+            0, var_name=cube.var_name, standard_name=cube.standard_name
+        )
+    )
+
+    # assigning dim_coords
+    coord_month = iris.coords.DimCoord(
+        np.arange(1, 13), var_name="imogen_drive"
+    )
+    coord1 = tas.coord(contains_dimension=1)
+    coord2 = tas.coord(contains_dimension=2)
+    dim_coords_and_dims = [(coord_month, 0), (coord1, 1), (coord2, 2)]
+    attributes = {
+        "regression_estimator": estimator,
+        "regression_running_mean_years": running_mean,
     }
 
-    return record
+    # creating cube of regression values
+    regr_cube = iris.cube.Cube(
+        regr_array,
+        units=units,
+        dim_coords_and_dims=dim_coords_and_dims,
+        var_name=names.var_name,
+        standard_name=names.standard_name,
+        attributes=attributes,
+    )
 
+    # calculating cube of r2 scores
+    score_cube = iris.cube.Cube(
+        score_array,
+        units="R2",
+        dim_coords_and_dims=dim_coords_and_dims,
+        var_name=names.var_name,
+        standard_name=names.standard_name,
+        attributes=attributes,
+    )
+
+    return regr_cube, score_cube
 
-def patterns(model, cfg):
-    """Driving function for script, taking in model data and saving parameters.
+
+def uncertainty_names(percentiles):
+    """Name the bootstrapped uncertainties of the patterns, in order.
 
     Parameters
     ----------
-    model : str
-        model name
-    cfg: dict
-        Dictionary passed in by ESMValTool preprocessors
+    percentiles : list
+        percentiles of the bootstrapped slopes, e.g. [5, 95]
 
     Returns
     -------
-    None
+    names : list
+        stderr, then the percentiles (e.g. p5)
     """
-    input_data = cfg["input_data"].values()
-    grid_spec = cfg["grid"]
-    imogen_mode = cfg["imogen_mode"]
-    r2_scores = cfg["output_r2_scores"]
-    work_path = cfg["work_dir"] + "/"
-    plot_path = cfg["plot_dir"] + "/"
-    area = cfg["area"]
-
-    clim_list = iris.cube.CubeList([])
-    ts_list = iris.cube.CubeList([])
-
-    for dataset in input_data:
-        if dataset["dataset"] == model:
-            input_file = dataset["filename"]
-
-            # preparing single cube
-            cube_initial = sf.load_cube(input_file)
-
-            if grid_spec == "constrained":
-                cube = constrain_latitude(cube_initial)
-            else:
-                cube = cube_initial
-
-            if dataset["exp"] not in ["historical-ssp585", "ssp585"]:
-                sftlf = cube
-            elif dataset["exp"] == "ssp585":
-                # appending to timeseries list
-                ts_list.append(cube)
-                # use first year as baseline for anomaly
-                clim_cube = cube[0]
-                clim_list.append(clim_cube)
-            else:
-                # appending to timeseries list
-                ts_list.append(cube)
-
-                # making climatology
-                clim_cube = climatology(cube)
-                clim_list.append(clim_cube)
-
-    # calculate land/ocean_fracs
-    ocean_frac, land_frac = sf.ocean_fraction_calc(sftlf)
+    return ["stderr"] + [f"p{pct:g}" for pct in percentiles]
 
-    # calculate anomaly over historical + ssp timeseries
-    clim_list_final, anom_list_final = calculate_anomaly(clim_list, ts_list)
 
-    for i, cube in enumerate(clim_list_final):
-        rename_clim_variables(cube)
-        rename_anom_variables(anom_list_final[i])
+def uncertainty_cubes(regr_cube, uncertainty, bootstrap):
+    """Create the cubes of the bootstrapped uncertainties of the patterns.
 
-    regressions, scores = calculate_regressions(
-        anom_list_final.copy(), ocean_frac, land_frac, area
-    )
+    Parameters
+    ----------
+    regr_cube : cube
+        cube of regression slope values, per month, setting names,
+        coords and units
+    uncertainty : arr
+        (1 + percentile, month, lat, lon) array of the standard error and
+        percentiles of the slopes
+    bootstrap : dict
+        resamples, block_length and percentiles of the bootstrapped
+        uncertainties, as returned by ``regression_method``
 
-    model_work_dir, model_plot_dir = sf.make_model_dirs(
-        cube_initial, work_path, plot_path
-    )
+    Returns
+    -------
+    cubes : cubelist
+        cube of every uncertainty, named after the patterns and the
+        uncertainty, e.g. tl1_patt_p5
+    """
+    cubes = iris.cube.CubeList([])
+    for name, data in zip(
+        uncertainty_names(bootstrap["percentiles"]), uncertainty
+    ):
+        cube = regr_cube.copy(data=data)
+        cube.var_name = f"{regr_cube.var_name}_{name}"
+        cube.long_name = f"{regr_cube.name()}, bootstrap {name}"
+        cube.attributes.update(
+            {
+                "bootstrap_statistic": name,
+                "bootstrap_resamples": bootstrap["resamples"],
+                "bootstrap_block_years": bootstrap["block_length"],
+            }
+        )
+        cubes.append(cube)
 
-    save_outputs(
-        clim_list_final,
-        anom_list_final,
-        regressions,
-        scores,
-        imogen_mode,
-        r2_scores,
-        model_plot_dir,
-        model_work_dir,
-    )
+    return cubes
 
-    provenance_record = get_provenance_record()
-    path = model_work_dir + "patterns.nc"
-    with ProvenanceLogger(cfg) as provenance_logger:
-        provenance_logger.log(path, provenance_record)
 
+def calculate_regressions(
+    anom_list, ocean_frac, land_frac, area, yrs=85, lazy=False,
+    estimator="ols", running_mean=1, bootstrap=None,
+):
+    """Facilitate the calculation of regression coeffs (climate patterns).
 
-def main(cfg):
-    """Take in driving data with parallelisation options.
+    Also creates of a new cube of patterns per variable.
 
     Parameters
     ----------
-    cfg : dict
-        the global config dictionary, passed by ESMValTool.
+    anom_list : cubelist
+        cube list of variables as anomalies
+    ocean_frac: cube
+        gridded ocean fraction
+    land_frac: cube
+        gridded land fraction
+    area: str
+        area over which to calculate patterns
+    yrs : int
+        int to specify length of scenario
+    lazy : bool
+        accumulate the regressions chunk by chunk, for lazy anomalies
+    estimator : str
+        regression estimator, one of ``regression_engine.ESTIMATORS``
+    running_mean : int
+        number of years of the running means regressed, per month
+    bootstrap : dict
+        resamples, block_length and percentiles of the bootstrapped
+        uncertainties, as returned by ``regression_method``; None for no
+        bootstrap
 
     Returns
     -------
-    None
+    regr_var_list : cubelist
+        cube list of newly created regression slope value cubes, for each var
+    score_list : cubelist
+        cube list of newly created regression score cubes, for each var
+    uncertainty_list : cubelist
+        cube list of the bootstrapped uncertainties of all vars, empty
+        without a bootstrap
     """
-    input_data = cfg["input_data"].values()
-    parallelise = cfg["parallelise"]
-    threads = cfg["parallel_threads"]
+    regr_var_list = iris.cube.CubeList([])
+    score_list = iris.cube.CubeList([])
+    uncertainty_list = iris.cube.CubeList([])
 
-    models = []
-    for mod in input_data:
-        model = mod["dataset"]
-        if model not in models:
-            models.append(model)
+    for cube in anom_list:
+        if cube.var_name == "tl1_anom":
+            tas = cube
 
-    if parallelise is True:
-        sf.parallelise(patterns, threads)(models, cfg)
-    else:
-        for model in models:
-            patterns(model, cfg)
+    predictor = regression_predictor(
+        tas, ocean_frac, land_frac, area, yrs=yrs
+    )
+
+    for cube in anom_list:
+        pattern_cubes = regress_variable(
+            cube,
+            predictor,
+            yrs=yrs,
+            lazy=lazy,
+            estimator=estimator,
+            running_mean=running_mean,
+            bootstrap=bootstrap,
+        )
+        regr_var_list.append(pattern_cubes[0])
+        score_list.append(pattern_cubes[1])
+        if bootstrap:
+            uncertainty_list.extend(pattern_cubes[2])
+
+    return regr_var_list, score_list, uncertainty_list
+
+
+def calculate_regressions_single_pass(
+    anom_list, ocean_frac, land_frac, area, yrs=85, estimator="ols",
+    running_mean=1, bootstrap=None,
+):
+    """Calculate regression coeffs for all months and variables at once.
+
+    Parameters
+    ----------
+    anom_list : cubelist
+        cube list of variables as anomalies
+    ocean_frac: cube
+        gridded ocean fraction
+    land_frac: cube
+        gridded land fraction
+    area: str
+        area over which to calculate patterns
+    yrs : int
+        int to specify length of scenario
+    estimator : str
+        regression estimator, one of ``regression_engine.ESTIMATORS``
+    running_mean : int
+        number of years of the running means regressed, per month
+    bootstrap : dict
+        resamples, block_length and percentiles of the bootstrapped
+        uncertainties, as returned by ``regression_method``; None for no
+        bootstrap
+
+    Returns
+    -------
+    regr_var_list : cubelist
+        cube list of newly created regression slope value cubes, for each var
+    score_list : cubelist
+        cube list of newly created regression score cubes, for each var
+    uncertainty_list : cubelist
+        cube list of the bootstrapped uncertainties of all vars, empty
+        without a bootstrap
+    """
+    for cube in anom_list:
+        if cube.var_name == "tl1_anom":
+            tas = cube
+
+    predictor = regression_predictor(
+        tas, ocean_frac, land_frac, area, yrs=yrs
+    )
+    pattern_cubes = regress_variables_single_pass(
+        anom_list,
+        predictor,
+        yrs=yrs,
+        estimator=estimator,
+        running_mean=running_mean,
+        bootstrap=bootstrap,
+    )
+
+    regr_var_list = iris.cube.CubeList([cubes[0] for cubes in pattern_cubes])
+    score_list = iris.cube.CubeList([cubes[1] for cubes in pattern_cubes])
+    uncertainty_list = iris.cube.CubeList([])
+    if bootstrap:
+        uncertainty_list.extend(
+            cube for cubes in pattern_cubes for cube in cubes[2]
+        )
+
+    return regr_var_list, score_list, uncertainty_list
+
+
+def write_scores(scores, work_path, means=None):
+    """Save the global average regression scores per variable in a text file.
+
+    Parameters
+    ----------
+    scores : cubelist
+        cube list of regression score cubes, for each variable
+    work_path : path
+        path to work_dir, to save scores
+    means : dict
+        global mean scores by var_name, e.g. shared with the plots;
+        calculated if None
+
+    Returns
+    -------
+    None
+    """
+    if means is None:
+        means = sf.global_means(scores)
+    # written at once, so a rerun in the same directory replaces the file
+    with open(work_path + "scores", "w", encoding='utf-8') as file:
+        for cube in scores:
+            mean_score = np.mean(means[cube.var_name])
+            file.write(f"{cube.var_name}: {mean_score:10.3f}\n")
+
+
+OUTPUT_FILES = [
+    "climatology_variables.nc",
+    "anomaly_variables.nc",
+    "patterns.nc",
+    "scores.nc",
+]
+
+# bootstrapped uncertainties of the patterns, saved alongside the scores
+UNCERTAINTY_FILE = "uncertainty.nc"
+
+# indices of the cubelists saved, in the list of cubelists, per mode
+SAVED_CUBELISTS = {
+    "imogen_scores": [0, 1, 2, 3],
+    "imogen": [0, 1, 2],
+    "scores": [2, 3],
+    "base": [2],
+}
+
+# fill value of int16 packed outputs, outside the range of packed data
+INT16_FILL_VALUE = -32768
+
+
+def output_mode(imogen_mode, r2_scores):
+    """Find the cube saving mode from the output switches.
+
+    Parameters
+    ----------
+    imogen_mode : bool
+        imogen_mode on or off
+    r2_scores : bool
+        determinant output on or off
+
+    Returns
+    -------
+    mode : str
+        options: imogen_scores, imogen, scores, base
+    """
+    if imogen_mode is True:
+        if r2_scores is True:
+            return "imogen_scores"
+        return "imogen"
+    if r2_scores is True:
+        return "scores"
+    return "base"
+
+
+def int16_packing(data):
+    """Find the packing of data into int16, keeping a fill value free.
+
+    Packed values span -32767 to 32767, so the fill value -32768 never
+    matches data. The packing iris calculates itself puts the minimum of
+    masked data on -32767, the default int16 fill value, which reads
+    back as missing.
+
+    Parameters
+    ----------
+    data : arr
+        (masked) data to pack
+
+    Returns
+    -------
+    packing : dict
+        dtype, scale_factor and add_offset, as passed to ``iris.save``
+    """
+    d_min, d_max = np.ma.min(data), np.ma.max(data)
+    if np.ma.is_masked(d_min):
+        # no valid data, only fill values are written
+        d_min = d_max = 0.0
+    scale_factor = float(d_max - d_min) / (2**16 - 2) or 1.0
+
+    return {
+        "dtype": "i2",
+        "scale_factor": scale_factor,
+        "add_offset": float(d_max + d_min) / 2,
+    }
+
+
+def encode_cubes(cubes, output_options=None):
+    """Prepare cubes and NetCDF encoding keywords for saving.
+
+    Data with a time-like first dimension are chunked one field at a
+    time, matching how IMOGEN reads them month by month.
+
+    Parameters
+    ----------
+    cubes : cubelist
+        cubes to save
+    output_options : dict
+        compression (none, zlib), complevel, and dtype (null, float32,
+        int16) of the output files
+
+    Returns
+    -------
+    cubes : cubelist
+        cubes, converted to float32 if chosen
+    kwargs : dict
+        keyword arguments of ``iris.save``
+    """
+    output_options = output_options or {}
+    kwargs = {}
+
+    if output_options.get("compression", "none") == "zlib":
+        kwargs["zlib"] = True
+        kwargs["complevel"] = output_options.get("complevel", 4)
+        shapes = {cube.shape for cube in cubes}
+        if len(shapes) == 1 and cubes[0].ndim == 3:
+            kwargs["chunksizes"] = (1,) + cubes[0].shape[1:]
+
+    dtype = output_options.get("dtype")
+    if dtype == "float32":
+        cubes = iris.cube.CubeList(
+            [
+                cube.copy(data=cube.core_data().astype(np.float32))
+                for cube in cubes
+            ]
+        )
+    elif dtype == "int16":
+        # packed with scale_factor and add_offset, NaNs become fill values
+        cubes = iris.cube.CubeList(
+            [
+                cube.copy(data=np.ma.masked_invalid(cube.data))
+                for cube in cubes
+            ]
+        )
+        kwargs["packing"] = [int16_packing(cube.data) for cube in cubes]
+        kwargs["fill_value"] = INT16_FILL_VALUE
+
+    return cubes, kwargs
+
+
+def save_cubelist(cubes, path, rename=False, output_options=None):
+    """Save a cubelist to a NetCDF file.
+
+    Parameters
+    ----------
+    cubes : cubelist
+        cubes to save
+    path : str
+        path to the file
+    rename : bool
+        rename variables to their base names, in copies of the cubes
+    output_options : dict
+        encoding of the output files, see ``encode_cubes``
+
+    Returns
+    -------
+    None
+    """
+    if rename:
+        # renaming copies, so the cubes can still be plotted
+        cubes = iris.cube.CubeList(
+            [cube.copy(data=cube.core_data()) for cube in cubes]
+        )
+        for cube in cubes:
+            rename_variables_base(cube)
+    cubes, kwargs = encode_cubes(cubes, output_options)
+    iris.save(cubes, path, **kwargs)
+
+
+def cube_saver(list_of_cubelists, work_path, name_list, mode,
+               output_options=None):
+    """Save desired cubelists to work_dir, depending on switch settings.
+
+    Parameters
+    ----------
+    list_of_cubelists : list
+        list containing desired cubelists
+    work_path : path
+        path to work_dir, to save cubelists
+    name_list : list
+        list of filename strings for saving
+    mode : str
+        switch option passed through by ESMValTool config dict
+    output_options : dict
+        encoding of the output files, see ``encode_cubes``
+
+    Returns
+    -------
+    None
+    """
+    for i in SAVED_CUBELISTS[mode]:
+        save_cubelist(
+            list_of_cubelists[i],
+            work_path + name_list[i],
+            rename=mode in ("scores", "base"),
+            output_options=output_options,
+        )
+
+
+def save_outputs(
+    clim_list_final,
+    anom_list_final,
+    regressions,
+    scores,
+    imogen_mode,
+    r2_scores,
+    plot_path,
+    work_path,
+    output_options=None,
+    save_cubes=True,
+):
+    """Save data and plots to relevant directories.
+
+    Parameters
+    ----------
+    clim_list_final : cubelist
+        cube list of all variable climatologies
+    anom_list_final : cubelist
+        cube list of all variable anomalies
+    regressions : cubelist
+        cube list of all variable regression slopes
+    scores : cubelist
+        cube list of all variable regression scores
+    imogen_mode : bool
+        imogen_mode on or off
+    r2_scores : bool
+        determinant output on or off
+    plot_path : str
+        path to plot_dir
+    work_path : str
+        path to work_dir
+    output_options : dict
+        encoding of the output files, see ``encode_cubes``
+    save_cubes : bool
+        save the cubelists, or only plots and scores if they are saved
+        separately
+
+    Returns
+    -------
+    None
+    """
+    list_of_cubelists = [clim_list_final, anom_list_final, regressions, scores]
+
+    # saving data + plotting
+    if r2_scores is True:
+        plotting.plot_scores(list_of_cubelists[3], plot_path)
+        write_scores(scores, work_path)
+
+    if imogen_mode is True:
+        plotting.plot_cp_timeseries(list_of_cubelists, plot_path)
+    else:
+        plotting.plot_patterns(list_of_cubelists[2], plot_path)
+
+    if save_cubes:
+        mode = output_mode(imogen_mode, r2_scores)
+        cube_saver(
+            list_of_cubelists, work_path, OUTPUT_FILES, mode, output_options
+        )
+
+
+def get_provenance_record():
+    """Create a provenance record describing the diagnostic data and plot.
+
+    Parameters
+    ----------
+    None
+
+    Returns
+    -------
+    record : dict
+        provenance record
+    """
+    record = {
+        "caption": ["Generating Climate Patterns from CMIP6 Models"],
+        "statistics": ["mean", "other"],
+        "domains": ["global"],
+        "themes": ["carbon"],
+        "realms": ["atmos"],
+        "authors": ["munday_gregory"],
+    }
+
+    return record
+
+
+def load_dataset_cube(dataset, grid_spec, lazy=False, chunk_budget=256,
+                      tiled=False):
+    """Load the cube of a dataset, constrained to the chosen grid.
+
+    Daily datasets are streamed year by year into monthly means.
+
+    Parameters
+    ----------
+    dataset : dict
+        metadata of the dataset, from the config dictionary
+    grid_spec : str
+        grid option, constrained or full
+    lazy : bool
+        keep the data lazy, chunked along time
+    chunk_budget : int
+        maximum size of a single chunk, in MB
+    tiled : bool
+        chunk lazy data into spatial tiles of whole timeseries instead
+
+    Returns
+    -------
+    cube : cube
+        cube of the dataset
+    """
+    if is_daily(dataset):
+        cube_initial = sf.load_monthly_means(dataset["filename"])
+    else:
+        cube_initial = sf.load_cube(dataset["filename"])
+    if lazy and cube_initial.ndim == 3:
+        cube_initial = rechunk(cube_initial, chunk_budget, tiled)
+
+    if grid_spec == "constrained":
+        cube = constrain_latitude(cube_initial)
+    else:
+        cube = cube_initial
+
+    return cube
+
+
+def is_daily(dataset):
+    """Check whether a dataset holds daily data, to average by month.
+
+    Parameters
+    ----------
+    dataset : dict
+        metadata of the dataset, from the config dictionary
+
+    Returns
+    -------
+    daily : bool
+        True for daily data, e.g. of the day mip
+    """
+    return dataset.get("frequency") == "day"
+
+
+def rechunk(cube, chunk_budget=256, tiled=False):
+    """Chunk lazy cube data along time, or into spatial tiles.
+
+    Parameters
+    ----------
+    cube : cube
+        (time, lat, lon) cube
+    chunk_budget : int
+        maximum size of a single chunk, in MB
+    tiled : bool
+        chunk into spatial tiles of whole timeseries, rather than along
+        time
+
+    Returns
+    -------
+    cube : cube
+        cube with lazy data
+    """
+    if tiled:
+        return sf.rechunk_tiles(cube, chunk_budget)
+
+    return sf.rechunk_time(cube, chunk_budget)
+
+
+def load_land_fraction(dataset, grid_spec):
+    """Load the land fraction of a model and derive its land/ocean_fracs.
+
+    Parameters
+    ----------
+    dataset : dict
+        metadata of the sftlf dataset, from the config dictionary
+    grid_spec : str
+        grid option, constrained or full
+
+    Returns
+    -------
+    ocean_frac: cube
+        gridded ocean fraction
+    land_frac: cube
+        gridded land fraction
+    """
+    sftlf = load_dataset_cube(dataset, grid_spec)
+
+    return sf.ocean_fraction_calc(sftlf)
+
+
+def scenario_name(exp):
+    """Find the scenario of an experiment, e.g. ssp585 for historical-ssp585.
+
+    Parameters
+    ----------
+    exp : str
+        experiment, as in the config dictionary
+
+    Returns
+    -------
+    scenario : str
+        scenario name
+    """
+    return exp.removeprefix("historical-")
+
+
+def has_historical(dataset):
+    """Check whether the timeseries of a dataset starts with historical.
+
+    Parameters
+    ----------
+    dataset : dict
+        metadata of the dataset, from the config dictionary
+
+    Returns
+    -------
+    historical : bool
+        True if the climatology can be made from the dataset
+    """
+    return dataset["exp"].startswith("historical")
+
+
+def load_climatology(dataset, grid_spec):
+    """Load the historical part of a variable and make its climatology.
+
+    Parameters
+    ----------
+    dataset : dict
+        metadata of a dataset containing the historical period
+    grid_spec : str
+        grid option, constrained or full
+
+    Returns
+    -------
+    clim_cube : cube
+        climatology cube
+    """
+    cube = load_dataset_cube(dataset, grid_spec)
+    clim_cube = climatology(cube, *CLIMATOLOGY_WINDOW)
+    # twelve fields, realised once rather than read again by every task
+    # using them
+    clim_cube.data = clim_cube.data
+
+    return clim_cube
+
+
+def load_variable(dataset, grid_spec, lazy=False, chunk_budget=256,
+                  tiled=False, clim_cube=None):
+    """Load the timeseries of a variable and make its climatology.
+
+    Parameters
+    ----------
+    dataset : dict
+        metadata of the dataset, from the config dictionary
+    grid_spec : str
+        grid option, constrained or full
+    lazy : bool
+        keep the data lazy, chunked along time
+    chunk_budget : int
+        maximum size of a single chunk, in MB
+    tiled : bool
+        chunk lazy data into spatial tiles of whole timeseries instead
+    clim_cube : cube
+        optional climatology shared between scenarios, made otherwise
+
+    Returns
+    -------
+    clim_cube : cube
+        climatology cube
+    cube : cube
+        timeseries cube
+    """
+    cube = load_dataset_cube(dataset, grid_spec, lazy, chunk_budget, tiled)
+    if not lazy:
+        # realising once, rather than reading the file again for every
+        # month regressed
+        cube.data = cube.data
+
+    if clim_cube is not None:
+        # copying, as the climatology is renamed in place
+        clim_cube = clim_cube.copy()
+    elif not has_historical(dataset):
+        # use first year as baseline for anomaly
+        clim_cube = cube[0]
+    else:
+        # making climatology
+        clim_cube = climatology(cube, *CLIMATOLOGY_WINDOW)
+
+    return clim_cube, cube
+
+
+def variable_anomaly(variable):
+    """Calculate the anomaly of a variable, and rename it for JULES.
+
+    Parameters
+    ----------
+    variable : tuple
+        climatology and timeseries cube of the variable
+
+    Returns
+    -------
+    clim_cube : cube
+        renamed climatology cube
+    anom_cube : cube
+        renamed anomaly cube
+    """
+    clim_cube, anom_cube = variable
+    subtract_climatology(anom_cube, clim_cube)
+
+    rename_clim_variables(clim_cube)
+    rename_anom_variables(anom_cube)
+
+    return clim_cube, anom_cube
+
+
+def diurnal_range_anomaly(first_variable, second_variable):
+    """Calculate the diurnal range anomaly from tasmax and tasmin.
+
+    Parameters
+    ----------
+    first_variable : tuple
+        climatology and timeseries cube of tasmax or tasmin
+    second_variable : tuple
+        climatology and timeseries cube of the other one
+
+    Returns
+    -------
+    clim_cube : cube
+        renamed diurnal range climatology cube
+    anom_cube : cube
+        renamed diurnal range anomaly cube
+    """
+    clim_cube = diurnal_temp_range(
+        iris.cube.CubeList([first_variable[0], second_variable[0]])
+    )
+    ts_cube = diurnal_temp_range(
+        iris.cube.CubeList([first_variable[1], second_variable[1]])
+    )
+
+    return variable_anomaly((clim_cube, ts_cube))
+
+
+def cache_anomaly(cache, cache_key, function, *variables):
+    """Calculate an anomaly and store it in the cache.
+
+    Parameters
+    ----------
+    cache : AnomalyCache
+        climatology/anomaly cache
+    cache_key : str
+        cache key of the anomaly
+    function : function
+        function calculating the climatology and anomaly cube
+    *variables : tuple
+        climatology and timeseries cubes passed to the function
+
+    Returns
+    -------
+    clim_cube : cube
+        renamed climatology cube
+    anom_cube : cube
+        renamed anomaly cube
+    """
+    clim_cube, anom_cube = function(*variables)
+    with WRITE_LOCK:
+        cache.put(cache_key, clim_cube, anom_cube)
+
+    if anom_cube.has_lazy_data():
+        # reading the stored anomaly back is cheaper than recomputing it
+        return cache.get(cache_key)
+
+    return clim_cube, anom_cube
+
+
+def load_cached_anomaly(cache, cache_key, lazy=False, chunk_budget=256,
+                        tiled=False):
+    """Load a climatology and anomaly from the cache.
+
+    Parameters
+    ----------
+    cache : AnomalyCache
+        climatology/anomaly cache
+    cache_key : str
+        cache key of the anomaly
+    lazy : bool
+        keep the data lazy, chunked along time
+    chunk_budget : int
+        maximum size of a single chunk, in MB
+    tiled : bool
+        chunk lazy data into spatial tiles of whole timeseries instead
+
+    Returns
+    -------
+    clim_cube : cube
+        renamed climatology cube
+    anom_cube : cube
+        renamed anomaly cube
+    """
+    clim_cube, anom_cube = cache.get(cache_key)
+    if lazy:
+        anom_cube = rechunk(anom_cube, chunk_budget, tiled)
+    else:
+        # realising once, rather than in every task using the anomaly
+        anom_cube.data
+
+    return clim_cube, anom_cube
+
+
+def model_predictors(areas, yrs, tas_variable, fractions):
+    """Calculate the regression predictors of a model for several areas.
+
+    The tas anomaly is averaged over all areas in one pass, over the
+    years regressed in any of them.
+
+    Parameters
+    ----------
+    areas : dict
+        areas over which to calculate patterns, by name, as returned by
+        ``areas.parse_areas``
+    yrs : dict
+        number of years regressed, per area
+    tas_variable : tuple
+        climatology and anomaly cube of tas
+    fractions : tuple
+        gridded ocean and land fractions
+
+    Returns
+    -------
+    predictors : dict
+        regression predictor, as returned by ``regression_predictor``,
+        per area
+    """
+    ocean_frac, land_frac = fractions
+    tas = tas_variable[1]
+    tas_data = ar.area_means(
+        tas[-max(yrs.values()) * 12:], areas, ocean_frac, land_frac
+    )
+
+    return {
+        name: make_predictor(tas, tas_data[name], yrs=yrs[name])
+        for name in areas
+    }
+
+
+def area_predictor(name, predictors):
+    """Select the regression predictor of one area.
+
+    Parameters
+    ----------
+    name : str
+        name of the area
+    predictors : dict
+        regression predictors per area, as returned by
+        ``model_predictors``
+
+    Returns
+    -------
+    predictor : dict
+        regression predictor, as returned by ``regression_predictor``
+    """
+    return predictors[name]
+
+
+def regress_anomaly(method, predictor, variable):
+    """Calculate the patterns of a variable from its anomaly.
+
+    Parameters
+    ----------
+    method : dict
+        regression options, as returned by ``regression_method``
+    predictor : dict
+        regression predictor, as returned by ``regression_predictor``
+    variable : tuple
+        climatology and anomaly cube of the variable
+
+    Returns
+    -------
+    pattern_cubes : tuple
+        regression slope and score cubes, per month, and the cubes of
+        their uncertainties, if bootstrapped
+    """
+    return regress_variable(variable[1], predictor, **method)
+
+
+def stored_climatology_anomaly(clim_cube, *variables):
+    """Calculate an anomaly from the climatology stored in the statistics.
+
+    Parameters
+    ----------
+    clim_cube : cube
+        stored, renamed climatology cube
+    *variables : tuple
+        climatology and timeseries cube of the variable, or of tasmax and
+        tasmin for the diurnal range
+
+    Returns
+    -------
+    clim_cube : cube
+        renamed climatology cube
+    anom_cube : cube
+        renamed anomaly cube
+    """
+    ts_list = iris.cube.CubeList([cube for _, cube in variables])
+    if len(ts_list) == 2:
+        anom_cube = diurnal_temp_range(ts_list)
+    else:
+        anom_cube = ts_list[0]
+    # realising, so the statistics file is no longer read once replaced
+    clim_cube = clim_cube.copy(data=clim_cube.data)
+    subtract_climatology(anom_cube, clim_cube)
+    rename_anom_variables(anom_cube)
+
+    # the names of clims of several members are made unique on saving
+    clim_cube.var_name = anom_cube.var_name.replace("_anom", "_clim")
+    for attribute in ("folded_years", "incremental_member",
+                      "incremental_variable"):
+        clim_cube.attributes.pop(attribute, None)
+
+    return clim_cube, anom_cube
+
+
+def regress_increment(name, yrs, folded, stats_cube, predictor, variable):
+    """Fold the new years of a variable into its regression statistics.
+
+    Parameters
+    ----------
+    name : str
+        variable of the statistics, e.g. the short name
+    yrs : int
+        number of new years, at the end of the timeseries
+    folded : dict
+        first and last folded year, per ensemble member, including the
+        new years
+    stats_cube : cube
+        stored statistics cube, or None
+    predictor : dict
+        regression predictor of the new years
+    variable : tuple
+        climatology and anomaly cube of the variable
+
+    Returns
+    -------
+    regr_cube : cube
+        cube of regression slope values, per month
+    score_cube : cube
+        cube of regression scores, per month
+    stats_cube : cube
+        cube of the combined regression statistics
+    """
+    cube = variable[1]
+    stats, cell_mask = inc.combine_statistics(
+        stats_cube,
+        variable_statistics(cube, predictor, yrs=yrs),
+        np.ma.getmaskarray(predictor["tas"].data),
+    )
+    regr_array, score_array = reg.ols_from_statistics(
+        np.moveaxis(stats, 1, 0), cell_mask=cell_mask
+    )
+    regr_cube, score_cube = make_pattern_cube(
+        cube, predictor["tas"], regr_array, score_array
+    )
+    for pattern_cube in (regr_cube, score_cube):
+        pattern_cube.attributes["regression_folded_years"] = (
+            inc.format_folded_years(folded)
+        )
+    stats_cube = inc.statistics_cube(
+        stats, cell_mask, cube, predictor["tas"], name
+    )
+
+    return regr_cube, score_cube, stats_cube
+
+
+def patterns_from_statistics(stats_cube, tas_stats_cube, folded):
+    """Calculate the patterns of a variable from its stored statistics.
+
+    Parameters
+    ----------
+    stats_cube : cube
+        stored statistics cube of the variable
+    tas_stats_cube : cube
+        stored statistics cube of tas, which sets the units of patterns
+    folded : dict
+        first and last folded year, per ensemble member
+
+    Returns
+    -------
+    regr_cube : cube
+        cube of regression slope values, per month
+    score_cube : cube
+        cube of regression scores, per month
+    stats_cube : cube
+        cube of the regression statistics
+    """
+    stats = stats_cube.data
+    regr_array, score_array = reg.ols_from_statistics(
+        np.moveaxis(np.ma.getdata(stats), 1, 0),
+        cell_mask=np.ma.getmaskarray(stats).any(axis=1),
+    )
+    regr_cube, score_cube = make_pattern_cube(
+        stats_cube, tas_stats_cube[:, 0], regr_array, score_array
+    )
+    for pattern_cube in (regr_cube, score_cube):
+        pattern_cube.attributes["regression_folded_years"] = (
+            inc.format_folded_years(folded)
+        )
+
+    return regr_cube, score_cube, stats_cube
+
+
+def save_statistics(path, clim_cubes, member, folded, variables,
+                    pattern_cubes):
+    """Save the regression statistics and climatologies of a model.
+
+    Parameters
+    ----------
+    path : path
+        path to the statistics file
+    clim_cubes : dict
+        stored climatology cubes of other members, by (member, variable)
+    member : str
+        ensemble member of this run
+    folded : dict
+        first and last folded year, per ensemble member
+    variables : list
+        climatology and anomaly cubes of all variables
+    pattern_cubes : list
+        regression slope, score and statistics cubes of all variables
+
+    Returns
+    -------
+    None
+    """
+    clim_cubes = dict(clim_cubes)
+    stats_cubes = []
+    for (clim_cube, _), (_, _, stats_cube) in zip(variables, pattern_cubes):
+        name = stats_cube.attributes["incremental_variable"]
+        clim_cubes[member, name] = clim_cube
+        stats_cubes.append(stats_cube)
+
+    with WRITE_LOCK:
+        inc.save_state(path, clim_cubes, stats_cubes, folded)
+
+
+def regress_anomalies_single_pass(method, predictor, variables):
+    """Calculate the patterns of all variables of a model at once.
+
+    Parameters
+    ----------
+    method : dict
+        regression options, as returned by ``regression_method``
+    predictor : dict
+        regression predictor, as returned by ``regression_predictor``
+    variables : list
+        climatology and anomaly cubes of all variables
+
+    Returns
+    -------
+    pattern_cubes : list
+        list of (regression slope, regression score) cubes, for each var,
+        and the cubes of their uncertainties, if bootstrapped
+    """
+    anom_list = iris.cube.CubeList([anom for _, anom in variables])
+
+    return regress_variables_single_pass(
+        anom_list,
+        predictor,
+        estimator=method["estimator"],
+        running_mean=method["running_mean"],
+        bootstrap=method["bootstrap"],
+    )
+
+
+def save_model(options, variables, pattern_cubes):
+    """Save the scores of a model, and record provenance.
+
+    The global means of the climatologies, anomalies and scores are
+    calculated once here, and shared by the scores file and the plots.
+    The cubelists are saved afterwards by ``write_output`` tasks, and
+    the figures drawn by ``plot_figure`` tasks, which run concurrently.
+
+    Parameters
+    ----------
+    options : dict
+        output options: imogen_mode, outputs (indices of the output files
+        saved in the directory), plots, work_path, plot_path, run_dir,
+        scenario_dir, area_dir and output_options
+    variables : list
+        climatology and anomaly cubes of all variables
+    pattern_cubes : list
+        regression slope and score cubes of all variables, if the
+        patterns are saved in the same directory
+
+    Returns
+    -------
+    saved : dict
+        paths to the model directories in work_dir ("work_dir") and
+        plot_dir ("plot_dir"), and the global means plotted ("means")
+    """
+    clim_list_final = iris.cube.CubeList([clim for clim, _ in variables])
+    anom_list_final = iris.cube.CubeList([anom for _, anom in variables])
+
+    model_work_dir, model_plot_dir = sf.make_model_dirs(
+        anom_list_final[0],
+        options["work_path"],
+        options["plot_path"],
+        options["scenario_dir"],
+    )
+
+    means = {}
+    if 0 in options["outputs"] and options["plots"]:
+        means["climatologies"] = plotting.mean_lines(clim_list_final)
+        means["anomalies"] = plotting.mean_lines(anom_list_final)
+    saved = {
+        "work_dir": model_work_dir,
+        "plot_dir": model_plot_dir,
+        "means": means,
+    }
+    if 2 in options["outputs"]:
+        saved = save_patterns(options, saved, pattern_cubes)
+
+    return saved
+
+
+def save_patterns(options, saved, pattern_cubes):
+    """Save the scores of the patterns of a model, and record provenance.
+
+    Patterns of several areas are saved in a subdirectory per area of
+    the model directories.
+
+    Parameters
+    ----------
+    options : dict
+        output options, as for ``save_model``
+    saved : dict
+        model directories and global means, as returned by ``save_model``
+    pattern_cubes : list
+        regression slope and score cubes of all variables
+
+    Returns
+    -------
+    saved : dict
+        paths to the directories of the patterns in work_dir
+        ("work_dir") and plot_dir ("plot_dir"), and the global means
+        plotted ("means")
+    """
+    saved = dict(saved, means=dict(saved["means"]))
+    for name in ("work_dir", "plot_dir"):
+        saved[name] = os.path.join(saved[name], options["area_dir"], "")
+        os.makedirs(saved[name], exist_ok=True)
+
+    if 3 in options["outputs"]:
+        scores = iris.cube.CubeList([cubes[1] for cubes in pattern_cubes])
+        saved["means"]["scores"] = sf.global_means(scores)
+        write_scores(scores, saved["work_dir"], saved["means"]["scores"])
+
+    provenance_record = get_provenance_record()
+    path = saved["work_dir"] + OUTPUT_FILES[2]
+    with ProvenanceLogger(
+        {"run_dir": options["run_dir"]}
+    ) as provenance_logger:
+        provenance_logger.log(path, provenance_record)
+
+    return saved
+
+
+def write_output(options, index, saved, results):
+    """Save one of the output cubelists of a model.
+
+    Parameters
+    ----------
+    options : dict
+        output options, as for ``save_model``
+    index : int
+        index of the cubelist: 0 climatology, 1 anomaly, 2 patterns,
+        3 scores
+    saved : dict
+        model directories, as returned by ``save_model``
+    results : list
+        (climatology, anomaly) cubes of all variables for indices 0-1,
+        or (regression slope, regression score) cubes for indices 2-3
+
+    Returns
+    -------
+    None
+    """
+    cubes = iris.cube.CubeList([result[index % 2] for result in results])
+
+    with WRITE_LOCK:
+        save_cubelist(
+            cubes,
+            saved["work_dir"] + OUTPUT_FILES[index],
+            rename=not options["imogen_mode"],
+            output_options=options["output_options"],
+        )
+
+
+def write_uncertainty(options, saved, results):
+    """Save the bootstrapped uncertainties of the patterns of a model.
+
+    Parameters
+    ----------
+    options : dict
+        output options, as for ``save_model``
+    saved : dict
+        model directories, as returned by ``save_model``
+    results : list
+        (regression slope, regression score, uncertainties) cubes of all
+        variables
+
+    Returns
+    -------
+    None
+    """
+    cubes = iris.cube.CubeList([])
+    for result in results:
+        for cube in result[2]:
+            if not options["imogen_mode"]:
+                # renamed like the patterns, keeping the statistic
+                statistic = cube.attributes["bootstrap_statistic"]
+                cube = cube.copy(data=cube.core_data())
+                cube.var_name = cube.var_name[: -len(statistic) - 1]
+                rename_variables_base(cube)
+                cube.long_name = f"{cube.name()}, bootstrap {statistic}"
+                cube.var_name = f"{cube.var_name}_{statistic}"
+            cubes.append(cube)
+
+    with WRITE_LOCK:
+        save_cubelist(
+            cubes,
+            saved["work_dir"] + UNCERTAINTY_FILE,
+            output_options=options["output_options"],
+        )
+
+
+def plot_figure(figure, saved, pattern_cubes):
+    """Draw one figure, or group of figures, of a model.
+
+    Parameters
+    ----------
+    figure : tuple
+        figure name: patterns, timeseries (climatologies and anomalies),
+        (scores, index of the variable) or score_timeseries
+    saved : dict
+        model directories and global means, as returned by ``save_model``
+    pattern_cubes : list
+        regression slope and score cubes of all variables
+
+    Returns
+    -------
+    None
+    """
+    plot_path = saved["plot_dir"]
+    if figure[0] == "patterns":
+        regressions = iris.cube.CubeList([cubes[0] for cubes in pattern_cubes])
+        figures = plotting.pattern_figures(regressions, plot_path)
+    elif figure[0] == "timeseries":
+        figures = plotting.timeseries_figures(
+            saved["means"]["climatologies"],
+            saved["means"]["anomalies"],
+            plot_path,
+        )
+    elif figure[0] == "scores":
+        figures = [
+            plotting.score_map_figure(pattern_cubes[figure[1]][1], plot_path)
+        ]
+    else:
+        scores = iris.cube.CubeList([cubes[1] for cubes in pattern_cubes])
+        figures = [
+            plotting.score_series_figure(
+                scores, plot_path, saved["means"]["scores"]
+            )
+        ]
+
+    with PLOT_LOCK:
+        for item in figures:
+            plotting.render(item)
+
+
+def add_plot_tasks(scheduler, run, options, saved, pattern_cubes,
+                   n_variables):
+    """Add the tasks drawing the figures of a model.
+
+    Every figure, or small group of figures, is drawn in its own task,
+    so figures are rendered concurrently by the workers of the scheduler.
+
+    Parameters
+    ----------
+    scheduler : Scheduler
+        scheduler to add the tasks to
+    run : tuple
+        prefix of the task keys, e.g. model and scenario name
+    options : dict
+        output options: outputs, the indices of the output files saved
+        in the directory of the figures
+    saved : tuple
+        task key returning the model directories and global means
+    pattern_cubes : tuple or list
+        task key, or keys, returning the pattern and score cubes
+    n_variables : int
+        number of variables
+
+    Returns
+    -------
+    None
+    """
+    outputs = options["outputs"]
+    figures = []
+    if 2 in outputs:
+        figures.append(("patterns",))
+    if 0 in outputs and 1 in outputs:
+        figures.append(("timeseries",))
+    if 3 in outputs:
+        figures += [("scores", index) for index in range(n_variables)]
+        figures.append(("score_timeseries",))
+
+    for figure in figures:
+        scheduler.add(
+            run + ("plot",) + figure,
+            plot_figure,
+            figure,
+            depends=[saved, pattern_cubes],
+        )
+
+
+def load_saved_model(model_work_dir, model_plot_dir):
+    """Calculate the global means plotted from the saved outputs of a model.
+
+    Parameters
+    ----------
+    model_work_dir : str
+        path to the model directory of a previous run
+    model_plot_dir : str
+        path to the model directory in plot_dir
+
+    Returns
+    -------
+    saved : dict
+        model directories and global means, as returned by ``save_model``
+    """
+    os.makedirs(model_plot_dir, exist_ok=True)
+    paths = [model_work_dir + name for name in OUTPUT_FILES]
+
+    means = {}
+    if os.path.exists(paths[0]) and os.path.exists(paths[1]):
+        means["climatologies"] = plotting.mean_lines(iris.load(paths[0]))
+        means["anomalies"] = plotting.mean_lines(iris.load(paths[1]))
+    if os.path.exists(paths[3]):
+        means["scores"] = sf.global_means(iris.load(paths[3]))
+
+    return {
+        "work_dir": model_work_dir,
+        "plot_dir": model_plot_dir,
+        "means": means,
+    }
+
+
+def load_saved_patterns(model_work_dir):
+    """Load the saved patterns and scores of a model.
+
+    Parameters
+    ----------
+    model_work_dir : str
+        path to the model directory of a previous run
+
+    Returns
+    -------
+    pattern_cubes : list
+        regression slope and score cubes of all variables, scores None if
+        they were not saved
+    """
+    regressions = iris.load(model_work_dir + OUTPUT_FILES[2])
+    scores_path = model_work_dir + OUTPUT_FILES[3]
+    scores = iris.load(scores_path) if os.path.exists(scores_path) else None
+
+    pattern_cubes = []
+    for regr_cube in regressions:
+        score_cube = None
+        if scores is not None:
+            score_cube = scores.extract_cube(
+                iris.NameConstraint(var_name=regr_cube.var_name)
+            )
+        pattern_cubes.append((regr_cube, score_cube))
+
+    return pattern_cubes
+
+
+def add_replot_tasks(scheduler, cfg):
+    """Add the tasks drawing the figures of the outputs of a previous run.
+
+    Every directory of plots_from holding patterns, or anomalies, is
+    plotted to the same directory in plot_dir, e.g. patterns of several
+    areas in subdirectories of the anomalies they share. Climatologies
+    and anomalies, and scores, are plotted where they were saved. No
+    input data are loaded.
+
+    Parameters
+    ----------
+    scheduler : Scheduler
+        scheduler to add the tasks to
+    cfg: dict
+        Dictionary passed in by ESMValTool preprocessors
+
+    Returns
+    -------
+    None
+    """
+    plots_from = Path(cfg["plots_from"])
+    patterns_files = sorted(plots_from.rglob(OUTPUT_FILES[2]))
+    if not patterns_files:
+        raise ValueError(f"No {OUTPUT_FILES[2]} found in {plots_from}")
+    model_dirs = {path.parent for path in patterns_files}
+    model_dirs.update(
+        path.parent for path in plots_from.rglob(OUTPUT_FILES[1])
+    )
+
+    for path in sorted(model_dirs):
+        subdir = path.relative_to(plots_from)
+        model_work_dir = os.path.join(path, "")
+        run = ("replot",) + subdir.parts
+        options = {
+            "outputs": [
+                index
+                for index, name in enumerate(OUTPUT_FILES)
+                if os.path.exists(model_work_dir + name)
+            ],
+        }
+        saved = scheduler.add(
+            run + ("load",),
+            load_saved_model,
+            model_work_dir,
+            os.path.join(cfg["plot_dir"], subdir, ""),
+        )
+        pattern_cubes = []
+        n_variables = 0
+        if 2 in options["outputs"]:
+            pattern_cubes = scheduler.add(
+                run + ("patterns",), load_saved_patterns, model_work_dir
+            )
+            n_variables = len(iris.load(model_work_dir + OUTPUT_FILES[2]))
+        add_plot_tasks(
+            scheduler,
+            run,
+            options,
+            saved,
+            pattern_cubes,
+            n_variables,
+        )
+
+
+def add_model_tasks(scheduler, model, cfg, cache=None):
+    """Add the tasks building the patterns of a model, for every scenario.
+
+    The land fraction, and the climatology of every variable of every
+    ensemble member, are made once from the historical period and shared
+    by all scenarios of that member, whose tasks then run concurrently.
+    Every scenario takes one ensemble member. With more than one
+    scenario, outputs of every scenario are saved in a subdirectory named
+    after it.
+
+    Parameters
+    ----------
+    scheduler : Scheduler
+        scheduler to add the tasks to
+    model : str
+        model name
+    cfg: dict
+        Dictionary passed in by ESMValTool preprocessors
+    cache : AnomalyCache
+        optional climatology/anomaly cache
+
+    Returns
+    -------
+    runs : dict
+        task keys saving the outputs and writing the patterns, per area,
+        per scenario
+
+    Raises
+    ------
+    ValueError
+        if the model has no land fraction, or several datasets of a
+        variable in a scenario
+    """
+    selected = cfg.get("scenarios")
+    model_datasets = [
+        dataset for dataset in cfg["input_data"].values()
+        if dataset["dataset"] == model
+    ]
+    sftlf = [
+        dataset for dataset in model_datasets
+        if dataset["short_name"] == "sftlf"
+    ]
+    if not sftlf:
+        raise ValueError(f"No land fraction (sftlf) of {model}")
+    fractions = scheduler.add(
+        (model, "fractions"),
+        load_land_fraction,
+        sftlf[0],
+        cfg["grid"],
+    )
+
+    scenarios = {}
+    for dataset in model_datasets:
+        if dataset["short_name"] == "sftlf":
+            continue
+        scenario = scenario_name(dataset["exp"])
+        if selected is not None and scenario not in selected:
+            continue
+        datasets = scenarios.setdefault(scenario, {})
+        name = dataset["short_name"]
+        if name in datasets:
+            raise ValueError(
+                f"Several {name} datasets of {model} {scenario}, ensembles "
+                f"{datasets[name].get('ensemble')} and "
+                f"{dataset.get('ensemble')}; select one ensemble member "
+                "per scenario"
+            )
+        datasets[name] = dataset
+
+    # the first scenario including the historical period sets the
+    # climatology of a variable of an ensemble member
+    clim_datasets = {}
+    for datasets in scenarios.values():
+        for name, dataset in datasets.items():
+            if has_historical(dataset):
+                clim_datasets.setdefault(
+                    (name, dataset.get("ensemble", "")), dataset
+                )
+
+    clims = {}
+    runs = {}
+    for scenario, datasets in scenarios.items():
+        runs[scenario] = add_scenario_tasks(
+            scheduler,
+            (model, scenario),
+            datasets,
+            fractions,
+            (clim_datasets, clims),
+            cfg,
+            cache,
+            scenario if len(scenarios) > 1 else "",
+        )
+
+    return runs
+
+
+def add_scenario_tasks(scheduler, run, datasets, fractions, climatologies,
+                       cfg, cache=None, scenario_dir=""):
+    """Add the (model, scenario, variable) tasks of one scenario of a model.
+
+    Every variable is loaded and turned into an anomaly in its own task.
+    The diurnal range needs tasmax and tasmin, the regression predictors
+    need tas and the land fraction, and every regression needs the
+    predictor of its area. Only the options a task needs are passed to
+    it, not cfg. Anomalies found in the cache are loaded from it instead,
+    without loading their input data. In incremental mode, only the years
+    not yet in the stored regression statistics are regressed, and folded
+    into the statistics. With more than one area, the patterns of every
+    area are saved in a subdirectory named after it, next to the
+    climatologies and anomalies they share.
+
+    Parameters
+    ----------
+    scheduler : Scheduler
+        scheduler to add the tasks to
+    run : tuple
+        model and scenario name, prefix of all task keys
+    datasets : dict
+        metadata of the datasets of the scenario, by short name
+    fractions : tuple
+        task key of the land fraction of the model
+    climatologies : tuple
+        datasets of the climatologies shared by all scenarios, and the
+        task keys of the ones already added, by short name and ensemble
+        member
+    cfg: dict
+        Dictionary passed in by ESMValTool preprocessors
+    cache : AnomalyCache
+        optional climatology/anomaly cache
+    scenario_dir : str
+        subdirectory of the model outputs of the scenario
+
+    Returns
+    -------
+    area_runs : dict
+        task key saving the outputs, returning the directory of the
+        patterns, and task key writing the patterns file, per area
+    """
+    grid_spec = cfg["grid"]
+    method = regression_method(cfg)
+    lazy = method["lazy"]
+    tiled = method["tiled"]
+    chunk_budget = cfg.get("chunk_budget", 256)
+    options = {
+        "imogen_mode": cfg["imogen_mode"],
+        "plots": cfg.get("plots", True),
+        "work_path": cfg["work_dir"] + "/",
+        "plot_path": cfg["plot_dir"] + "/",
+        "run_dir": cfg["run_dir"],
+        "scenario_dir": scenario_dir,
+        "area_dir": "",
+        "output_options": {
+            "compression": cfg.get("output_compression", "none"),
+            "complevel": cfg.get("output_complevel", 4),
+            "dtype": cfg.get("output_dtype"),
+        },
+        "bootstrap": method["bootstrap"] is not None,
+    }
+    outputs = SAVED_CUBELISTS[
+        output_mode(cfg["imogen_mode"], cfg["output_r2_scores"])
+    ]
+
+    areas = ar.parse_areas(
+        cfg.get("area", "global"), cfg.get("auxiliary_data_dir")
+    )
+    several_areas = len(areas) > 1
+
+    # input variables of every anomaly
+    sources = {
+        name: [name] for name in datasets if name not in ("tasmax", "tasmin")
+    }
+    sources["range_tl1"] = [
+        name for name in datasets if name in ("tasmax", "tasmin")
+    ]
+
+    yrs = {area: 85 for area in areas}
+    incremental = cfg.get("incremental", False)
+    if incremental:
+        member = datasets["tas"].get("ensemble", "")
+        statistics_paths = {}
+        states = {}
+        folded = {}
+        stored_clims = {}
+        for area in areas:
+            statistics_paths[area] = Path(
+                cfg.get("statistics_dir") or cfg["work_dir"],
+                run[0],
+                scenario_dir,
+                area if several_areas else "",
+                inc.STATISTICS_FILE,
+            )
+            states[area] = inc.load_state(statistics_paths[area])
+            yrs[area], folded[area] = inc.years_to_fold(
+                states[area]["folded"],
+                member,
+                datasets["tas"]["start_year"],
+                datasets["tas"]["end_year"],
+                yrs=85,
+            )
+            logger.info(
+                "Folding %s new years of %s %s, %s",
+                yrs[area], run, member, area,
+            )
+            # areas store the same climatologies, the first one is used
+            for clim_key, clim_cube in states[area]["clim"].items():
+                stored_clims.setdefault(clim_key, clim_cube)
+
+    clim_datasets, clims = climatologies
+    clim_keys = {
+        name: (name, dataset.get("ensemble", ""))
+        for name, dataset in datasets.items()
+    }
+    loaded = {}
+
+    def load_keys(names):
+        for name in names:
+            if name in loaded:
+                continue
+            clim_key = clim_keys[name]
+            if clim_key in clim_datasets and clim_key not in clims:
+                clims[clim_key] = scheduler.add(
+                    (run[0], "climatology") + clim_key,
+                    load_climatology,
+                    clim_datasets[clim_key],
+                    grid_spec,
+                )
+            loaded[name] = scheduler.add(
+                run + ("load", name),
+                load_variable,
+                datasets[name],
+                grid_spec,
+                lazy,
+                chunk_budget,
+                tiled,
+                depends=[clims[clim_key]] if clim_key in clims else [],
+            )
+        return [loaded[name] for name in names]
+
+    # calculate anomaly over historical + ssp timeseries
+    variables = []
+    for name, names in sources.items():
+        key = run + ("anomaly", name)
+        if name == "range_tl1":
+            function = diurnal_range_anomaly
+        else:
+            function = variable_anomaly
+
+        if incremental and (member, name) in stored_clims:
+            variables.append(
+                scheduler.add(
+                    key,
+                    stored_climatology_anomaly,
+                    stored_clims[member, name],
+                    depends=load_keys(names),
+                )
+            )
+            continue
+
+        if cache is None:
+            variables.append(
+                scheduler.add(key, function, depends=load_keys(names))
+            )
+            continue
+
+        cache_key = cache.key(
+            [datasets[source]["filename"] for source in names]
+            + [
+                clim_datasets[clim_keys[source]]["filename"]
+                for source in names
+                if clim_keys[source] in clim_datasets
+            ],
+            variable=name,
+            exp=[datasets[source]["exp"] for source in names],
+            grid=grid_spec,
+            climatology_window=list(CLIMATOLOGY_WINDOW),
+        )
+        if cache.contains(cache_key):
+            variables.append(
+                scheduler.add(
+                    key,
+                    load_cached_anomaly,
+                    cache,
+                    cache_key,
+                    lazy,
+                    chunk_budget,
+                    tiled,
+                )
+            )
+        else:
+            variables.append(
+                scheduler.add(
+                    key,
+                    cache_anomaly,
+                    cache,
+                    cache_key,
+                    function,
+                    depends=load_keys(names),
+                )
+            )
+
+    # the predictors of all areas are averaged in one task
+    regressed = {area: spec for area, spec in areas.items() if yrs[area]}
+    if regressed:
+        predictors = scheduler.add(
+            run + ("predictors",),
+            model_predictors,
+            regressed,
+            {area: yrs[area] for area in regressed},
+            depends=[run + ("anomaly", "tas"), fractions],
+        )
+
+    if several_areas:
+        # climatologies and anomalies are shared by all areas
+        shared_options = dict(options, outputs=[i for i in outputs if i < 2])
+        shared = scheduler.add(
+            run + ("save",),
+            save_model,
+            shared_options,
+            depends=[variables, []],
+        )
+        add_output_tasks(
+            scheduler, run, shared_options, shared, variables, []
+        )
+
+    area_runs = {}
+    for area in areas:
+        area_run = run + (area,) if several_areas else run
+        if yrs[area]:
+            predictor = scheduler.add(
+                area_run + ("predictor",),
+                area_predictor,
+                area,
+                depends=[predictors],
+            )
+
+        if incremental:
+            pattern_cubes = []
+            for key in variables:
+                name = key[-1]
+                if yrs[area]:
+                    pattern_cubes.append(
+                        scheduler.add(
+                            area_run + ("regression", name),
+                            regress_increment,
+                            name,
+                            yrs[area],
+                            folded[area],
+                            states[area]["stats"].get(name),
+                            depends=[predictor, key],
+                        )
+                    )
+                else:
+                    # nothing new, the patterns are re-derived as they were
+                    pattern_cubes.append(
+                        scheduler.add(
+                            area_run + ("regression", name),
+                            patterns_from_statistics,
+                            states[area]["stats"][name],
+                            states[area]["stats"]["tas"],
+                            folded[area],
+                        )
+                    )
+            scheduler.add(
+                area_run + ("statistics",),
+                save_statistics,
+                statistics_paths[area],
+                {
+                    clim_key: clim_cube
+                    for clim_key, clim_cube in states[area]["clim"].items()
+                    if clim_key[0] != member
+                },
+                member,
+                folded[area],
+                depends=[variables, pattern_cubes],
+            )
+        elif cfg.get("single_pass_regression", False) and not lazy:
+            pattern_cubes = scheduler.add(
+                area_run + ("regression",),
+                regress_anomalies_single_pass,
+                method,
+                depends=[predictor, variables],
+            )
+        else:
+            pattern_cubes = [
+                scheduler.add(
+                    area_run + ("regression", key[-1]),
+                    regress_anomaly,
+                    method,
+                    depends=[predictor, key],
+                )
+                for key in variables
+            ]
+
+        if several_areas:
+            area_options = dict(
+                options, outputs=[i for i in outputs if i >= 2], area_dir=area
+            )
+            saved = scheduler.add(
+                area_run + ("save",),
+                save_patterns,
+                area_options,
+                depends=[shared, pattern_cubes],
+            )
+        else:
+            area_options = dict(options, outputs=outputs)
+            saved = scheduler.add(
+                area_run + ("save",),
+                save_model,
+                area_options,
+                depends=[variables, pattern_cubes],
+            )
+        add_output_tasks(
+            scheduler, area_run, area_options, saved, variables,
+            pattern_cubes,
+        )
+        area_runs[area] = (saved, area_run + ("write", OUTPUT_FILES[2]))
+
+    return area_runs
+
+
+def add_output_tasks(scheduler, run, options, saved, variables,
+                     pattern_cubes):
+    """Add the tasks writing the output files, and drawing the figures.
+
+    Parameters
+    ----------
+    scheduler : Scheduler
+        scheduler to add the tasks to
+    run : tuple
+        prefix of the task keys, e.g. model and scenario name
+    options : dict
+        output options, as for ``save_model``
+    saved : tuple
+        task key returning the directories the outputs are saved in
+    variables : list
+        task keys returning the climatology and anomaly cubes
+    pattern_cubes : tuple or list
+        task key, or keys, returning the pattern and score cubes
+
+    Returns
+    -------
+    None
+    """
+    for index in options["outputs"]:
+        scheduler.add(
+            run + ("write", OUTPUT_FILES[index]),
+            write_output,
+            options,
+            index,
+            depends=[saved, variables if index < 2 else pattern_cubes],
+        )
+    if options["bootstrap"] and 2 in options["outputs"]:
+        scheduler.add(
+            run + ("write", UNCERTAINTY_FILE),
+            write_uncertainty,
+            options,
+            depends=[saved, pattern_cubes],
+        )
+    if options["plots"]:
+        add_plot_tasks(
+            scheduler, run, options, saved, pattern_cubes, len(variables)
+        )
+
+
+def save_ensemble(options, models, saved, _):
+    """Save the multi-model statistics of the patterns of a scenario.
+
+    Parameters
+    ----------
+    options : dict
+        ensemble options: work_path, scenario_dir, percentiles, run_dir
+        and output_options
+    models : list
+        models in the ensemble
+    saved : list
+        model directories, as returned by ``save_model``, in the order of
+        the models
+    _ : list
+        results of the tasks saving the patterns, which must finish first
+
+    Returns
+    -------
+    None
+    """
+    pattern_files = {
+        model: model_saved["work_dir"] + OUTPUT_FILES[2]
+        for model, model_saved in zip(models, saved)
+    }
+    cubes = ens.ensemble_statistics(pattern_files, options["percentiles"])
+
+    work_dir = os.path.join(options["work_path"], options["scenario_dir"])
+    os.makedirs(work_dir, exist_ok=True)
+    path = os.path.join(work_dir, ens.ENSEMBLE_FILE)
+    cubes, kwargs = encode_cubes(cubes, options["output_options"])
+    with WRITE_LOCK:
+        iris.save(cubes, path, **kwargs)
+
+    provenance_record = get_provenance_record()
+    provenance_record["caption"] = [
+        "Multi-model statistics of climate patterns from CMIP6 models"
+    ]
+    provenance_record["ancestors"] = list(pattern_files.values())
+    with ProvenanceLogger(
+        {"run_dir": options["run_dir"]}
+    ) as provenance_logger:
+        provenance_logger.log(path, provenance_record)
+
+
+def add_ensemble_tasks(scheduler, model_runs, cfg):
+    """Add the tasks reducing the patterns of all models, per scenario.
+
+    Every task runs once the patterns of all models of its scenario are
+    saved. Patterns of several areas are reduced per area.
+
+    Parameters
+    ----------
+    scheduler : Scheduler
+        scheduler to add the tasks to
+    model_runs : dict
+        task keys saving the outputs and the patterns of every scenario
+        and area, as returned by ``add_model_tasks``, per model
+    cfg: dict
+        Dictionary passed in by ESMValTool preprocessors
+
+    Returns
+    -------
+    None
+    """
+    groups = {}
+    for model, runs in model_runs.items():
+        for scenario, area_runs in runs.items():
+            for area, keys in area_runs.items():
+                groups.setdefault((scenario, area), {})[model] = keys
+    scenarios = {scenario for scenario, _ in groups}
+    areas = {area for _, area in groups}
+
+    for (scenario, area), runs in groups.items():
+        if len(runs) < 2:
+            logger.info(
+                "Skipping multi-model statistics of %s %s, with one model",
+                scenario,
+                area,
+            )
+            continue
+        options = {
+            "work_path": cfg["work_dir"],
+            "scenario_dir": os.path.join(
+                scenario if len(scenarios) > 1 else "",
+                area if len(areas) > 1 else "",
+            ),
+            "percentiles": cfg.get("ensemble_percentiles", [5, 50, 95]),
+            "run_dir": cfg["run_dir"],
+            "output_options": {
+                "compression": cfg.get("output_compression", "none"),
+                "complevel": cfg.get("output_complevel", 4),
+                "dtype": cfg.get("output_dtype"),
+            },
+        }
+        scheduler.add(
+            ("ensemble", scenario) + ((area,) if len(areas) > 1 else ()),
+            save_ensemble,
+            options,
+            list(runs),
+            depends=[
+                [saved for saved, _ in runs.values()],
+                [written for _, written in runs.values()],
+            ],
+        )
+
+
+def make_cache(cfg):
+    """Create the climatology/anomaly cache from the cache options.
+
+    Parameters
+    ----------
+    cfg : dict
+        the global config dictionary, passed by ESMValTool.
+
+    Returns
+    -------
+    cache : AnomalyCache
+        climatology/anomaly cache, or None if caching is off
+    """
+    if not cfg.get("cache", False):
+        return None
+
+    cache_dir = cfg.get("cache_dir") or Path(cfg["work_dir"], "cache")
+
+    return AnomalyCache(cache_dir, max_size=cfg.get("cache_size", 10000))
+
+
+def regression_method(cfg):
+    """Check the regression options of the recipe.
+
+    Lazy and incremental regressions are accumulated from sufficient
+    statistics, which only support the default no-intercept least
+    squares of yearly values. Tiled regressions are lazy too, but fit
+    whole timeseries, so they support all estimators. Bootstrapped
+    uncertainties need whole timeseries too, and least squares slopes.
+
+    Parameters
+    ----------
+    cfg : dict
+        the global config dictionary, passed by ESMValTool.
+
+    Returns
+    -------
+    method : dict
+        lazy, estimator, running mean, tiling and bootstrap (resamples,
+        block_length and percentiles, or None) of the regressions, as
+        passed to ``regress_variable``
+
+    Raises
+    ------
+    ValueError
+        if the estimator is unknown, the running mean is not a positive
+        number of years, or either is combined with lazy (untiled) or
+        incremental regressions; or if the bootstrap is combined with
+        them, or a robust estimator, or has fewer than two resamples
+    """
+    tiled = cfg.get("tiled", False)
+    method = {
+        "lazy": cfg.get("lazy", False) or tiled,
+        "estimator": cfg.get("regression_estimator", "ols"),
+        "running_mean": cfg.get("running_mean_years", 1),
+        "tiled": tiled,
+    }
+    if method["estimator"] not in reg.ESTIMATORS:
+        raise ValueError(
+            f"Unknown regression_estimator '{method['estimator']}', "
+            f"choose from {tuple(reg.ESTIMATORS)}"
+        )
+    if (
+        not isinstance(method["running_mean"], int)
+        or method["running_mean"] < 1
+    ):
+        raise ValueError(
+            "running_mean_years must be a positive number of years, not "
+            f"{method['running_mean']!r}"
+        )
+    default = method["estimator"] == "ols" and method["running_mean"] == 1
+    for option, enabled in (
+        ("lazy", cfg.get("lazy", False) and not tiled),
+        ("incremental", cfg.get("incremental", False)),
+    ):
+        if enabled and not default:
+            raise ValueError(
+                f"'{option}: true' only supports 'regression_estimator: "
+                "ols' and 'running_mean_years: 1'"
+            )
+        if enabled and cfg.get("bootstrap", False):
+            raise ValueError(f"'{option}: true' does not support bootstrap")
+
+    method["bootstrap"] = None
+    if cfg.get("bootstrap", False):
+        method["bootstrap"] = {
+            "resamples": cfg.get("bootstrap_resamples", 1000),
+            "block_length": cfg.get("bootstrap_block_years", 1),
+            "percentiles": list(cfg.get("bootstrap_percentiles", [5, 95])),
+        }
+        if method["estimator"] not in ("ols", "ols_intercept"):
+            raise ValueError(
+                "bootstrap only supports 'regression_estimator: ols' or "
+                "'ols_intercept'"
+            )
+        if method["bootstrap"]["resamples"] < 2:
+            raise ValueError("bootstrap_resamples must be at least 2")
+
+    return method
+
+
+def make_scheduler(cfg, group_depth=1):
+    """Create the task scheduler from the parallelisation options.
+
+    Parameters
+    ----------
+    cfg : dict
+        the global config dictionary, passed by ESMValTool.
+    group_depth : int
+        number of leading items of the task keys grouping the tasks run
+        in one worker process, e.g. 1 for a group per model
+
+    Returns
+    -------
+    scheduler : Scheduler
+        task scheduler, isolating failed tasks so other models still run
+    """
+    options = {"retries": cfg.get("retries", 0), "isolate": True}
+    if cfg["parallelise"] is True:
+        return Scheduler(
+            backend=cfg.get("parallel_backend", "process"),
+            workers=cfg["parallel_threads"],
+            memory_limit=cfg.get("worker_memory_limit"),
+            group_depth=group_depth,
+            **options,
+        )
+
+    return Scheduler(backend="serial", **options)
+
+
+# options changing the outputs of a model, part of its checkpoint key
+CHECKPOINT_OPTIONS = (
+    "grid",
+    "imogen_mode",
+    "output_r2_scores",
+    "area",
+    "regression_estimator",
+    "running_mean_years",
+    "bootstrap",
+    "bootstrap_resamples",
+    "bootstrap_block_years",
+    "bootstrap_percentiles",
+    "incremental",
+    "statistics_dir",
+    "scenarios",
+    "output_compression",
+    "output_complevel",
+    "output_dtype",
+    "plots",
+)
+
+REPORT_FILE = "run_report.yml"
+
+
+def checkpoint_key(cfg, model):
+    """Make the key of the outputs of a model, for its checkpoint.
+
+    Parameters
+    ----------
+    cfg : dict
+        the global config dictionary, passed by ESMValTool.
+    model : str
+        model name
+
+    Returns
+    -------
+    key : str
+        key of the datasets of the model and the options changing its
+        outputs, as returned by ``checkpoint.run_key``
+    """
+    datasets = [
+        dataset for dataset in cfg["input_data"].values()
+        if dataset["dataset"] == model
+    ]
+    options = {name: cfg.get(name) for name in CHECKPOINT_OPTIONS}
+
+    return ckpt.run_key(datasets, options)
+
+
+def write_checkpoint(model, key, options, runs, saved, _):
+    """Write the manifest of a model, once all its tasks have finished.
+
+    Parameters
+    ----------
+    model : str
+        model name
+    key : str
+        key of the outputs, as returned by ``checkpoint_key``
+    options : dict
+        work_path and plot_path of the run
+    runs : list
+        (scenario, area) of every directory of patterns
+    saved : list
+        directories of the patterns, as returned by ``save_model`` or
+        ``save_patterns``, in the order of the runs
+    _ : list
+        results of the last tasks of the model, which must finish first
+
+    Returns
+    -------
+    None
+    """
+    relative = [
+        Path(os.path.relpath(run_saved["work_dir"], options["work_path"]))
+        for run_saved in saved
+    ]
+    name = relative[0].parts[0]
+    # the directories of the patterns, for the ensemble of a resumed run
+    manifest_runs = {}
+    for (scenario, area), path in zip(runs, relative):
+        manifest_runs.setdefault(scenario, {})[area] = str(
+            path.relative_to(name)
+        )
+    ckpt.write_manifest(
+        model,
+        key,
+        os.path.join(options["work_path"], name),
+        os.path.join(options["plot_path"], name),
+        manifest_runs,
+    )
+
+
+def add_checkpoint_task(scheduler, model, runs, cfg):
+    """Add the task writing the manifest of a model, after all others.
+
+    Parameters
+    ----------
+    scheduler : Scheduler
+        scheduler the tasks of the model were added to
+    model : str
+        model name
+    runs : dict
+        scenarios of the model, as returned by ``add_model_tasks``
+    cfg : dict
+        the global config dictionary, passed by ESMValTool.
+
+    Returns
+    -------
+    None
+    """
+    areas = [
+        (scenario, area)
+        for scenario, area_runs in runs.items()
+        for area in area_runs
+    ]
+    scheduler.add(
+        (model, "checkpoint"),
+        write_checkpoint,
+        model,
+        checkpoint_key(cfg, model),
+        {"work_path": cfg["work_dir"], "plot_path": cfg["plot_dir"]},
+        areas,
+        depends=[
+            [runs[scenario][area][0] for scenario, area in areas],
+            scheduler.leaves((model,)),
+        ],
+    )
+
+
+def restore_checkpoint(options, manifest):
+    """Restore the outputs of a model completed by a previous run.
+
+    Parameters
+    ----------
+    options : dict
+        work_path, plot_path and run_dir of the run
+    manifest : dict
+        manifest of the model, as returned by
+        ``checkpoint.complete_models``
+
+    Returns
+    -------
+    work_dir : str
+        directory of the model in the work_dir of the run
+    """
+    work_dir, _ = ckpt.restore_model(
+        manifest, options["work_path"], options["plot_path"]
+    )
+    provenance_record = get_provenance_record()
+    with ProvenanceLogger(
+        {"run_dir": options["run_dir"]}
+    ) as provenance_logger:
+        for area_runs in manifest["runs"].values():
+            for relative in area_runs.values():
+                path = os.path.join(work_dir, relative, OUTPUT_FILES[2])
+                provenance_logger.log(path, provenance_record)
+
+    return work_dir
+
+
+def resumed_patterns(relative, work_dir):
+    """Find the directory of the restored patterns of a scenario and area.
+
+    Parameters
+    ----------
+    relative : str
+        directory of the patterns, relative to the model directory
+    work_dir : str
+        directory of the model in work_dir, as returned by
+        ``restore_checkpoint``
+
+    Returns
+    -------
+    saved : dict
+        path to the directory of the patterns ("work_dir"), as returned
+        by ``save_model``
+    """
+    return {"work_dir": os.path.join(work_dir, relative, "")}
+
+
+def add_resumed_tasks(scheduler, model, manifest, cfg):
+    """Add the tasks restoring a model completed by a previous run.
+
+    Parameters
+    ----------
+    scheduler : Scheduler
+        scheduler to add the tasks to
+    model : str
+        model name
+    manifest : dict
+        manifest of the model, as returned by
+        ``checkpoint.complete_models``
+    cfg : dict
+        the global config dictionary, passed by ESMValTool.
+
+    Returns
+    -------
+    runs : dict
+        task keys returning the directories of the patterns, twice, per
+        area, per scenario, like ``add_model_tasks``
+    """
+    restored = scheduler.add(
+        (model, "restore"),
+        restore_checkpoint,
+        {
+            "work_path": cfg["work_dir"],
+            "plot_path": cfg["plot_dir"],
+            "run_dir": cfg["run_dir"],
+        },
+        manifest,
+    )
+    runs = {}
+    for scenario, area_runs in manifest["runs"].items():
+        for area, relative in area_runs.items():
+            key = scheduler.add(
+                (model, scenario, area, "resumed"),
+                resumed_patterns,
+                relative,
+                depends=[restored],
+            )
+            runs.setdefault(scenario, {})[area] = (key, key)
+
+    return runs
+
+
+def report_models(scheduler, models, resumed, failures, work_dir):
+    """Report the models completed, resumed and failed, and save it.
+
+    Parameters
+    ----------
+    scheduler : Scheduler
+        scheduler, after running all tasks
+    models : list
+        names of all models
+    resumed : list
+        models restored from a previous run
+    failures : dict
+        exceptions of the models whose tasks could not be added
+    work_dir : str
+        path to work_dir, to save the report
+
+    Returns
+    -------
+    report : dict
+        models completed ("completed"), restored from a previous run
+        ("resumed") and failed ("failed", with the first failed task and
+        its exception, also for failed tasks of several models), and the
+        tasks of several models skipped ("skipped"), e.g. ensemble
+        statistics
+    """
+    failed = {model: repr(exc) for model, exc in failures.items()}
+    for key, exc in scheduler.failures.items():
+        name = key[0] if key[0] in models else str(key)
+        failed.setdefault(name, f"{key}: {exc!r}")
+    report = {
+        "completed": [
+            model for model in models
+            if model not in failed and model not in resumed
+        ],
+        "resumed": [model for model in models if model in resumed],
+        "failed": failed,
+        "skipped": [
+            str(key) for key in scheduler.skipped if key[0] not in models
+        ],
+    }
+    with open(
+        os.path.join(work_dir, REPORT_FILE), "w", encoding="utf-8"
+    ) as file:
+        yaml.safe_dump(report, file, sort_keys=False)
+
+    logger.info(
+        "Completed %s models, resumed %s, failed %s",
+        len(report["completed"]),
+        len(report["resumed"]),
+        len(failed),
+    )
+    for model, message in failed.items():
+        logger.error("Model %s failed, %s", model, message)
+    for key in report["skipped"]:
+        logger.warning("Skipped task %s, after a failed model", key)
+
+    return report
+
+
+def report_stages(stats, model_runs, work_dir, elapsed=None):
+    """Save the measurements of every stage per model, and log a summary.
+
+    Parameters
+    ----------
+    stats : dict
+        measurements of every task, by task key, from the scheduler
+    model_runs : dict
+        scenarios of every model, as returned by ``add_model_tasks``
+    work_dir : str
+        path to work_dir
+    elapsed : float
+        wall time of the whole run, in seconds
+
+    Returns
+    -------
+    None
+    """
+    def run_dir(run):
+        # tasks shared by all scenarios are saved with the model
+        if not run or run[0] not in model_runs:
+            return None
+        if len(run) > 1 and len(model_runs[run[0]]) > 1:
+            return os.path.join(work_dir, run[0], run[1])
+        return os.path.join(work_dir, run[0])
+
+    for path, stages in inst.stage_totals(stats, run_dir).items():
+        if os.path.isdir(path):
+            inst.write_stats(os.path.join(path, inst.STATS_FILE), stages)
+
+    stages = inst.stage_totals(stats).get(None, {})
+    logger.info(
+        "Time, memory and I/O per stage, of %s tasks%s:\n%s",
+        len(stats),
+        "" if elapsed is None else f" run in {elapsed:.1f} s",
+        inst.summary_table(stages),
+    )
+
+
+def patterns(model, cfg):
+    """Driving function for script, taking in model data and saving parameters.
+
+    Parameters
+    ----------
+    model : str
+        model name
+    cfg: dict
+        Dictionary passed in by ESMValTool preprocessors
+
+    Returns
+    -------
+    None
+    """
+    cache = make_cache(cfg)
+    scheduler = Scheduler(backend="serial")
+    runs = add_model_tasks(scheduler, model, cfg, cache)
+    scheduler.run()
+    report_stages(scheduler.stats, {model: runs}, cfg["work_dir"])
+
+
+def main(cfg):
+    """Take in driving data with parallelisation options.
+
+    Parameters
+    ----------
+    cfg : dict
+        the global config dictionary, passed by ESMValTool.
+
+    Returns
+    -------
+    None
+    """
+    start = time.perf_counter()
+    if cfg.get("plots_from"):
+        # keys of replotted tasks start with "replot" and the model
+        scheduler = make_scheduler(cfg, group_depth=2)
+        add_replot_tasks(scheduler, cfg)
+        scheduler.run()
+        report_stages(
+            scheduler.stats, {}, cfg["work_dir"],
+            time.perf_counter() - start,
+        )
+        return
+
+    input_data = cfg["input_data"].values()
+
+    models = []
+    for mod in input_data:
+        model = mod["dataset"]
+        if model not in models:
+            models.append(model)
+
+    # invalid options fail the run before any model is started
+    regression_method(cfg)
+    resumed = {}
+    if cfg.get("resume_from"):
+        resumed = ckpt.complete_models(
+            cfg["resume_from"],
+            {model: checkpoint_key(cfg, model) for model in models},
+        )
+        logger.info(
+            "Resuming %s of %s models from %s",
+            len(resumed),
+            len(models),
+            cfg["resume_from"],
+        )
+
+    cache = make_cache(cfg)
+    scheduler = make_scheduler(cfg)
+    model_runs = {}
+    failures = {}
+    for model in models:
+        if model in resumed:
+            model_runs[model] = add_resumed_tasks(
+                scheduler, model, resumed[model], cfg
+            )
+            continue
+        try:
+            model_runs[model] = add_model_tasks(scheduler, model, cfg, cache)
+        except (KeyError, OSError, ValueError) as exc:
+            # e.g. a missing land fraction, leaving the other models
+            logger.error("Skipping model %s: %r", model, exc)
+            scheduler.remove((model,))
+            failures[model] = exc
+            continue
+        add_checkpoint_task(scheduler, model, model_runs[model], cfg)
+    if cfg.get("ensemble_statistics", False):
+        add_ensemble_tasks(scheduler, model_runs, cfg)
+    if cache is not None:
+        cache.log_stats()
+    scheduler.run()
+    report_stages(
+        scheduler.stats, model_runs, cfg["work_dir"],
+        time.perf_counter() - start,
+    )
+    report = report_models(
+        scheduler, models, resumed, failures, cfg["work_dir"]
+    )
+    if report["failed"]:
+        raise RuntimeError(
+            f"Failed: {', '.join(report['failed'])}, see "
+            f"{os.path.join(cfg['work_dir'], REPORT_FILE)}; rerun with "
+            f"'resume_from: {cfg['work_dir']}' to compute only the models "
+            "not completed"
+        )
 
 
 if __name__ == "__main__":
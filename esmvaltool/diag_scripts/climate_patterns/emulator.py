@@ -0,0 +1,372 @@
+"""Script containing a pattern-scaling emulator built on saved patterns.
+
+Reconstructs monthly gridded fields of every variable, including the
+diurnal range, from the patterns and climatologies saved by the
+diagnostic, for any number of trajectories of area-averaged warming:
+
+    field(t) = climatology(month(t)) + pattern(month(t)) * dT(t)
+
+where dT is the warming relative to the climatology period, averaged
+over the area the patterns were built with. Trajectories are processed
+in batches, so they can be read from, and the fields written to,
+memory-mapped arrays without holding a whole ensemble in memory, e.g.
+
+    emulator = PatternEmulator.from_model_dir("work/<source_id>")
+    delta_t = np.load("trajectories.npy", mmap_mode="r")
+    for batch, fields in emulator.stream(delta_t):
+        ...
+
+Author
+------
+Gregory Munday (Met Office, UK)
+"""
+
+import logging
+import os
+from pathlib import Path
+
+import iris
+import iris.cube
+import numpy as np
+from cf_units import Unit
+
+logger = logging.getLogger(Path(__file__).stem)
+
+PATTERN_SUFFIX = "_patt"
+CLIMATOLOGY_SUFFIX = "_clim"
+
+
+def base_name(var_name, suffix):
+    """Find the name of a variable shared by its pattern and climatology.
+
+    Parameters
+    ----------
+    var_name : str
+        variable name in the output file, e.g. tl1_patt
+    suffix : str
+        suffix of the output file's variables
+
+    Returns
+    -------
+    name : str
+        variable name without the suffix, e.g. tl1
+    """
+    return var_name.removesuffix(suffix)
+
+
+def month_array(cube, dtype):
+    """Get the monthly data of a pattern or climatology cube.
+
+    Parameters
+    ----------
+    cube : cube
+        (month, lat, lon) cube
+    dtype : dtype
+        data type of the array
+
+    Returns
+    -------
+    data : arr
+        (month, lat, lon) array, NaN where masked
+    """
+    if cube.shape[0] != 12:
+        raise ValueError(
+            f"Expected 12 months in {cube.var_name}, got {cube.shape[0]}"
+        )
+
+    return np.ma.filled(cube.data.astype(dtype), np.nan)
+
+
+class PatternEmulator:
+    """Emulator of monthly fields from climate patterns.
+
+    Parameters
+    ----------
+    patterns_file : path
+        patterns.nc of a model
+    climatology_file : path
+        climatology_variables.nc of the model, saved in imogen_mode; if
+        None, anomalies relative to the climatology are emulated
+    variables : list
+        names of the variables to emulate, e.g. [tl1, range_tl1]; all
+        variables of the patterns file if None
+    dtype : str
+        data type of the emulated fields
+    """
+
+    def __init__(self, patterns_file, climatology_file=None, variables=None,
+                 dtype="float32"):
+        self.dtype = np.dtype(dtype)
+        self.patterns = {}
+        self.climatologies = {}
+        self.units = {}
+
+        for cube in iris.load(str(patterns_file)):
+            name = base_name(cube.var_name, PATTERN_SUFFIX)
+            if variables is None or name in variables:
+                self.patterns[name] = month_array(cube, self.dtype)
+                self.units[name] = cube.units * Unit("K")
+                self.grid = cube[0]
+        if variables is not None:
+            missing = set(variables) - set(self.patterns)
+            if missing:
+                raise ValueError(
+                    f"Variables {sorted(missing)} not in {patterns_file}"
+                )
+
+        if climatology_file is not None:
+            for cube in iris.load(str(climatology_file)):
+                name = base_name(cube.var_name, CLIMATOLOGY_SUFFIX)
+                if name in self.patterns:
+                    self.climatologies[name] = month_array(cube, self.dtype)
+                    self.units[name] = cube.units
+            missing = set(self.patterns) - set(self.climatologies)
+            if missing:
+                raise ValueError(
+                    f"Variables {sorted(missing)} not in {climatology_file}"
+                )
+
+        logger.debug(
+            "Emulating %s from %s", ", ".join(self.patterns), patterns_file
+        )
+
+    @classmethod
+    def from_model_dir(cls, model_work_dir, **kwargs):
+        """Make an emulator from the outputs of a model.
+
+        Parameters
+        ----------
+        model_work_dir : path
+            directory of the model in work_dir, or of one of its scenarios
+            or areas; the climatologies shared by several areas are found
+            in the directory above them
+        **kwargs : dict
+            keyword arguments of ``PatternEmulator``
+
+        Returns
+        -------
+        emulator : PatternEmulator
+            emulator of the model, emulating anomalies if there is no
+            climatology file
+        """
+        model_work_dir = Path(model_work_dir)
+        climatology_file = None
+        for directory in (model_work_dir, model_work_dir.parent):
+            if (directory / "climatology_variables.nc").exists():
+                climatology_file = directory / "climatology_variables.nc"
+                break
+
+        return cls(
+            model_work_dir / "patterns.nc", climatology_file, **kwargs
+        )
+
+    @property
+    def variables(self):
+        """Names of the emulated variables."""
+        return list(self.patterns)
+
+    def field_bytes(self, n_months):
+        """Calculate the memory needed to emulate one trajectory.
+
+        Parameters
+        ----------
+        n_months : int
+            length of the trajectory
+
+        Returns
+        -------
+        size : int
+            bytes per trajectory, for all variables
+        """
+        return (
+            len(self.patterns) * n_months * self.grid.data.size
+            * self.dtype.itemsize
+        )
+
+    def emulate(self, delta_t, variable, start_month=1, out=None):
+        """Emulate the fields of one variable for a batch of trajectories.
+
+        Parameters
+        ----------
+        delta_t : arr
+            (trajectory, month) or (month,) array of area-averaged warming
+        variable : str
+            name of the variable
+        start_month : int
+            calendar month of the first step of the trajectories
+        out : arr
+            optional (trajectory, month, lat, lon) array to write to
+
+        Returns
+        -------
+        fields : arr
+            (trajectory, month, lat, lon) array of emulated fields, or
+            (month, lat, lon) for a single trajectory
+        """
+        delta_t = np.asarray(delta_t, dtype=self.dtype)
+        single = delta_t.ndim == 1
+        delta_t = np.atleast_2d(delta_t)
+        if out is None:
+            out = np.empty(
+                delta_t.shape + self.grid.shape, dtype=self.dtype
+            )
+
+        pattern = self.patterns[variable]
+        climatology = self.climatologies.get(variable)
+        for month in range(12):
+            # every 12th step, written in place, so no (time, lat, lon)
+            # copy of the patterns or temporary fields are made
+            steps = slice((month - start_month + 1) % 12, None, 12)
+            view = out[:, steps]
+            np.multiply(
+                delta_t[:, steps, np.newaxis, np.newaxis],
+                pattern[month],
+                out=view,
+            )
+            if climatology is not None:
+                view += climatology[month]
+
+        if single:
+            return out[0]
+        return out
+
+    def batch_size(self, n_months, memory_budget=256):
+        """Find the number of trajectories emulated at once.
+
+        Parameters
+        ----------
+        n_months : int
+            length of the trajectories
+        memory_budget : int
+            maximum memory of the fields of a batch, in MB
+
+        Returns
+        -------
+        size : int
+            number of trajectories per batch
+        """
+        return int(max(
+            1, memory_budget * 1024**2 // max(1, self.field_bytes(n_months))
+        ))
+
+    def stream(self, delta_t, start_month=1, variables=None,
+               memory_budget=256):
+        """Emulate the fields of many trajectories, batch by batch.
+
+        Parameters
+        ----------
+        delta_t : arr
+            (trajectory, month) array of area-averaged warming, e.g.
+            memory-mapped; only one batch of it is read at a time
+        start_month : int
+            calendar month of the first step of the trajectories
+        variables : list
+            names of the variables, all emulated variables if None
+        memory_budget : int
+            maximum memory of the fields of a batch, in MB
+
+        Yields
+        ------
+        batch : slice
+            trajectories of the batch
+        fields : dict
+            (trajectory, month, lat, lon) array of emulated fields, per
+            variable
+        """
+        variables = variables or self.variables
+        n_trajectories, n_months = np.shape(delta_t)
+        size = self.batch_size(n_months, memory_budget)
+        logger.debug(
+            "Emulating %s trajectories, %s at a time", n_trajectories, size
+        )
+
+        for start in range(0, n_trajectories, size):
+            batch = slice(start, min(start + size, n_trajectories))
+            batch_t = np.asarray(delta_t[batch])
+            yield batch, {
+                variable: self.emulate(batch_t, variable, start_month)
+                for variable in variables
+            }
+
+    def emulate_to_files(self, delta_t, out_dir, start_month=1,
+                         variables=None, memory_budget=256):
+        """Emulate the fields of many trajectories into .npy files.
+
+        The files are memory-mapped and filled batch by batch, so the
+        ensemble can be larger than memory.
+
+        Parameters
+        ----------
+        delta_t : arr
+            (trajectory, month) array of area-averaged warming
+        out_dir : path
+            directory of the output files, one per variable
+        start_month : int
+            calendar month of the first step of the trajectories
+        variables : list
+            names of the variables, all emulated variables if None
+        memory_budget : int
+            maximum memory of the fields of a batch, in MB
+
+        Returns
+        -------
+        paths : dict
+            path to the (trajectory, month, lat, lon) array, per variable
+        """
+        variables = variables or self.variables
+        os.makedirs(out_dir, exist_ok=True)
+        paths = {
+            variable: os.path.join(out_dir, f"{variable}.npy")
+            for variable in variables
+        }
+        shape = np.shape(delta_t) + self.grid.shape
+        outputs = {
+            variable: np.lib.format.open_memmap(
+                path, mode="w+", dtype=self.dtype, shape=shape
+            )
+            for variable, path in paths.items()
+        }
+
+        size = self.batch_size(shape[1], memory_budget)
+        for start in range(0, shape[0], size):
+            batch = slice(start, min(start + size, shape[0]))
+            batch_t = np.asarray(delta_t[batch])
+            for variable, output in outputs.items():
+                self.emulate(
+                    batch_t, variable, start_month, out=output[batch]
+                )
+        for output in outputs.values():
+            output.flush()
+
+        return paths
+
+    def to_cube(self, delta_t, variable, time_coord):
+        """Emulate the fields of one trajectory as a cube.
+
+        Parameters
+        ----------
+        delta_t : arr
+            (month,) array of area-averaged warming
+        variable : str
+            name of the variable
+        time_coord : DimCoord
+            monthly time coord of the trajectory
+
+        Returns
+        -------
+        cube : cube
+            (time, lat, lon) cube of emulated fields
+        """
+        start_month = time_coord.units.num2date(time_coord.points[0]).month
+        data = self.emulate(delta_t, variable, start_month)
+
+        return iris.cube.Cube(
+            np.ma.masked_invalid(data),
+            var_name=variable,
+            units=self.units[variable],
+            dim_coords_and_dims=[
+                (time_coord, 0),
+                (self.grid.coord(dimensions=0), 1),
+                (self.grid.coord(dimensions=1), 2),
+            ],
+        )
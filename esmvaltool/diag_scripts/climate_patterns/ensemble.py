@@ -0,0 +1,270 @@
+"""Script containing multi-model statistics of climate patterns.
+
+The patterns of all models are checked to be on the same grid, stacked
+lazily, and reduced in a single chunked pass, one month of every
+variable at a time, to the multi-model mean, standard deviation,
+percentiles and sign agreement in every grid cell.
+
+Author
+------
+Gregory Munday (Met Office, UK)
+"""
+
+import logging
+import warnings
+from pathlib import Path
+
+import dask
+import dask.array as da
+import iris
+import iris.analysis
+import iris.coords
+import iris.cube
+import numpy as np
+import regression_engine as reg
+
+logger = logging.getLogger(Path(__file__).stem)
+
+ENSEMBLE_FILE = "ensemble_patterns.nc"
+
+# CF cell methods of the statistics that have one
+CELL_METHODS = {"mean": "mean", "std": "standard_deviation"}
+
+
+def same_grid(cube, reference):
+    """Check whether two cubes have the same horizontal grid.
+
+    Parameters
+    ----------
+    cube : cube
+        cube with latitude and longitude coords
+    reference : cube
+        cube on the reference grid
+
+    Returns
+    -------
+    same : bool
+        True if the latitudes and longitudes match
+    """
+    for name in ("latitude", "longitude"):
+        points = cube.coord(name).points
+        reference_points = reference.coord(name).points
+        if points.shape != reference_points.shape or not np.allclose(
+            points, reference_points
+        ):
+            return False
+
+    return True
+
+
+def load_patterns(pattern_files):
+    """Load the patterns of all models, on the grid of the first model.
+
+    Parameters
+    ----------
+    pattern_files : dict
+        path to the patterns file, per model
+
+    Returns
+    -------
+    patterns : dict
+        models and their lazy pattern cubes, in order, per variable
+    """
+    patterns = {}
+    reference = None
+    for model, path in pattern_files.items():
+        for cube in iris.load(str(path)):
+            if reference is None:
+                reference = cube
+            if not same_grid(cube, reference):
+                logger.warning(
+                    "Regridding %s patterns of %s to the grid of the "
+                    "first model",
+                    cube.var_name,
+                    model,
+                )
+                for name in ("latitude", "longitude"):
+                    for coord in (cube.coord(name), reference.coord(name)):
+                        if not coord.has_bounds():
+                            coord.guess_bounds()
+                cube = cube.regrid(
+                    reference, iris.analysis.Linear(extrapolation_mode="mask")
+                )
+            patterns.setdefault(cube.var_name, []).append((model, cube))
+
+    return patterns
+
+
+def statistic_names(percentiles):
+    """Name the statistics of the multi-model reduction, in order.
+
+    Parameters
+    ----------
+    percentiles : list
+        percentiles calculated, e.g. [5, 50, 95]
+
+    Returns
+    -------
+    names : list
+        mean, std, the percentiles (e.g. p5) and agreement
+    """
+    return (
+        ["mean", "std"] + [f"p{pct:g}" for pct in percentiles] + ["agreement"]
+    )
+
+
+def block_statistics(block, percentiles):
+    """Calculate the multi-model statistics of one chunk of patterns.
+
+    Parameters
+    ----------
+    block : arr
+        (model, ...) array of patterns, masked where missing
+    percentiles : list
+        percentiles calculated
+
+    Returns
+    -------
+    stats : arr
+        (statistic, ...) array, in the order of ``statistic_names``; NaN
+        where no model has data
+    """
+    data = np.ma.filled(np.ma.asarray(block, dtype=np.float64), np.nan)
+
+    with warnings.catch_warnings():
+        # cells without data in any model
+        warnings.simplefilter("ignore", RuntimeWarning)
+        mean = np.nanmean(data, axis=0)
+        std = np.nanstd(data, axis=0, ddof=1)
+        pcts = reg.nan_percentiles(data, percentiles)
+        # fraction of models with the sign of the multi-model mean
+        valid = np.sum(~np.isnan(data), axis=0)
+        agreement = np.sum(np.sign(data) == np.sign(mean), axis=0) / valid
+
+    return np.concatenate([mean[np.newaxis], std[np.newaxis], pcts,
+                           agreement[np.newaxis]])
+
+
+def stacked_statistics(cubes, percentiles):
+    """Lazily reduce the patterns of all models of one variable.
+
+    Parameters
+    ----------
+    cubes : list
+        (month, lat, lon) pattern cubes, one per model
+    percentiles : list
+        percentiles calculated
+
+    Returns
+    -------
+    stats : dask array
+        (statistic, month, lat, lon) array of statistics, one month per
+        chunk
+    """
+    stacked = da.stack([cube.lazy_data() for cube in cubes]).rechunk(
+        (len(cubes), 1, -1, -1)
+    )
+    n_stats = len(statistic_names(percentiles))
+
+    return da.map_blocks(
+        block_statistics,
+        stacked,
+        percentiles=percentiles,
+        chunks=((n_stats,),) + stacked.chunks[1:],
+        dtype=np.float64,
+        meta=np.array((), dtype=np.float64),
+    )
+
+
+def statistic_cube(data, cube, name, models):
+    """Create the cube of one multi-model statistic of a variable.
+
+    Parameters
+    ----------
+    data : arr
+        (month, lat, lon) array of the statistic
+    cube : cube
+        pattern cube of the first model, setting names, coords and units
+    name : str
+        name of the statistic
+    models : list
+        models in the ensemble
+
+    Returns
+    -------
+    stat_cube : cube
+        cube of the statistic
+    """
+    stat_cube = cube.copy(data=np.ma.masked_invalid(data))
+    stat_cube.var_name = f"{cube.var_name}_{name}"
+    stat_cube.long_name = f"{cube.name()}, multi-model {name}"
+    stat_cube.attributes = {
+        "ensemble_models": " ".join(models),
+        "ensemble_statistic": name,
+    }
+    if name == "agreement":
+        stat_cube.units = "1"
+        stat_cube.long_name = (
+            f"{cube.name()}, fraction of models agreeing on the sign of "
+            "the multi-model mean"
+        )
+    if name in CELL_METHODS:
+        stat_cube.add_cell_method(
+            iris.coords.CellMethod(CELL_METHODS[name], coords="model")
+        )
+
+    return stat_cube
+
+
+def ensemble_statistics(pattern_files, percentiles=(5, 50, 95)):
+    """Calculate multi-model statistics of the patterns of every variable.
+
+    All statistics of all variables are computed in one pass over the
+    stacked patterns, one month per chunk.
+
+    Parameters
+    ----------
+    pattern_files : dict
+        path to the patterns file, per model
+    percentiles : list
+        percentiles calculated
+
+    Returns
+    -------
+    cubes : cubelist
+        cubes of every statistic of every variable
+    """
+    patterns = load_patterns(pattern_files)
+    for var_name, model_cubes in patterns.items():
+        if len(model_cubes) != len(pattern_files):
+            logger.warning(
+                "%s patterns only found for %s of %s models",
+                var_name,
+                len(model_cubes),
+                len(pattern_files),
+            )
+
+    stats = dask.compute(
+        *[
+            stacked_statistics(
+                [cube for _, cube in model_cubes], list(percentiles)
+            )
+            for model_cubes in patterns.values()
+        ]
+    )
+
+    names = statistic_names(percentiles)
+    stat_cubes = iris.cube.CubeList([])
+    for model_cubes, var_stats in zip(patterns.values(), stats):
+        models = [model for model, _ in model_cubes]
+        for name, data in zip(names, var_stats):
+            stat_cubes.append(
+                statistic_cube(data, model_cubes[0][1], name, models)
+            )
+    logger.info(
+        "Calculated multi-model statistics of %s variables, %s models",
+        len(patterns),
+        len(pattern_files),
+    )
+
+    return stat_cubes
@@ -0,0 +1,265 @@
+"""Script containing the regression state used to update patterns.
+
+The per-cell sufficient statistics of the regressions, the climatologies
+and the years folded in per ensemble member are kept in a sidecar NetCDF
+file per model. New scenario years, or new ensemble members, are folded
+into the statistics, and the patterns re-derived from them, without
+reloading the historical record.
+
+Author
+------
+Gregory Munday (Met Office, UK)
+"""
+
+import logging
+import os
+from pathlib import Path
+
+import iris
+import iris.coords
+import iris.cube
+import numpy as np
+import regression_engine as reg
+
+logger = logging.getLogger(Path(__file__).stem)
+
+STATISTICS_FILE = "regression_statistics.nc"
+
+
+def parse_folded_years(attribute):
+    """Parse the folded years attribute of a statistics file.
+
+    Parameters
+    ----------
+    attribute : str
+        space-separated "member:start-end" entries
+
+    Returns
+    -------
+    folded : dict
+        first and last folded year, per ensemble member
+    """
+    folded = {}
+    for entry in attribute.split():
+        member, years = entry.rsplit(":", 1)
+        start, end = years.split("-")
+        folded[member] = (int(start), int(end))
+
+    return folded
+
+
+def format_folded_years(folded):
+    """Format folded years as the attribute of a statistics file.
+
+    Parameters
+    ----------
+    folded : dict
+        first and last folded year, per ensemble member
+
+    Returns
+    -------
+    attribute : str
+        space-separated "member:start-end" entries
+    """
+    return " ".join(
+        f"{member}:{start}-{end}"
+        for member, (start, end) in sorted(folded.items())
+    )
+
+
+def load_state(path):
+    """Load the regression state of a model.
+
+    Parameters
+    ----------
+    path : path
+        path to the statistics file
+
+    Returns
+    -------
+    state : dict
+        climatology cubes by (member, variable) ("clim"), statistics
+        cubes by variable ("stats") and folded years by member
+        ("folded"); empty if there is no statistics file yet
+    """
+    state = {"clim": {}, "stats": {}, "folded": {}}
+    if not Path(path).exists():
+        return state
+
+    for cube in iris.load(str(path)):
+        name = cube.attributes["incremental_variable"]
+        if cube.coords("statistic"):
+            state["stats"][name] = cube
+        else:
+            member = cube.attributes["incremental_member"]
+            state["clim"][member, name] = cube
+        state["folded"] = parse_folded_years(cube.attributes["folded_years"])
+    logger.info(
+        "Loaded regression statistics %s, folded years: %s",
+        path,
+        format_folded_years(state["folded"]),
+    )
+
+    return state
+
+
+def years_to_fold(folded, member, start_year, end_year, yrs=85):
+    """Find the number of new years of a member to fold into the state.
+
+    A new member is folded in over its last ``yrs`` years. The
+    statistics do not keep the years apart, so no year can be dropped
+    again: a member that was folded in before keeps its first year and
+    only its later years are added, and its window grows beyond ``yrs``
+    years, e.g. to 2016-2110 when a run to 2100 is extended to 2110. The
+    folded years are recorded in the statistics file and the patterns.
+
+    Parameters
+    ----------
+    folded : dict
+        first and last folded year, per ensemble member
+    member : str
+        ensemble member of the new data
+    start_year : int
+        first year of the new data
+    end_year : int
+        last year of the new data
+    yrs : int
+        number of years folded in for a new member
+
+    Returns
+    -------
+    n_years : int
+        number of years to fold in, from the end of the data
+    folded : dict
+        folded years, including the new ones
+    """
+    folded = dict(folded)
+    if member in folded:
+        start, last = folded[member]
+        n_years = max(end_year - last, 0)
+        end_year = max(end_year, last)
+    else:
+        start = max(end_year - yrs + 1, start_year)
+        n_years = end_year - start + 1
+    folded[member] = (start, end_year)
+
+    return n_years, folded
+
+
+def statistics_cube(stats, cell_mask, cube, tas, name):
+    """Create a cube of the monthly regression statistics of a variable.
+
+    The cube carries the names and units of the anomaly, so patterns can
+    be made from it directly.
+
+    Parameters
+    ----------
+    stats : arr
+        (month, statistic, lat, lon) array of sufficient statistics
+    cell_mask : arr
+        (month, lat, lon) boolean array, True for grid cells to skip
+    cube : cube
+        cube of the variable as anomalies
+    tas : cube
+        near-surface air temperature anomaly, one field per month
+    name : str
+        variable of the statistics, e.g. the short name
+
+    Returns
+    -------
+    stats_cube : cube
+        (imogen_drive, statistic, lat, lon) cube of statistics
+    """
+    mask = np.broadcast_to(cell_mask[:, np.newaxis], stats.shape)
+    stats_cube = iris.cube.Cube(
+        np.ma.masked_array(stats, mask=mask),
+        units=cube.units,
+        var_name=cube.var_name,
+        standard_name=cube.standard_name,
+        long_name=cube.long_name,
+        dim_coords_and_dims=[
+            (iris.coords.DimCoord(np.arange(1, 13), var_name="imogen_drive"),
+             0),
+            (tas.coord(contains_dimension=1), 2),
+            (tas.coord(contains_dimension=2), 3),
+        ],
+        aux_coords_and_dims=[
+            (iris.coords.AuxCoord(
+                np.array(reg.STATISTICS), long_name="statistic"), 1),
+        ],
+        attributes={"incremental_variable": name},
+    )
+
+    return stats_cube
+
+
+def combine_statistics(stats_cube, stats, cell_mask):
+    """Merge new statistics into stored ones.
+
+    Parameters
+    ----------
+    stats_cube : cube
+        stored statistics cube, or None
+    stats : arr
+        (month, statistic, lat, lon) array of new statistics
+    cell_mask : arr
+        (month, lat, lon) boolean array of the new data
+
+    Returns
+    -------
+    stats : arr
+        combined statistics
+    cell_mask : arr
+        combined cell mask
+    """
+    if stats_cube is None:
+        return stats, cell_mask
+
+    stored = stats_cube.data
+    stats = reg.combine_statistics(np.ma.filled(stored, 0.0), stats, axis=1)
+    cell_mask = np.ma.getmaskarray(stored).any(axis=1) | cell_mask
+
+    return stats, cell_mask
+
+
+def save_state(path, clim_cubes, stats_cubes, folded):
+    """Save the regression state of a model, replacing the old one.
+
+    HDF5 is not thread-safe, so callers writing other NetCDF files
+    from other threads at the same time hold a lock around this.
+
+    Parameters
+    ----------
+    path : path
+        path to the statistics file
+    clim_cubes : dict
+        climatology cubes by (member, variable)
+    stats_cubes : list
+        statistics cubes of all variables
+    folded : dict
+        first and last folded year, per ensemble member
+
+    Returns
+    -------
+    None
+    """
+    cubes = iris.cube.CubeList([])
+    for (member, name), clim_cube in clim_cubes.items():
+        clim_cube = clim_cube.copy()
+        clim_cube.attributes["incremental_member"] = member
+        clim_cube.attributes["incremental_variable"] = name
+        cubes.append(clim_cube)
+    cubes.extend(stats_cubes)
+    for cube in cubes:
+        cube.attributes["folded_years"] = format_folded_years(folded)
+
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    # the old file may still be read while the new one is written
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    iris.save(cubes, tmp_path, saver="nc")
+    os.replace(tmp_path, path)
+    logger.info(
+        "Saved regression statistics %s, folded years: %s",
+        path,
+        format_folded_years(folded),
+    )
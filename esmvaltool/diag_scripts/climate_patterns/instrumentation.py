@@ -0,0 +1,224 @@
+"""Script summarising the measurements of tasks per stage of the diagnostic.
+
+The scheduler measures the wall time, CPU time, peak resident memory and
+bytes read and written of every task. Tasks are grouped here into the
+stages of the diagnostic (loading, climatology, anomaly, regression,
+saving and plotting), per run, i.e. model and scenario, and the totals
+are written as CSV and logged as a table.
+
+Author
+------
+Gregory Munday (Met Office, UK)
+"""
+
+import csv
+import logging
+from pathlib import Path
+
+logger = logging.getLogger(Path(__file__).stem)
+
+STATS_FILE = "stages.csv"
+
+# stage of every kind of task, by the name in its key
+STAGES = {
+    "fractions": "load",
+    "load": "load",
+    "patterns": "load",
+    "restore": "load",
+    "resumed": "load",
+    "climatology": "climatology",
+    "anomaly": "anomaly",
+    "predictors": "regression",
+    "predictor": "regression",
+    "regression": "regression",
+    "statistics": "regression",
+    "save": "save",
+    "write": "save",
+    "checkpoint": "save",
+    "plot": "plot",
+    "ensemble": "ensemble",
+}
+
+STAGE_ORDER = (
+    "load",
+    "climatology",
+    "anomaly",
+    "regression",
+    "save",
+    "plot",
+    "ensemble",
+)
+
+COLUMNS = {
+    "tasks": "tasks",
+    "wall": "wall_s",
+    "cpu": "cpu_s",
+    "peak_rss": "peak_rss_mb",
+    "read": "read_mb",
+    "written": "written_mb",
+}
+
+
+def task_stage(key):
+    """Find the run and the stage of a task from its key.
+
+    Parameters
+    ----------
+    key : tuple
+        task key, e.g. (model, scenario, "regression", variable)
+
+    Returns
+    -------
+    run : tuple
+        part of the key before the stage, e.g. (model, scenario), or
+        (model,) for tasks shared by all scenarios of a model
+    stage : str
+        stage of the task, "other" if unknown
+    """
+    for i, name in enumerate(key):
+        if name in STAGES:
+            return tuple(key[:i]), STAGES[name]
+
+    return tuple(key), "other"
+
+
+def new_total():
+    """Make an empty total of the measurements of tasks."""
+    return {
+        "tasks": 0,
+        "wall": 0.0,
+        "cpu": 0.0,
+        "peak_rss": None,
+        "read": None,
+        "written": None,
+    }
+
+
+def add_stats(total, stats):
+    """Add the measurements of a task, or a total, to a total.
+
+    Times and bytes are summed; the peak memory is the largest of any
+    task, as tasks may run in different processes.
+
+    Parameters
+    ----------
+    total : dict
+        total, as returned by ``new_total``, updated in place
+    stats : dict
+        measurements of a task, as returned by ``scheduler.run_task``,
+        or another total
+
+    Returns
+    -------
+    None
+    """
+    total["tasks"] += stats.get("tasks", 1)
+    for name in ("wall", "cpu", "read", "written"):
+        if stats[name] is not None:
+            total[name] = (total[name] or 0.0) + stats[name]
+    if stats["peak_rss"] is not None:
+        total["peak_rss"] = max(total["peak_rss"] or 0.0, stats["peak_rss"])
+
+
+def stage_totals(stats, group=None):
+    """Total the measurements of tasks per group and stage.
+
+    Parameters
+    ----------
+    stats : dict
+        measurements of every task, by task key
+    group : function
+        function of the run of a task, returning its group, e.g. an
+        output directory, or None to leave the task out; all tasks are
+        in one group, None, if not given
+
+    Returns
+    -------
+    totals : dict
+        totals by stage, in the order of the stages, per group
+    """
+    totals = {}
+    for key, task_stats in stats.items():
+        run, stage = task_stage(key)
+        name = group(run) if group is not None else None
+        if group is not None and name is None:
+            continue
+        stages = totals.setdefault(name, {})
+        add_stats(stages.setdefault(stage, new_total()), task_stats)
+
+    order = {stage: i for i, stage in enumerate(STAGE_ORDER)}
+    return {
+        name: dict(
+            sorted(stages.items(), key=lambda item: order.get(item[0], 99))
+        )
+        for name, stages in totals.items()
+    }
+
+
+def format_value(value, precision=3):
+    """Format a measurement, empty if unknown."""
+    if value is None:
+        return ""
+    if isinstance(value, int):
+        return str(value)
+    return f"{value:.{precision}f}"
+
+
+def write_stats(path, stages):
+    """Write the totals of the stages of a run as CSV.
+
+    Parameters
+    ----------
+    path : path
+        path to the CSV file
+    stages : dict
+        totals by stage, as returned by ``stage_totals``
+
+    Returns
+    -------
+    None
+    """
+    with open(path, "w", encoding="utf-8", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(["stage"] + list(COLUMNS.values()))
+        for stage, total in stages.items():
+            writer.writerow(
+                [stage] + [format_value(total[name]) for name in COLUMNS]
+            )
+
+
+def summary_table(stages):
+    """Tabulate the totals of all stages, with an overall total.
+
+    Parameters
+    ----------
+    stages : dict
+        totals by stage, as returned by ``stage_totals``
+
+    Returns
+    -------
+    table : str
+        fixed-width table, one line per stage
+    """
+    overall = new_total()
+    for total in stages.values():
+        add_stats(overall, total)
+
+    header = ["stage", "tasks", "wall (s)", "cpu (s)", "peak rss (MB)",
+              "read (MB)", "written (MB)"]
+    rows = [
+        [stage] + [format_value(total[name], 1) for name in COLUMNS]
+        for stage, total in {**stages, "total": overall}.items()
+    ]
+    widths = [
+        max(len(row[i]) for row in [header] + rows)
+        for i in range(len(header))
+    ]
+
+    return "\n".join(
+        row[0].ljust(widths[0]) + "".join(
+            "  " + cell.rjust(width)
+            for cell, width in zip(row[1:], widths[1:])
+        )
+        for row in [header] + rows
+    )
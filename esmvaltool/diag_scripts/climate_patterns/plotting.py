@@ -1,15 +1,22 @@
 """Script containing plotting functions for driving scripts.
 
+Figures are described by small arrays, so they can be built where the
+data are and rendered elsewhere, e.g. by scheduler tasks in worker
+processes. They are drawn with the object-oriented matplotlib
+interface, without the global state of pyplot, and all map panels of a
+figure share the cell boundaries of their grid and one projection.
+
 Author
 ------
 Gregory Munday (Met Office, UK)
 """
 
-import iris.plot as iplt
-import iris.quickplot as qplt
-import matplotlib.pyplot as plt
+import cartopy.crs as ccrs
 import numpy as np
 import sub_functions as sf
+from matplotlib.figure import Figure
+
+PROJECTION = ccrs.PlateCarree()
 
 
 def subplot_positions(j):
@@ -40,48 +47,380 @@ def subplot_positions(j):
     return x_pos, y_pos
 
 
-def plot_patterns(cube_list, plot_path):
-    """Plot climate patterns for imogen_mode: off.
+class MapMesh:
+    """Cell boundaries of a grid, shared by all map panels drawn on it.
 
     Parameters
     ----------
-    cube_list : cubelist
-        input cubelist for plotting patterns per variable
-    plot_path : path
-        path to plot_dir
+    cube : cube
+        cube with latitude and longitude coords
+    """
+
+    def __init__(self, cube):
+        bounds = []
+        for name in ("longitude", "latitude"):
+            # guessing bounds on copies, so the cube is left as it is
+            coord = cube.coord(name).copy()
+            if not coord.has_bounds():
+                coord.guess_bounds()
+            bounds.append(coord.contiguous_bounds())
+        self.lon_bounds, self.lat_bounds = bounds
+
+        # global grids are rolled to start at -180, so cells need not be
+        # split at the dateline when every panel is drawn
+        self.roll = 0
+        if np.isclose(self.lon_bounds[-1] - self.lon_bounds[0], 360.0):
+            start = np.searchsorted(self.lon_bounds, 180.0)
+            if start < len(self.lon_bounds) - 1:
+                self.roll = len(self.lon_bounds) - 1 - start
+                self.lon_bounds = np.concatenate(
+                    [self.lon_bounds[start:-1] - 360.0,
+                     self.lon_bounds[:start + 1]]
+                )
+
+    def draw(self, axis, data, title, units):
+        """Draw a field as a colour mesh with a colour bar.
+
+        Parameters
+        ----------
+        axis : GeoAxes
+            map axis to draw on
+        data : arr
+            (lat, lon) field
+        title : str
+            title of the panel
+        units : str
+            label of the colour bar
+
+        Returns
+        -------
+        None
+        """
+        mesh = axis.pcolormesh(
+            self.lon_bounds,
+            self.lat_bounds,
+            np.roll(np.ma.masked_invalid(data), self.roll, axis=-1),
+            transform=PROJECTION,
+            shading="flat",
+        )
+        axis.set_title(title)
+        colorbar = axis.figure.colorbar(
+            mesh, ax=axis, orientation="horizontal"
+        )
+        colorbar.set_label(units)
+
+
+def map_figure(path, mesh, fields, shape, title, title_y=0.95):
+    """Draw a figure of map panels on the same grid, and save it.
+
+    Parameters
+    ----------
+    path : str
+        path of the figure, without extension
+    mesh : MapMesh
+        cell boundaries of the grid
+    fields : list
+        (data, title, units) of every panel, in order
+    shape : tuple
+        number of rows and columns of panels
+    title : str
+        title of the figure
+    title_y : float
+        height of the title of the figure
 
     Returns
     -------
     None
     """
-    fig, axis = plt.subplots(3, 3, figsize=(14, 12), sharex=True)
-    fig.suptitle("Patterns from a random grid-cell", fontsize=18, y=0.98)
+    fig = Figure(figsize=(14, 12))
+    fig.subplots_adjust(hspace=0.5)
+    fig.suptitle(title, fontsize=18, y=title_y)
+    for j, (data, panel_title, units) in enumerate(fields):
+        axis = fig.add_subplot(*shape, j + 1, projection=PROJECTION)
+        mesh.draw(axis, data, panel_title, units)
+
+    fig.tight_layout()
+    fig.savefig(path)
+
 
-    plt.figure(figsize=(14, 12))
-    plt.subplots_adjust(hspace=0.5)
-    plt.suptitle("Global Patterns, January", fontsize=18, y=0.95)
+def line_figure(path, lines, title):
+    """Draw a 3x3 figure of line panels, and save it.
 
-    for j, cube in enumerate(cube_list):
-        # determining plot positions
+    Parameters
+    ----------
+    path : str
+        path of the figure, without extension
+    lines : list
+        (x, y, ylabel) of every panel, in order
+    title : str
+        title of the figure
+
+    Returns
+    -------
+    None
+    """
+    fig = Figure(figsize=(14, 12))
+    axis = fig.subplots(3, 3, sharex=True)
+    fig.suptitle(title, fontsize=18, y=0.98)
+    for j, (x_val, y_val, ylabel) in enumerate(lines):
         x_pos, y_pos = subplot_positions(j)
-        months = np.arange(1, 13)
-        # plots patterns for an arbitrary grid cell
-        axis[x_pos, y_pos].plot(months, cube[:, 50, 50].data)
-        axis[x_pos,
-             y_pos].set_ylabel(str(cube.var_name) + " / " + str(cube.units))
+        axis[x_pos, y_pos].plot(x_val, y_val)
+        axis[x_pos, y_pos].set_ylabel(ylabel)
         if j > 5:
             axis[x_pos, y_pos].set_xlabel("Time")
 
-        # January patterns
-        plt.subplot(3, 3, j + 1)
-        qplt.pcolormesh(cube[0])
+    fig.tight_layout()
+    fig.savefig(path)
 
-    plt.tight_layout()
-    plt.savefig(plot_path + "Patterns")
-    plt.close()
 
-    fig.tight_layout()
-    fig.savefig(plot_path + "Patterns Timeseries")
+def series_figure(path, series):
+    """Draw the global mean regression scores of all variables, and save it.
+
+    Parameters
+    ----------
+    path : str
+        path of the figure, without extension
+    series : list
+        (months, scores, label) of every variable
+
+    Returns
+    -------
+    None
+    """
+    fig = Figure(figsize=(5, 8))
+    axis = fig.add_subplot()
+    for months, score, label in series:
+        axis.plot(months, score, label=label)
+    axis.set_xlabel("Time")
+    axis.set_ylabel("R2 Score")
+    axis.legend(loc="center left")
+
+    fig.savefig(path)
+
+
+def render(figure):
+    """Draw and save a figure.
+
+    Parameters
+    ----------
+    figure : tuple
+        drawing function and its keyword arguments, as returned by the
+        ``*_figures`` functions
+
+    Returns
+    -------
+    None
+    """
+    function, kwargs = figure
+    function(**kwargs)
+
+
+def panel_label(cube, name=None):
+    """Label the y axis of a line panel with a name and the units."""
+    return str(name or cube.var_name) + " / " + str(cube.units)
+
+
+def map_title(cube):
+    """Title a map panel with the name of a cube, as iris.quickplot does."""
+    return cube.name().replace("_", " ").capitalize()
+
+
+def grid_cell(cube):
+    """Find the grid cell whose patterns are plotted as timeseries."""
+    return min(50, cube.shape[1] - 1), min(50, cube.shape[2] - 1)
+
+
+def mean_lines(cube_list):
+    """Get the global mean timeseries of cubes as line panels.
+
+    Parameters
+    ----------
+    cube_list : cubelist
+        climatology or anomaly cubes
+
+    Returns
+    -------
+    lines : list
+        (years, global mean, ylabel) of every cube
+    """
+    means = sf.global_means(cube_list)
+
+    return [
+        (
+            (1850 + np.arange(cube.shape[0])).astype("float"),
+            means[cube.var_name],
+            panel_label(cube, cube.long_name),
+        )
+        for cube in cube_list
+    ]
+
+
+def pattern_figures(cube_list, plot_path):
+    """Describe the figures of the patterns of all variables.
+
+    Parameters
+    ----------
+    cube_list : cubelist
+        pattern cubes of all variables
+    plot_path : path
+        path to plot_dir
+
+    Returns
+    -------
+    figures : list
+        January patterns, and patterns of a grid cell as timeseries
+    """
+    lat, lon = grid_cell(cube_list[0])
+    months = np.arange(1, 13)
+    maps = [
+        (cube[0].data, map_title(cube), str(cube.units)) for cube in cube_list
+    ]
+    lines = [
+        (months, cube[:, lat, lon].data, panel_label(cube))
+        for cube in cube_list
+    ]
+
+    return [
+        (
+            map_figure,
+            {
+                "path": plot_path + "Patterns",
+                "mesh": MapMesh(cube_list[0]),
+                "fields": maps,
+                "shape": (3, 3),
+                "title": "Global Patterns, January",
+            },
+        ),
+        (
+            line_figure,
+            {
+                "path": plot_path + "Patterns Timeseries",
+                "lines": lines,
+                "title": "Patterns from a random grid-cell",
+            },
+        ),
+    ]
+
+
+def timeseries_figures(clim_lines, anom_lines, plot_path):
+    """Describe the figures of global mean climatologies and anomalies.
+
+    Parameters
+    ----------
+    clim_lines : list
+        climatology line panels, as returned by ``mean_lines``
+    anom_lines : list
+        anomaly line panels, as returned by ``mean_lines``
+    plot_path : path
+        path to plot_dir
+
+    Returns
+    -------
+    figures : list
+        climatology and anomaly timeseries figures
+    """
+    return [
+        (
+            line_figure,
+            {
+                "path": plot_path + "Climatologies",
+                "lines": clim_lines,
+                "title": "40 Year Climatologies, 1850-1889",
+            },
+        ),
+        (
+            line_figure,
+            {
+                "path": plot_path + "Anomalies",
+                "lines": anom_lines,
+                "title": "Anomaly Timeseries, 1850-2100",
+            },
+        ),
+    ]
+
+
+def score_map_figure(cube, plot_path, mesh=None):
+    """Describe the figure of the monthly regression scores of a variable.
+
+    Parameters
+    ----------
+    cube : cube
+        (month, lat, lon) score cube
+    plot_path : path
+        path to plot_dir
+    mesh : MapMesh
+        cell boundaries of the grid, shared between variables
+
+    Returns
+    -------
+    figure : tuple
+        twelve monthly score maps
+    """
+    fields = [
+        (cube[j].data, map_title(cube), str(cube.units))
+        for j in range(12)
+    ]
+
+    return (
+        map_figure,
+        {
+            "path": plot_path + "R2_Scores_" + str(cube.var_name),
+            "mesh": mesh or MapMesh(cube),
+            "fields": fields,
+            "shape": (4, 3),
+            "title": "Scores " + cube.var_name,
+            "title_y": 0.98,
+        },
+    )
+
+
+def score_series_figure(cube_list, plot_path, means=None):
+    """Describe the figure of the global mean scores of all variables.
+
+    Parameters
+    ----------
+    cube_list : cubelist
+        score cubes of all variables
+    plot_path : path
+        path to plot_dir
+    means : dict
+        global mean scores by var_name; calculated if None
+
+    Returns
+    -------
+    figure : tuple
+        global mean score timeseries
+    """
+    if means is None:
+        means = sf.global_means(cube_list)
+    series = [
+        (cube.coord(dimensions=0).points, means[cube.var_name],
+         cube.var_name)
+        for cube in cube_list
+    ]
+
+    return (
+        series_figure,
+        {"path": plot_path + "score_timeseries", "series": series},
+    )
+
+
+def plot_patterns(cube_list, plot_path):
+    """Plot climate patterns for imogen_mode: off.
+
+    Parameters
+    ----------
+    cube_list : cubelist
+        input cubelist for plotting patterns per variable
+    plot_path : path
+        path to plot_dir
+
+    Returns
+    -------
+    None
+    """
+    for figure in pattern_figures(cube_list, plot_path):
+        render(figure)
 
 
 def plot_cp_timeseries(list_cubelists, plot_path):
@@ -98,68 +437,16 @@ def plot_cp_timeseries(list_cubelists, plot_path):
     -------
     None
     """
-    fig1, ax1 = plt.subplots(3, 3, figsize=(14, 12), sharex=True)
-    fig1.suptitle("40 Year Climatologies, 1850-1889", fontsize=18, y=0.98)
-
-    fig2, ax2 = plt.subplots(3, 3, figsize=(14, 12), sharex=True)
-    fig2.suptitle("Anomaly Timeseries, 1850-2100", fontsize=18, y=0.98)
-
-    fig3, ax3 = plt.subplots(3, 3, figsize=(14, 12), sharex=True)
-    fig3.suptitle("Patterns from a random grid-cell", fontsize=18, y=0.98)
-
-    plt.figure(figsize=(14, 12))
-    plt.subplots_adjust(hspace=0.5)
-    plt.suptitle("Global Patterns, January", fontsize=18, y=0.95)
-
-    for i, cube_list in enumerate(list_cubelists):
-        for j, cube in enumerate(cube_list):
-            # determining plot positions
-            x_pos, y_pos = subplot_positions(j)
-            yrs = (1850 + np.arange(cube.shape[0])).astype("float")
-            if i == 0:
-                # climatology
-                avg_cube = sf.area_avg(cube, return_cube=False)
-                ax1[x_pos, y_pos].plot(yrs, avg_cube)
-                ax1[x_pos,
-                    y_pos].set_ylabel(cube.long_name + " / " + str(cube.units))
-                if j > 5:
-                    ax1[x_pos, y_pos].set_xlabel("Time")
-            if i == 1:
-                # anomaly timeseries
-                avg_cube = sf.area_avg(cube, return_cube=False)
-                ax2[x_pos, y_pos].plot(yrs, avg_cube)
-                ax2[x_pos,
-                    y_pos].set_ylabel(cube.long_name + " / " + str(cube.units))
-                if j > 5:
-                    ax2[x_pos, y_pos].set_xlabel("Time")
-            if i == 2:
-                months = np.arange(1, 13)
-                # avg_cube = sf.area_avg(cube, return_cube=False)
-                ax3[x_pos, y_pos].plot(months, cube[:, 50, 50].data)
-                ax3[x_pos, y_pos].set_ylabel(
-                    str(cube.var_name) + " / " + str(cube.units))
-                if j > 5:
-                    ax3[x_pos, y_pos].set_xlabel("Time")
-            if i == 2:
-                # January patterns
-                plt.subplot(3, 3, j + 1)
-                qplt.pcolormesh(cube[0])
-
-    plt.tight_layout()
-    plt.savefig(plot_path + "Patterns")
-    plt.close()
-
-    fig1.tight_layout()
-    fig1.savefig(plot_path + "Climatologies")
-
-    fig2.tight_layout()
-    fig2.savefig(plot_path + "Anomalies")
-
-    fig3.tight_layout()
-    fig3.savefig(plot_path + "Patterns Timeseries")
-
-
-def plot_scores(cube_list, plot_path):
+    figures = pattern_figures(list_cubelists[2], plot_path)
+    figures += timeseries_figures(
+        mean_lines(list_cubelists[0]), mean_lines(list_cubelists[1]),
+        plot_path,
+    )
+    for figure in figures:
+        render(figure)
+
+
+def plot_scores(cube_list, plot_path, means=None):
     """Plot color mesh of scores per variable per month.
 
     Parameters
@@ -168,31 +455,14 @@ def plot_scores(cube_list, plot_path):
         input cubelist for plotting
     plot_path : path
         path to plot_dir
+    means : dict
+        global mean scores by var_name; calculated if None
 
     Returns
     -------
     None
     """
+    mesh = MapMesh(cube_list[0])
     for cube in cube_list:
-        plt.figure(figsize=(14, 12))
-        plt.subplots_adjust(hspace=0.5)
-        plt.suptitle("Scores " + cube.var_name, fontsize=18, y=0.98)
-        for j in range(0, 12):
-            plt.subplot(4, 3, j + 1)
-            qplt.pcolormesh(cube[j])
-
-        plt.tight_layout()
-        plt.savefig(plot_path + "R2_Scores_" + str(cube.var_name))
-        plt.close()
-
-    # plot global scores timeseries per variable
-    plt.figure(figsize=(5, 8))
-    for cube in cube_list:
-        score = sf.area_avg(cube, return_cube=True)
-        iplt.plot(score, label=cube.var_name)
-        plt.xlabel("Time")
-        plt.ylabel("R2 Score")
-        plt.legend(loc="center left")
-
-    plt.savefig(plot_path + "score_timeseries")
-    plt.close()
+        render(score_map_figure(cube, plot_path, mesh))
+    render(score_series_figure(cube_list, plot_path, means))
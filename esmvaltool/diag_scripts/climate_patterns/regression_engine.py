@@ -0,0 +1,1041 @@
+"""Script containing vectorised regression functions for driving scripts.
+
+Regressions are computed in closed form for all grid cells at once, on
+the flattened (time, cell) matrix, instead of fitting one model per cell.
+For lazy data, the sufficient statistics of the regression are
+accumulated chunk by chunk along time instead, or, for data in spatial
+tiles, every tile is fitted on its own. Besides the default
+no-intercept least squares, slopes can be estimated with an intercept,
+or robustly by Theil-Sen or Huber regression, also for all cells at
+once, optionally on running means of the data. Least squares slopes
+can be bootstrapped too, with all resamples evaluated as one product of
+a matrix of resample counts with the data.
+
+Author
+------
+Gregory Munday (Met Office, UK)
+"""
+
+import functools
+import logging
+from pathlib import Path
+
+import dask.array as da
+import numpy as np
+
+logger = logging.getLogger(Path(__file__).stem)
+
+# the response is summarised by its mean and sum of squared deviations,
+# which lose no precision to cancellation when the mean is large
+STATISTICS = ("n", "sum_xx", "sum_xy", "mean_y", "m2_y")
+
+# scale of the median absolute deviation of normally distributed data
+MAD_SCALE = 0.6744897501960817
+
+
+def expand_predictor(x_val, ndim):
+    """Reshape a predictor timeseries so that it broadcasts over grid cells.
+
+    Parameters
+    ----------
+    x_val : arr
+        predictor array, time along the first axis
+    ndim : int
+        number of dimensions of the response array
+
+    Returns
+    -------
+    x_val : arr
+        predictor array with trailing length-1 axes appended
+    """
+    return x_val.reshape(x_val.shape + (1,) * (ndim - x_val.ndim))
+
+
+def valid_data(x_val, y_val):
+    """Split predictor and response into zero-filled data and a valid mask.
+
+    Parameters
+    ----------
+    x_val : arr
+        predictor array, time along the first axis
+    y_val : arr
+        (masked) response array, time along the first axis
+
+    Returns
+    -------
+    x_data : arr
+        predictor broadcast to the response shape, zero where invalid,
+        in double precision
+    y_data : arr
+        response data, zero where invalid, in double precision
+    valid : arr
+        boolean array, True where both predictor and response are valid
+    """
+    x_val = expand_predictor(x_val, np.ndim(y_val))
+    valid = ~(np.ma.getmaskarray(y_val) | np.ma.getmaskarray(x_val))
+    # sums over time of single precision data lose too many digits
+    x_data = np.where(valid, np.ma.getdata(x_val).astype(np.float64), 0.0)
+    y_data = np.where(valid, np.ma.getdata(y_val).astype(np.float64), 0.0)
+
+    return x_data, y_data, valid
+
+
+def r2_score(ss_res, ss_tot):
+    """Calculate the coefficient of determination per grid cell.
+
+    Matches ``sklearn.metrics.r2_score``: a constant response scores 1
+    when it is fitted perfectly and 0 otherwise.
+
+    Parameters
+    ----------
+    ss_res : arr
+        residual sum of squares
+    ss_tot : arr
+        total sum of squares about the mean
+
+    Returns
+    -------
+    score : arr
+        array of R2 scores
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        score = 1.0 - ss_res / ss_tot
+    constant = ss_tot == 0.0
+    score[constant] = np.where(ss_res[constant] == 0.0, 1.0, 0.0)
+
+    return score
+
+
+def ols_no_intercept(x_val, y_val, cell_mask=None):
+    """Calculate no-intercept regression slopes and scores for all cells.
+
+    Equivalent to fitting ``LinearRegression(fit_intercept=False)`` and
+    calling ``score`` for every grid cell, with masked time points
+    excluded from the cell they belong to.
+
+    Parameters
+    ----------
+    x_val : arr
+        predictor, e.g. global mean temperature, time along the first
+        axis; either 1D or broadcastable to ``y_val``
+    y_val : arr
+        (masked) response array, time along the first axis
+    cell_mask : arr
+        optional boolean array, True for grid cells to skip
+
+    Returns
+    -------
+    slope_array : arr
+        array of grid cells containing the regression slope
+    score_array : arr
+        array of grid cells containing the regression score
+    """
+    x_data, y_data, valid = valid_data(x_val, y_val)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slope_array = (x_data * y_data).sum(axis=0) / (x_data**2).sum(axis=0)
+
+    return fitted_scores(x_data, y_data, valid, slope_array, 0.0, cell_mask)
+
+
+def fitted_scores(x_data, y_data, valid, slope_array, intercept, cell_mask):
+    """Score the fitted lines of all cells, and skip cells without data.
+
+    Parameters
+    ----------
+    x_data : arr
+        predictor, as returned by ``valid_data``
+    y_data : arr
+        response, as returned by ``valid_data``
+    valid : arr
+        boolean array, True where both predictor and response are valid
+    slope_array : arr
+        array of grid cells containing the regression slope
+    intercept : arr or float
+        regression intercept per grid cell, 0 without intercept
+    cell_mask : arr
+        optional boolean array, True for grid cells to skip
+
+    Returns
+    -------
+    slope_array : arr
+        array of grid cells containing the regression slope, NaN where
+        skipped
+    score_array : arr
+        array of grid cells containing the regression score
+    """
+    n_valid = valid.sum(axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        y_mean = y_data.sum(axis=0) / n_valid
+
+    ss_res = (
+        np.where(valid, y_data - (intercept + slope_array * x_data), 0.0)**2
+    ).sum(axis=0)
+    ss_tot = (np.where(valid, y_data - y_mean, 0.0)**2).sum(axis=0)
+    score_array = r2_score(ss_res, ss_tot)
+
+    skip = n_valid == 0
+    if cell_mask is not None:
+        skip = skip | cell_mask
+    slope_array[skip] = np.nan
+    score_array[skip] = np.nan
+
+    return slope_array, score_array
+
+
+def weighted_line(x_data, y_data, weights):
+    """Fit a line with intercept to every cell by weighted least squares.
+
+    Parameters
+    ----------
+    x_data : arr
+        predictor, time along the first axis
+    y_data : arr
+        response, time along the first axis
+    weights : arr
+        weight of every point, 0 where invalid
+
+    Returns
+    -------
+    slope_array : arr
+        array of grid cells containing the regression slope
+    intercept : arr
+        array of grid cells containing the regression intercept
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sum_weights = weights.sum(axis=0)
+        x_mean = (weights * x_data).sum(axis=0) / sum_weights
+        y_mean = (weights * y_data).sum(axis=0) / sum_weights
+        x_dev = x_data - x_mean
+        slope_array = (weights * x_dev * (y_data - y_mean)).sum(axis=0) / (
+            weights * x_dev**2
+        ).sum(axis=0)
+
+    return slope_array, y_mean - slope_array * x_mean
+
+
+def ols_intercept(x_val, y_val, cell_mask=None):
+    """Calculate least squares slopes and scores, with intercept.
+
+    Parameters
+    ----------
+    x_val : arr
+        predictor, time along the first axis; either 1D or
+        broadcastable to ``y_val``
+    y_val : arr
+        (masked) response array, time along the first axis
+    cell_mask : arr
+        optional boolean array, True for grid cells to skip
+
+    Returns
+    -------
+    slope_array : arr
+        array of grid cells containing the regression slope
+    score_array : arr
+        array of grid cells containing the regression score
+    """
+    x_data, y_data, valid = valid_data(x_val, y_val)
+    slope_array, intercept = weighted_line(x_data, y_data, valid)
+
+    return fitted_scores(
+        x_data, y_data, valid, slope_array, intercept, cell_mask
+    )
+
+
+def nan_median(data):
+    """Calculate the median along the first axis, ignoring NaNs.
+
+    Unlike ``np.nanmedian``, cells with missing data are not looped over
+    in Python: the array is sorted once, or only partitioned if every
+    cell is either complete or empty.
+
+    Parameters
+    ----------
+    data : arr
+        array, NaN where missing
+
+    Returns
+    -------
+    median : arr
+        median of every cell, NaN where all values are missing
+    """
+    n_total = data.shape[0]
+    n_valid = np.sum(~np.isnan(data), axis=0)
+    if np.all((n_valid == n_total) | (n_valid == 0)):
+        middle = [(n_total - 1) // 2, n_total // 2]
+        ordered = np.partition(data, middle, axis=0)
+        median = (ordered[middle[0]] + ordered[middle[1]]) / 2.0
+    else:
+        # NaNs are sorted last, after the valid values of every cell
+        ordered = np.sort(data, axis=0)
+        lower = np.maximum(n_valid - 1, 0) // 2
+        upper = np.minimum(n_valid // 2, n_total - 1)
+        median = (
+            np.take_along_axis(ordered, lower[np.newaxis], axis=0)[0]
+            + np.take_along_axis(ordered, upper[np.newaxis], axis=0)[0]
+        ) / 2.0
+
+    return np.where(n_valid > 0, median, np.nan)
+
+
+def nan_percentiles(data, percentiles):
+    """Calculate percentiles along the first axis, ignoring NaNs.
+
+    Matches ``np.nanpercentile`` with linear interpolation, but sorts the
+    whole array at once, rather than looping over the cells with missing
+    data in Python.
+
+    Parameters
+    ----------
+    data : arr
+        array, NaN where missing
+    percentiles : list
+        percentiles calculated
+
+    Returns
+    -------
+    pcts : arr
+        (percentile, ...) array; NaN where all values are missing
+    """
+    # NaNs are sorted last, after the valid values of every cell
+    ordered = np.sort(data, axis=0)
+    n_valid = np.sum(~np.isnan(data), axis=0)
+    position = (
+        np.asarray(percentiles, dtype=np.float64).reshape(
+            (-1,) + (1,) * (data.ndim - 1)
+        )
+        / 100.0
+        * np.maximum(n_valid - 1, 0)
+    )
+    lower = np.floor(position).astype(int)
+    upper = np.minimum(lower + 1, np.maximum(n_valid - 1, 0))
+    low = np.take_along_axis(ordered, lower, axis=0)
+    high = np.take_along_axis(ordered, upper, axis=0)
+    pcts = low + (high - low) * (position - lower)
+
+    return np.where(n_valid > 0, pcts, np.nan)
+
+
+def theil_sen(x_val, y_val, cell_mask=None, memory_budget=256):
+    """Calculate Theil-Sen slopes and scores, with intercept.
+
+    The slope of every cell is the median of the slopes between all pairs
+    of its valid points, and the intercept the median of the residuals.
+    Pairs are formed for blocks of cells at a time, so the pairwise
+    slopes of one block fit in the memory budget.
+
+    Parameters
+    ----------
+    x_val : arr
+        predictor, time along the first axis; either 1D or
+        broadcastable to ``y_val``
+    y_val : arr
+        (masked) response array, time along the first axis
+    cell_mask : arr
+        optional boolean array, True for grid cells to skip
+    memory_budget : int
+        maximum size of the pairwise slopes of a block of cells, in MB
+
+    Returns
+    -------
+    slope_array : arr
+        array of grid cells containing the regression slope
+    score_array : arr
+        array of grid cells containing the regression score
+    """
+    x_data, y_data, valid = valid_data(x_val, y_val)
+    n_time = y_data.shape[0]
+    cells = (n_time, -1)
+    x_cells = x_data.reshape(cells)
+    y_cells = y_data.reshape(cells)
+    valid_cells = valid.reshape(cells)
+
+    first, second = np.triu_indices(n_time, k=1)
+    block = int(max(1, memory_budget * 1024**2 // max(1, 8 * len(first))))
+    slope_array = np.empty(x_cells.shape[1])
+    for start in range(0, x_cells.shape[1], block):
+        part = slice(start, start + block)
+        x_diff = x_cells[second, part] - x_cells[first, part]
+        in_pair = (
+            valid_cells[first, part]
+            & valid_cells[second, part]
+            & (x_diff != 0.0)
+        )
+        with np.errstate(divide="ignore", invalid="ignore"):
+            slopes = np.where(
+                in_pair,
+                (y_cells[second, part] - y_cells[first, part]) / x_diff,
+                np.nan,
+            )
+        slope_array[part] = nan_median(slopes)
+
+    slope_array = slope_array.reshape(y_data.shape[1:])
+    intercept = nan_median(
+        np.where(valid, y_data - slope_array * x_data, np.nan)
+    )
+
+    return fitted_scores(
+        x_data, y_data, valid, slope_array, intercept, cell_mask
+    )
+
+
+def huber(x_val, y_val, cell_mask=None, epsilon=1.345, max_iter=50,
+          tol=1e-6):
+    """Calculate Huber regression slopes and scores, with intercept.
+
+    Fitted by iteratively reweighted least squares for all cells at
+    once: points with residuals beyond epsilon robust standard
+    deviations (the scaled median absolute deviation) are down-weighted,
+    starting from the least squares line. Only cells whose slopes still
+    change are refitted.
+
+    Parameters
+    ----------
+    x_val : arr
+        predictor, time along the first axis; either 1D or
+        broadcastable to ``y_val``
+    y_val : arr
+        (masked) response array, time along the first axis
+    cell_mask : arr
+        optional boolean array, True for grid cells to skip
+    epsilon : float
+        threshold of the Huber loss, in robust standard deviations
+    max_iter : int
+        maximum number of iterations
+    tol : float
+        relative change of the slopes at which iterations stop
+
+    Returns
+    -------
+    slope_array : arr
+        array of grid cells containing the regression slope
+    score_array : arr
+        array of grid cells containing the regression score
+    """
+    x_data, y_data, valid = valid_data(x_val, y_val)
+    n_time = y_data.shape[0]
+    x_cells = x_data.reshape(n_time, -1)
+    y_cells = y_data.reshape(n_time, -1)
+    valid_cells = valid.reshape(n_time, -1)
+    slope_array, intercept = weighted_line(x_cells, y_cells, valid_cells)
+
+    active = np.flatnonzero(np.isfinite(slope_array))
+    for _ in range(max_iter):
+        if active.size == 0:
+            break
+        x_act = x_cells[:, active]
+        y_act = y_cells[:, active]
+        valid_act = valid_cells[:, active]
+        residual = np.where(
+            valid_act,
+            y_act - (intercept[active] + slope_array[active] * x_act),
+            np.nan,
+        )
+        scale = (
+            nan_median(np.abs(residual - nan_median(residual))) / MAD_SCALE
+        )
+        with np.errstate(divide="ignore", invalid="ignore"):
+            weights = np.where(
+                valid_act,
+                np.minimum(1.0, epsilon * scale / np.abs(residual)),
+                0.0,
+            )
+        # exact fits, and cells fitted exactly by most points, keep
+        # the weights of least squares
+        weights = np.where(np.isnan(weights), valid_act, weights)
+
+        previous = slope_array[active]
+        slope_array[active], intercept[active] = weighted_line(
+            x_act, y_act, weights
+        )
+        with np.errstate(invalid="ignore"):
+            changed = np.abs(slope_array[active] - previous) > tol * (
+                np.abs(previous) + tol
+            )
+        active = active[changed]
+
+    return fitted_scores(
+        x_data,
+        y_data,
+        valid,
+        slope_array.reshape(y_data.shape[1:]),
+        intercept.reshape(y_data.shape[1:]),
+        cell_mask,
+    )
+
+
+ESTIMATORS = {
+    "ols": ols_no_intercept,
+    "ols_intercept": ols_intercept,
+    "theil_sen": theil_sen,
+    "huber": huber,
+}
+
+
+def running_means(data, window):
+    """Calculate running means along the first axis, e.g. over years.
+
+    Parameters
+    ----------
+    data : arr
+        (masked) array, time along the first axis
+    window : int
+        number of points averaged
+
+    Returns
+    -------
+    means : arr
+        masked array of the means of every window of complete data, one
+        shorter than data per point of the window beyond the first
+    """
+    if window <= 1:
+        return data
+
+    mask = np.ma.getmaskarray(data)
+    filled = np.where(mask, 0.0, np.ma.getdata(data))
+    zero = np.zeros((1,) + filled.shape[1:])
+    sums = np.cumsum(np.concatenate([zero, filled]), axis=0)
+    counts = np.cumsum(np.concatenate([zero, ~mask]), axis=0)
+
+    return np.ma.masked_where(
+        counts[window:] - counts[:-window] < window,
+        (sums[window:] - sums[:-window]) / window,
+    )
+
+
+def fit(x_val, y_val, estimator="ols", cell_mask=None, running_mean=1):
+    """Estimate regression slopes and scores for all cells.
+
+    Parameters
+    ----------
+    x_val : arr
+        predictor, time along the first axis; either 1D or
+        broadcastable to ``y_val``
+    y_val : arr
+        (masked) response array, time along the first axis
+    estimator : str
+        options: ols (no intercept), ols_intercept, theil_sen, huber
+    cell_mask : arr
+        optional boolean array, True for grid cells to skip
+    running_mean : int
+        regress running means of this many points, e.g. years of one
+        month, rather than the points themselves
+
+    Returns
+    -------
+    slope_array : arr
+        array of grid cells containing the regression slope
+    score_array : arr
+        array of grid cells containing the regression score
+
+    Raises
+    ------
+    ValueError
+        if the estimator is unknown, or the running mean longer than the
+        data
+    """
+    if estimator not in ESTIMATORS:
+        raise ValueError(
+            f"Unknown estimator '{estimator}', choose from {tuple(ESTIMATORS)}"
+        )
+    if running_mean > np.shape(y_val)[0]:
+        raise ValueError(
+            f"Running mean of {running_mean} points is longer than the "
+            f"{np.shape(y_val)[0]} points regressed"
+        )
+
+    return ESTIMATORS[estimator](
+        running_means(x_val, running_mean),
+        running_means(y_val, running_mean),
+        cell_mask=cell_mask,
+    )
+
+
+def sufficient_statistics(x_val, y_val):
+    """Calculate the sufficient statistics of the regression per grid cell.
+
+    Statistics are returned in the order of ``STATISTICS``: number of
+    valid points, sum(x^2), sum(xy), the mean of y and the sum of squared
+    deviations of y from its mean. They can be merged over time chunks
+    with ``combine_statistics`` and turned into slopes and scores with
+    ``ols_from_statistics``.
+
+    Parameters
+    ----------
+    x_val : arr
+        predictor, time along the first axis
+    y_val : arr
+        (masked) response array, time along the first axis
+
+    Returns
+    -------
+    stats : arr
+        array of statistics stacked along the first axis
+    """
+    x_data, y_data, valid = valid_data(x_val, y_val)
+    n_valid = valid.sum(axis=0).astype(np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        y_mean = np.where(n_valid > 0, y_data.sum(axis=0) / n_valid, 0.0)
+    stats = np.stack(
+        [
+            n_valid,
+            (x_data**2).sum(axis=0),
+            (x_data * y_data).sum(axis=0),
+            y_mean,
+            (np.where(valid, y_data - y_mean, 0.0)**2).sum(axis=0),
+        ]
+    )
+
+    return stats
+
+
+def combine_statistics(first, second, axis=0):
+    """Merge the sufficient statistics of two sets of time points.
+
+    Means and sums of squared deviations are merged with the pairwise
+    update of Chan et al. (1979), so no precision is lost for large
+    means.
+
+    Parameters
+    ----------
+    first : arr
+        array of statistics, as returned by ``sufficient_statistics``
+    second : arr
+        array of statistics of other time points, of the same shape
+    axis : int
+        axis of the statistics
+
+    Returns
+    -------
+    stats : arr
+        array of the statistics of all time points
+    """
+    first = np.moveaxis(np.asarray(first, dtype=np.float64), axis, 0)
+    second = np.moveaxis(np.asarray(second, dtype=np.float64), axis, 0)
+    n_first, n_second = first[0], second[0]
+    n_valid = n_first + n_second
+    delta = second[3] - first[3]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        weight = np.where(n_valid > 0, n_second / n_valid, 0.0)
+    stats = np.stack(
+        [
+            n_valid,
+            first[1] + second[1],
+            first[2] + second[2],
+            first[3] + delta * weight,
+            first[4] + second[4] + delta**2 * n_first * weight,
+        ]
+    )
+
+    return np.moveaxis(stats, 0, axis)
+
+
+def ols_from_statistics(stats, cell_mask=None):
+    """Calculate no-intercept slopes and scores from sufficient statistics.
+
+    Parameters
+    ----------
+    stats : arr
+        array of statistics stacked along the first axis, as returned by
+        ``sufficient_statistics``
+    cell_mask : arr
+        optional boolean array, True for grid cells to skip
+
+    Returns
+    -------
+    slope_array : arr
+        array of grid cells containing the regression slope
+    score_array : arr
+        array of grid cells containing the regression score
+    """
+    n_valid, sum_xx, sum_xy, y_mean, ss_tot = np.asarray(
+        stats, dtype=np.float64
+    )
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slope_array = sum_xy / sum_xx
+    # residuals about the fitted line through the origin
+    ss_res = np.maximum(
+        ss_tot + n_valid * y_mean**2 - slope_array * sum_xy, 0.0
+    )
+    score_array = r2_score(ss_res, ss_tot)
+
+    skip = n_valid == 0
+    if cell_mask is not None:
+        skip = skip | cell_mask
+    slope_array[skip] = np.nan
+    score_array[skip] = np.nan
+
+    return slope_array, score_array
+
+
+def merge_blocks(stats, axis=None, keepdims=False):
+    """Merge the statistics of blocks stacked along the first axis.
+
+    Parameters
+    ----------
+    stats : arr
+        (block, group, statistic, ...) array of statistics
+    axis : tuple
+        axis of the blocks, always the first one
+    keepdims : bool
+        keep the axis of the blocks, with length 1
+
+    Returns
+    -------
+    stats : arr
+        merged (group, statistic, ...) array of statistics
+    """
+    merged = functools.reduce(
+        functools.partial(combine_statistics, axis=1), stats
+    )
+    if keepdims:
+        merged = merged[np.newaxis]
+
+    return merged
+
+
+def grouped_statistics(x_val, y_val, groups, n_groups):
+    """Accumulate sufficient statistics per group over time chunks.
+
+    Each time chunk of the (lazy) response is reduced to its statistics
+    on its own, so only one chunk per worker is held in memory, and the
+    statistics of the chunks are merged with ``combine_statistics``.
+
+    Parameters
+    ----------
+    x_val : arr
+        1D predictor, one value per timestep
+    y_val : dask array
+        lazy response array, time along the first axis
+    groups : arr
+        integer group, e.g. month index, of every timestep
+    n_groups : int
+        number of groups
+
+    Returns
+    -------
+    stats : dask array
+        lazy (group, statistic, ...) array of summed statistics
+    """
+    x_val = np.asarray(x_val)
+    groups = np.asarray(groups)
+
+    def block_statistics(block, block_info=None):
+        start, stop = block_info[0]["array-location"][0]
+        block_groups = groups[start:stop]
+        stats = np.zeros(
+            (1, n_groups, len(STATISTICS)) + block.shape[1:]
+        )
+        for group in np.unique(block_groups):
+            in_group = block_groups == group
+            stats[0, group] = sufficient_statistics(
+                x_val[start:stop][in_group], block[in_group]
+            )
+        return stats
+
+    stats = y_val.map_blocks(
+        block_statistics,
+        new_axis=[1, 2],
+        chunks=((1,) * y_val.numblocks[0], (n_groups,), (len(STATISTICS),))
+        + y_val.chunks[1:],
+        dtype=np.float64,
+        meta=np.array((), dtype=np.float64),
+    )
+
+    return da.reduction(
+        stats,
+        merge_blocks,
+        merge_blocks,
+        combine=merge_blocks,
+        axis=0,
+        dtype=np.float64,
+        concatenate=True,
+        meta=np.array((), dtype=np.float64),
+    )
+
+
+def resample_counts(n_points, n_resamples, block_length=1, seed=0):
+    """Draw bootstrap resamples as counts of every point in every resample.
+
+    Resamples are drawn by the moving block bootstrap: runs of
+    ``block_length`` consecutive points, from random starts, until the
+    resample is as long as the data. Blocks of one point are the plain
+    bootstrap.
+
+    Parameters
+    ----------
+    n_points : int
+        number of points, e.g. years
+    n_resamples : int
+        number of resamples
+    block_length : int
+        number of consecutive points drawn together
+    seed : int
+        seed of the random generator, so resamples are reproducible
+
+    Returns
+    -------
+    counts : arr
+        (resample, point) array of how often every point is drawn
+
+    Raises
+    ------
+    ValueError
+        if the blocks are longer than the data
+    """
+    if not 1 <= block_length <= n_points:
+        raise ValueError(
+            f"Bootstrap blocks of {block_length} points do not fit in "
+            f"{n_points} points"
+        )
+    rng = np.random.default_rng(seed)
+    n_blocks = -(-n_points // block_length)
+    starts = rng.integers(
+        0, n_points - block_length + 1, size=(n_resamples, n_blocks)
+    )
+    indices = (
+        starts[:, :, np.newaxis] + np.arange(block_length)
+    ).reshape(n_resamples, -1)[:, :n_points]
+    counts = np.zeros((n_resamples, n_points))
+    np.add.at(counts, (np.arange(n_resamples)[:, np.newaxis], indices), 1.0)
+
+    return counts
+
+
+def bootstrap(x_val, y_val, estimator="ols", cell_mask=None, running_mean=1,
+              resamples=1000, block_length=1, percentiles=(5, 95), seed=0,
+              memory_budget=256):
+    """Bootstrap the standard errors and percentiles of slopes of all cells.
+
+    The least squares slopes of every resample are ratios of weighted
+    sums, so all resamples are evaluated at once as products of the
+    (resample, time) matrix of counts with the (time, cell) data, for
+    blocks of cells whose slopes fit in the memory budget. The same
+    resamples are drawn for every call with the same seed and length.
+
+    Parameters
+    ----------
+    x_val : arr
+        predictor, time along the first axis; either 1D or
+        broadcastable to ``y_val``
+    y_val : arr
+        (masked) response array, time along the first axis
+    estimator : str
+        options: ols (no intercept), ols_intercept
+    cell_mask : arr
+        optional boolean array, True for grid cells to skip
+    running_mean : int
+        resample running means of this many points, rather than the
+        points themselves
+    resamples : int
+        number of bootstrap resamples
+    block_length : int
+        number of consecutive points resampled together
+    percentiles : list
+        percentiles of the bootstrapped slopes
+    seed : int
+        seed of the random generator
+    memory_budget : int
+        maximum size of the resampled sums of a block of cells, in MB
+
+    Returns
+    -------
+    uncertainty : arr
+        (1 + percentile, ...) array of the standard error of the slopes,
+        followed by their percentiles; NaN for skipped cells
+
+    Raises
+    ------
+    ValueError
+        if the estimator is not a least squares one
+    """
+    if estimator not in ("ols", "ols_intercept"):
+        raise ValueError(
+            f"Bootstrap needs a least squares estimator, not '{estimator}'"
+        )
+    shared_x = np.ndim(x_val) == 1
+    x_data, y_data, valid = valid_data(
+        running_means(x_val, running_mean), running_means(y_val, running_mean)
+    )
+    n_time = y_data.shape[0]
+    counts = resample_counts(n_time, resamples, block_length, seed)
+    skip = ~valid.any(axis=0)
+    if cell_mask is not None:
+        skip = skip | cell_mask
+    # only cells with data are resampled, e.g. not masked ocean cells
+    fitted = ~np.broadcast_to(skip, y_data.shape[1:]).ravel()
+    x_cells = x_data.reshape(n_time, -1)[:, fitted]
+    y_cells = y_data.reshape(n_time, -1)[:, fitted]
+    valid_cells = valid.reshape(n_time, -1)[:, fitted].astype(np.float64)
+
+    # about six (resample, cell) arrays are held at once
+    block = int(max(1, memory_budget * 1024**2 // (6 * 8 * resamples)))
+    spread = np.empty((1 + len(percentiles), x_cells.shape[1]))
+    for start in range(0, x_cells.shape[1], block):
+        part = slice(start, start + block)
+        x_part = x_cells[:, part]
+        y_part = y_cells[:, part]
+        sum_xy = counts @ (x_part * y_part)
+        valid_part = valid_cells[:, part]
+        if shared_x and valid_part.all():
+            # the sums of x are the same for all cells of the block
+            x_part = x_part[:, :1]
+            valid_part = valid_part[:, :1]
+        sum_xx = counts @ x_part**2
+        with np.errstate(divide="ignore", invalid="ignore"):
+            if estimator == "ols_intercept":
+                n_valid = counts @ valid_part
+                sum_x = counts @ x_part
+                sum_y = counts @ y_part
+                slopes = (sum_xy - sum_x * sum_y / n_valid) / (
+                    sum_xx - sum_x**2 / n_valid
+                )
+            else:
+                slopes = sum_xy / sum_xx
+        spread[:, part] = slope_spread(slopes, percentiles)
+
+    uncertainty = np.full((len(spread), fitted.size), np.nan)
+    uncertainty[:, fitted] = spread
+
+    return uncertainty.reshape((-1,) + y_data.shape[1:])
+
+
+def fit_and_bootstrap(x_val, y_val, estimator="ols", cell_mask=None,
+                      running_mean=1, **kwargs):
+    """Estimate slopes and scores, and bootstrap their uncertainty.
+
+    Parameters
+    ----------
+    x_val : arr
+        predictor, time along the first axis; either 1D or
+        broadcastable to ``y_val``
+    y_val : arr
+        (masked) response array, time along the first axis
+    estimator : str
+        options: ols (no intercept), ols_intercept
+    cell_mask : arr
+        optional boolean array, True for grid cells to skip
+    running_mean : int
+        regress running means of this many points
+    **kwargs : dict
+        resamples, block_length and percentiles of ``bootstrap``
+
+    Returns
+    -------
+    results : arr
+        (2 + 1 + percentile, ...) array of slopes, scores, standard
+        errors and percentiles of the slopes
+    """
+    slope_array, score_array = fit(
+        x_val, y_val, estimator, cell_mask, running_mean
+    )
+    uncertainty = bootstrap(
+        x_val, y_val, estimator, cell_mask, running_mean, **kwargs
+    )
+
+    return np.concatenate(
+        [slope_array[np.newaxis], score_array[np.newaxis], uncertainty]
+    )
+
+
+def slope_spread(slopes, percentiles):
+    """Calculate the standard error and percentiles of resampled slopes.
+
+    Parameters
+    ----------
+    slopes : arr
+        (resample, cell) array of slopes, NaN or infinite where a
+        resample could not be fitted
+    percentiles : list
+        percentiles of the slopes
+
+    Returns
+    -------
+    spread : arr
+        (1 + percentile, cell) array of the standard deviation of the
+        slopes, followed by their percentiles
+    """
+    spread = np.empty((1 + len(percentiles), slopes.shape[1]))
+    finite = np.isfinite(slopes)
+    if finite.all():
+        spread[0] = slopes.std(axis=0, ddof=1)
+        spread[1:] = np.percentile(slopes, percentiles, axis=0)
+        return spread
+
+    slopes = np.where(finite, slopes, np.nan)
+    n_slopes = finite.sum(axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = np.where(finite, slopes, 0.0).sum(axis=0) / n_slopes
+        spread[0] = np.where(
+            n_slopes > 1,
+            np.sqrt(
+                (np.where(finite, slopes - mean, 0.0)**2).sum(axis=0)
+                / (n_slopes - 1)
+            ),
+            np.nan,
+        )
+    spread[1:] = nan_percentiles(slopes, percentiles)
+
+    return spread
+
+
+def tiled_apply(function, n_outputs, x_val, y_val, groups, n_groups,
+                cell_mask=None, **kwargs):
+    """Apply a regression function to every group of a lazy array, by tile.
+
+    Parameters
+    ----------
+    function : function
+        function of the predictor and response of a group, with a
+        cell_mask keyword, e.g. ``fit`` or ``bootstrap``, returning
+        n_outputs arrays of grid cells
+    n_outputs : int
+        number of arrays returned by the function
+    x_val : arr
+        1D predictor, one value per timestep
+    y_val : dask array
+        lazy response array, time along the first axis
+    groups : arr
+        integer group, e.g. month index, of every timestep
+    n_groups : int
+        number of groups
+    cell_mask : arr
+        optional (group, ...) boolean array, True for grid cells to skip
+    **kwargs : dict
+        further keyword arguments of the function
+
+    Returns
+    -------
+    results : dask array
+        lazy (group, output, ...) array
+    """
+    x_val = np.asarray(x_val)
+    groups = np.asarray(groups)
+
+    def block_apply(block, block_info=None):
+        cells = tuple(
+            slice(*loc) for loc in block_info[0]["array-location"][1:]
+        )
+        results = np.full((n_groups, n_outputs) + block.shape[1:], np.nan)
+        for group in range(n_groups):
+            in_group = groups == group
+            results[group] = function(
+                x_val[in_group],
+                block[in_group],
+                cell_mask=(
+                    None if cell_mask is None else cell_mask[group][cells]
+                ),
+                **kwargs,
+            )
+        return results
+
+    y_val = y_val.rechunk({0: -1})
+
+    return y_val.map_blocks(
+        block_apply,
+        new_axis=[1],
+        chunks=((n_groups,), (n_outputs,)) + y_val.chunks[1:],
+        dtype=np.float64,
+        meta=np.array((), dtype=np.float64),
+    )
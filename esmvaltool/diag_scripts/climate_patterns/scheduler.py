@@ -0,0 +1,706 @@
+"""Script containing a task scheduler for driving scripts.
+
+Work is split into small tasks, e.g. per model and variable, with
+explicit dependencies between them. Tasks are run on a pool of process
+or thread workers as soon as their dependencies have finished. The wall
+time, CPU time, peak resident memory and bytes read and written of
+every task are recorded, from /proc where available, at the cost of
+reading a few small files per task. The peak memory of the process is
+only reset in worker processes, never in the main one. Failed tasks can
+be retried, and their failures isolated: the tasks depending on them are
+skipped, and all other tasks still run. On the process backend, tasks
+can be grouped, e.g. by model: every group runs in one worker process,
+so the data passed between its tasks stay in that process, and only the
+results other groups depend on are sent back. The worker processes share
+their workers, so a free worker takes the next task of any group.
+
+Author
+------
+Gregory Munday (Met Office, UK)
+"""
+
+import heapq
+import logging
+import multiprocessing
+import os
+import resource
+import sys
+import time
+from concurrent import futures
+from pathlib import Path
+
+logger = logging.getLogger(Path(__file__).stem)
+
+BACKENDS = ("serial", "thread", "process")
+
+# workers shared by the groups run in the worker processes of a pool
+_WORKER_SLOTS = None
+
+
+def limit_memory(memory_limit):
+    """Limit the memory of the current worker process.
+
+    Parameters
+    ----------
+    memory_limit : int
+        maximum size of the data segment (heap) of the process, in MB
+
+    Returns
+    -------
+    None
+    """
+    limit = int(memory_limit * 1024**2)
+    resource.setrlimit(resource.RLIMIT_DATA, (limit, limit))
+
+
+def init_worker(memory_limit, slots):
+    """Set up a worker process of the pool.
+
+    Parameters
+    ----------
+    memory_limit : int
+        maximum memory of the process in MB, or None
+    slots : Semaphore
+        workers shared by the groups run in all worker processes, or None
+
+    Returns
+    -------
+    None
+    """
+    global _WORKER_SLOTS
+    if memory_limit:
+        limit_memory(memory_limit)
+    _WORKER_SLOTS = slots
+
+
+def io_counters():
+    """Read the bytes read and written by the current process so far.
+
+    Returns
+    -------
+    counters : tuple
+        bytes read and written, including cached reads and writes, or
+        None where /proc/self/io is not available
+    """
+    try:
+        with open("/proc/self/io", encoding="utf-8") as file:
+            fields = dict(line.split(":", 1) for line in file)
+        return int(fields["rchar"]), int(fields["wchar"])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def reset_peak_rss():
+    """Reset the peak resident set size of the current process.
+
+    Returns
+    -------
+    reset : bool
+        True if the peak was reset, which needs Linux
+    """
+    try:
+        with open("/proc/self/clear_refs", "w", encoding="utf-8") as file:
+            file.write("5")
+    except OSError:
+        return False
+
+    return True
+
+
+def peak_rss():
+    """Get the peak resident set size of the current process, in MB.
+
+    Returns
+    -------
+    peak : float
+        peak since it was last reset, or since the process started where
+        it cannot be reset
+    """
+    try:
+        with open("/proc/self/status", encoding="utf-8") as file:
+            for line in file:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except (OSError, ValueError):
+        pass
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        # in bytes rather than kB
+        peak /= 1024
+
+    return peak / 1024
+
+
+def in_worker_process():
+    """Check whether the current process is a worker of a process pool.
+
+    Returns
+    -------
+    worker : bool
+        True if the process was started by ``multiprocessing``
+    """
+    return multiprocessing.parent_process() is not None
+
+
+def run_task(function, args, isolated=True, reset_peak=False):
+    """Run a single task, and measure its time, memory and I/O.
+
+    The peak memory of the process is only reset in worker processes,
+    as other tools may read that of the main process. Without a reset,
+    the peak of a task is only known if it raised the peak of the
+    process, and None otherwise.
+
+    Parameters
+    ----------
+    function : function
+        task function
+    args : tuple
+        arguments of the task function
+    isolated : bool
+        the task runs alone in its process; if not, e.g. on a thread
+        worker, CPU time is that of the worker thread only, and I/O is
+        not recorded
+    reset_peak : bool
+        reset the peak memory of the process before the task, in worker
+        processes running one task at a time
+
+    Returns
+    -------
+    result : any
+        result of the task function
+    stats : dict
+        wall and CPU time in seconds ("wall", "cpu"), peak resident set
+        size in MB ("peak_rss"), and MB read and written ("read",
+        "written"), None where unknown
+    """
+    cpu_time = time.process_time if isolated else time.thread_time
+    reset = reset_peak and isolated and reset_peak_rss()
+    peak_start = peak_rss()
+    if isolated:
+        io_start = io_counters()
+    start = time.perf_counter()
+    cpu_start = cpu_time()
+
+    result = function(*args)
+
+    stats = {
+        "wall": time.perf_counter() - start,
+        "cpu": cpu_time() - cpu_start,
+        "peak_rss": peak_rss(),
+        "read": None,
+        "written": None,
+    }
+    if not reset and stats["peak_rss"] <= peak_start:
+        # the task stayed below an earlier peak of the process
+        stats["peak_rss"] = None
+    if isolated:
+        io_end = io_counters()
+        if io_start is not None and io_end is not None:
+            stats["read"] = (io_end[0] - io_start[0]) / 1024**2
+            stats["written"] = (io_end[1] - io_start[1]) / 1024**2
+
+    return result, stats
+
+
+def run_group(tasks, exported, options, upstream):
+    """Run the tasks of a group in the current process.
+
+    Parameters
+    ----------
+    tasks : dict
+        function, arguments and dependencies of the tasks, by task key
+    exported : set
+        keys of the tasks whose results are depended on by other groups
+    options : dict
+        keyword arguments of the ``Scheduler`` of the group
+    upstream : list
+        outcomes of the groups this group depends on, as returned by
+        this function
+
+    Returns
+    -------
+    outcome : dict
+        results of the exported tasks, and of the tasks no task depends
+        on ("results"), and the measurements, failures and skipped tasks
+        of the group ("stats", "failures", "skipped")
+    """
+    done = {}
+    failed = {}
+    for outcome in upstream:
+        done.update(outcome["results"])
+        failed.update(outcome["skipped"])
+        failed.update({key: key for key in outcome["failures"]})
+
+    scheduler = Scheduler(**options)
+    scheduler.slots = _WORKER_SLOTS
+    scheduler.tasks = dict(tasks)
+    results = scheduler.run(done=done, failed=failed, keep=exported)
+
+    return {
+        "results": results,
+        "stats": scheduler.stats,
+        "failures": scheduler.failures,
+        "skipped": scheduler.skipped,
+    }
+
+
+def task_keys(depends):
+    """Flatten task dependencies into a list of task keys.
+
+    Parameters
+    ----------
+    depends : tuple
+        dependencies, each a task key or a list of task keys
+
+    Returns
+    -------
+    keys : list
+        list of task keys
+    """
+    keys = []
+    for dependency in depends:
+        if isinstance(dependency, list):
+            keys.extend(dependency)
+        else:
+            keys.append(dependency)
+
+    return keys
+
+
+class Scheduler:
+    """Run tasks with explicit dependencies on a pool of workers.
+
+    Each task is called with its own arguments followed by the results
+    of its dependencies, in the order given. A dependency may be a task
+    key, or a list of task keys whose results are passed as one list.
+    Ready tasks run in the order they were added, so work on one model
+    is finished before the next one takes over the pool, and results are
+    released as soon as no remaining task depends on them. The
+    measurements of every finished task, as returned by ``run_task``,
+    are kept in ``stats``. With isolated failures, the exception of
+    every task failing all its attempts is kept in ``failures``, and
+    the failed task every skipped task depends on in ``skipped``.
+
+    With ``group_depth`` on the process backend, tasks whose keys start
+    with the same items are a group, run in one worker process by a
+    scheduler of its own, on threads. The worker processes share the
+    workers: every task takes one while it runs, so a free worker runs
+    the next ready task of any group, e.g. of a slow model after all
+    others have finished. Results passed between the tasks of a group,
+    e.g. cubes, are not pickled; only results depended on by other
+    groups are returned to the main process. A group whose worker
+    process died fails as a whole, with the key of the group in
+    ``failures``.
+
+    Parameters
+    ----------
+    backend : str
+        options: serial, thread, process
+    workers : int
+        number of workers; defaults to the number of CPUs minus one
+    memory_limit : int
+        maximum memory per worker process in MB, process backend only
+    retries : int
+        number of times a failed task is run again, e.g. after a worker
+        process died, before it fails
+    isolate : bool
+        skip the tasks depending on a failed task and run all others,
+        rather than stopping at the first failure
+    group_depth : int
+        number of leading items of the task keys making up their group,
+        process backend only; None to run every task in its own worker
+    """
+
+    def __init__(self, backend="serial", workers=None, memory_limit=None,
+                 retries=0, isolate=False, group_depth=None):
+        if backend not in BACKENDS:
+            raise ValueError(
+                f"Unknown backend '{backend}', choose from {BACKENDS}"
+            )
+        if workers is None:
+            workers = (os.cpu_count() or 2) - 1
+        if memory_limit is not None and backend != "process":
+            logger.warning(
+                "Worker memory limit is only applied by the process backend"
+            )
+
+        self.backend = backend
+        self.workers = max(1, workers)
+        self.memory_limit = memory_limit
+        self.retries = retries
+        self.isolate = isolate
+        self.group_depth = group_depth if backend == "process" else None
+        # workers shared with the schedulers of other processes
+        self.slots = None
+        self.share_workers = False
+        self.tasks = {}
+        self.stats = {}
+        self.failures = {}
+        self.skipped = {}
+
+    def add(self, key, function, *args, depends=()):
+        """Add a task.
+
+        Parameters
+        ----------
+        key : tuple
+            unique key of the task
+        function : function
+            task function, must be picklable for the process backend
+        *args : any
+            arguments of the task function
+        depends : tuple
+            task keys, or lists of task keys, this task depends on
+
+        Returns
+        -------
+        key : tuple
+            key of the task
+        """
+        if key in self.tasks:
+            raise KeyError(f"Task {key} already exists")
+        self.tasks[key] = (function, args, tuple(depends))
+
+        return key
+
+    def remove(self, prefix):
+        """Remove all tasks whose keys start with a prefix.
+
+        Parameters
+        ----------
+        prefix : tuple
+            prefix of the task keys, e.g. a model name
+
+        Returns
+        -------
+        None
+        """
+        for key in [key for key in self.tasks if key[:len(prefix)] == prefix]:
+            del self.tasks[key]
+
+    def leaves(self, prefix=()):
+        """Find the tasks no other task depends on.
+
+        Parameters
+        ----------
+        prefix : tuple
+            only find tasks whose keys start with this prefix
+
+        Returns
+        -------
+        keys : list
+            task keys, in the order the tasks were added
+        """
+        depended = {
+            dependency
+            for _, _, depends in self.tasks.values()
+            for dependency in task_keys(depends)
+        }
+
+        return [
+            key for key in self.tasks
+            if key[:len(prefix)] == prefix and key not in depended
+        ]
+
+    def run(self, done=None, failed=None, keep=()):
+        """Run all tasks.
+
+        Parameters
+        ----------
+        done : dict
+            results of finished tasks of other schedulers, by task key,
+            which tasks may depend on
+        failed : dict
+            failed task every failed or skipped task of other schedulers
+            depends on, by task key; tasks depending on them are skipped
+        keep : set
+            keys of tasks whose results are returned too, even though
+            other tasks depend on them
+
+        Returns
+        -------
+        results : dict
+            results of the tasks no other task depends on, and of the
+            kept tasks, by task key
+
+        Raises
+        ------
+        Exception
+            the exception of the first task failing all its attempts,
+            unless failures are isolated
+        """
+        if self.group_depth:
+            return self._run_groups()
+
+        done = done or {}
+        failed = failed or {}
+        order = {key: i for i, key in enumerate(self.tasks)}
+        dependents = {key: [] for key in self.tasks}
+        waiting = {}
+        skipped = {}
+        for key, (_, _, depends) in self.tasks.items():
+            keys = set(task_keys(depends))
+            waiting[key] = 0
+            for dependency in keys:
+                if dependency in self.tasks:
+                    dependents[dependency].append(key)
+                    waiting[key] += 1
+                elif dependency in failed:
+                    skipped[key] = failed[dependency]
+                elif dependency not in done:
+                    raise KeyError(
+                        f"Task {key} depends on unknown task {dependency}"
+                    )
+
+        ready = [(order[key], key) for key, count in waiting.items()
+                 if count == 0 and key not in skipped]
+        heapq.heapify(ready)
+        results = dict(done)
+        unreleased = {key: len(keys) for key, keys in dependents.items()}
+        for key in keep:
+            # never released
+            unreleased[key] += 1
+        attempts = {}
+
+        def task_args(key):
+            function, args, depends = self.tasks[key]
+            for dependency in depends:
+                if isinstance(dependency, list):
+                    args += ([results[dep] for dep in dependency],)
+                else:
+                    args += (results[dependency],)
+            return function, args
+
+        def release(key):
+            for dependency in set(task_keys(self.tasks[key][2])):
+                if dependency not in unreleased:
+                    continue
+                unreleased[dependency] -= 1
+                if unreleased[dependency] == 0:
+                    results.pop(dependency, None)
+
+        def complete(key, result, stats):
+            logger.info("Finished task %s in %.2f s", key, stats["wall"])
+            self.stats[key] = stats
+            # kept unless all tasks depending on it were skipped
+            if unreleased[key] > 0 or not dependents[key]:
+                results[key] = result
+            release(key)
+            for dependent in dependents[key]:
+                waiting[dependent] -= 1
+                if waiting[dependent] == 0 and dependent not in self.skipped:
+                    heapq.heappush(ready, (order[dependent], dependent))
+
+        def skip(key, failed):
+            self.skipped[key] = failed
+            release(key)
+            for dependent in dependents[key]:
+                if dependent not in self.skipped:
+                    skip(dependent, failed)
+
+        def fail(key, exc):
+            attempts[key] = attempts.get(key, 0) + 1
+            if attempts[key] <= self.retries:
+                logger.warning(
+                    "Task %s failed (attempt %s of %s), retrying: %r",
+                    key, attempts[key], self.retries + 1, exc,
+                )
+                heapq.heappush(ready, (order[key], key))
+                return
+            if not self.isolate:
+                raise exc
+            logger.error("Task %s failed: %r", key, exc)
+            self.failures[key] = exc
+            release(key)
+            for dependent in dependents[key]:
+                if dependent not in self.skipped:
+                    skip(dependent, key)
+
+        for key, failed_key in skipped.items():
+            if key not in self.skipped:
+                skip(key, failed_key)
+
+        if self.backend == "serial":
+            while ready:
+                _, key = heapq.heappop(ready)
+                try:
+                    outcome = run_task(
+                        *task_args(key), reset_peak=in_worker_process()
+                    )
+                except Exception as exc:
+                    fail(key, exc)
+                    continue
+                complete(key, *outcome)
+        else:
+            self._run_pool(ready, task_args, complete, fail)
+
+        if (
+            len(self.stats) + len(self.failures) + len(self.skipped)
+            < len(self.tasks)
+        ):
+            raise RuntimeError("Task dependencies contain a cycle")
+
+        return {key: results[key] for key in results if key in self.tasks}
+
+    def _run_groups(self):
+        """Run every group of tasks in one worker process.
+
+        Returns
+        -------
+        results : dict
+            results of the tasks no other task depends on, by task key
+        """
+        groups = {}
+        for key, task in self.tasks.items():
+            groups.setdefault(key[:self.group_depth], {})[key] = task
+        exported = {group: set() for group in groups}
+        upstream = {group: [] for group in groups}
+        for group, tasks in groups.items():
+            for key, (_, _, depends) in tasks.items():
+                for dependency in task_keys(depends):
+                    if dependency not in self.tasks:
+                        raise KeyError(
+                            f"Task {key} depends on unknown task "
+                            f"{dependency}"
+                        )
+                    other = dependency[:self.group_depth]
+                    if other != group:
+                        exported[other].add(dependency)
+                        if other not in upstream[group]:
+                            upstream[group].append(other)
+
+        # every group may use all workers, shared with the other groups
+        options = {
+            "backend": "thread" if self.workers > 1 else "serial",
+            "workers": self.workers,
+            "retries": self.retries,
+            "isolate": self.isolate,
+        }
+        outer = Scheduler(
+            backend="process",
+            workers=self.workers,
+            memory_limit=self.memory_limit,
+            retries=self.retries,
+            isolate=self.isolate,
+        )
+        outer.share_workers = self.workers > 1
+        for group, tasks in groups.items():
+            outer.add(
+                group,
+                run_group,
+                tasks,
+                exported[group],
+                options,
+                depends=[upstream[group]],
+            )
+        logger.info(
+            "Running %s tasks in %s groups, on %s worker processes sharing "
+            "%s worker(s)", len(self.tasks), len(groups),
+            min(self.workers, len(groups)), self.workers,
+        )
+        outcomes = outer.run(keep=set(groups))
+
+        results = {}
+        for group, tasks in groups.items():
+            if group in outcomes:
+                outcome = outcomes[group]
+                self.stats.update(outcome["stats"])
+                self.failures.update(outcome["failures"])
+                self.skipped.update(outcome["skipped"])
+                results.update(
+                    (key, result)
+                    for key, result in outcome["results"].items()
+                    if key in tasks
+                )
+                continue
+            # the worker process died, or a group it depends on
+            failed = outer.skipped.get(group, group)
+            if group in outer.failures:
+                self.failures[group] = outer.failures[group]
+            for key in tasks:
+                self.skipped[key] = failed
+
+        depended = {
+            dependency
+            for _, _, depends in self.tasks.values()
+            for dependency in task_keys(depends)
+        }
+
+        return {
+            key: result for key, result in results.items()
+            if key not in depended
+        }
+
+    def _executor(self):
+        """Create the pool of workers."""
+        if self.backend == "process":
+            # a new pool gets new slots, as a dead worker may hold some
+            slots = (
+                multiprocessing.BoundedSemaphore(self.workers)
+                if self.share_workers else None
+            )
+            return futures.ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=init_worker,
+                initargs=(self.memory_limit, slots),
+            )
+
+        return futures.ThreadPoolExecutor(max_workers=self.workers)
+
+    def _run_pool(self, ready, task_args, complete, fail):
+        """Run ready tasks on a pool of workers until all have finished."""
+        executor = self._executor()
+        running = {}
+        try:
+            while ready or running:
+                while ready and len(running) < self.workers:
+                    _, key = heapq.heappop(ready)
+                    isolated = self.backend == "process"
+                    if self.slots is not None:
+                        # freed by tasks finishing in any process
+                        self.slots.acquire()
+                    future = executor.submit(
+                        run_task, *task_args(key), isolated, isolated
+                    )
+                    if self.slots is not None:
+                        future.add_done_callback(
+                            lambda _: self.slots.release()
+                        )
+                    running[future] = key
+                done, _ = futures.wait(
+                    running, return_when=futures.FIRST_COMPLETED
+                )
+                broken = False
+                for future in done:
+                    broken |= self._collect(
+                        future, running.pop(future), complete, fail
+                    )
+                if broken:
+                    # a worker died, e.g. killed for its memory: all tasks
+                    # still running fail with it, and a new pool takes over
+                    for future in futures.wait(running).done:
+                        self._collect(
+                            future, running.pop(future), complete, fail
+                        )
+                    executor.shutdown(cancel_futures=True)
+                    executor = self._executor()
+        finally:
+            executor.shutdown(cancel_futures=True)
+
+    @staticmethod
+    def _collect(future, key, complete, fail):
+        """Complete, or fail, the task of a finished future.
+
+        Returns
+        -------
+        broken : bool
+            True if the pool of workers broke
+        """
+        exc = future.exception()
+        if exc is None:
+            complete(key, *future.result())
+            return False
+        fail(key, exc)
+
+        return isinstance(exc, futures.process.BrokenProcessPool)
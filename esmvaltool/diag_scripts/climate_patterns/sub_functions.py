@@ -5,19 +5,23 @@ Author
 Gregory Munday (Met Office, UK)
 """
 
+import hashlib
 import logging
-import multiprocessing as mp
 import os
-from functools import partial
 from pathlib import Path
 
+import dask
 import iris
 import iris.analysis.cartography
 import iris.coord_categorisation
+import iris.cube
 import numpy as np
 
 logger = logging.getLogger(Path(__file__).stem)
 
+# weights per grid (and land fraction), computed once per process
+GRID_WEIGHTS = {}
+
 
 def load_cube(filename):
     """Load cube, remove any dimensions of length: 1.
@@ -39,6 +43,277 @@ def load_cube(filename):
     return cube
 
 
+def load_monthly_means(filename):
+    """Load daily data as monthly means, reading one year at a time.
+
+    Every year is realised, averaged by month and dropped before the next
+    is read, so memory use is bounded by one year of daily data rather
+    than the whole timeseries. Means of daily maxima and minima are the
+    monthly tasmax and tasmin of CMIP Amon tables.
+
+    Parameters
+    ----------
+    filename : path
+        path to the file of daily data
+
+    Returns
+    -------
+    cube : cube
+        cube of monthly means, with month_number and year coords as
+        made by the monthly_statistics preprocessor of ESMValCore
+    """
+    cube = load_cube(filename)
+    time = cube.coord("time")
+    years = np.array([date.year for date in time.units.num2date(time.points)])
+    # index of the first day of every year, and the end of the data
+    edges = np.append(np.flatnonzero(np.diff(years, prepend=years[0] - 1)),
+                      len(years))
+
+    months = iris.cube.CubeList([])
+    for start, end in zip(edges[:-1], edges[1:]):
+        year_cube = cube[start:end]
+        year_cube.data = year_cube.data
+        iris.coord_categorisation.add_month_number(year_cube, "time")
+        iris.coord_categorisation.add_year(year_cube, "time")
+        months.append(
+            year_cube.aggregated_by(
+                ["month_number", "year"], iris.analysis.MEAN
+            )
+        )
+    logger.debug(
+        "Averaged %s days of %s into %s months",
+        len(years), cube.var_name, sum(month.shape[0] for month in months),
+    )
+
+    return months.concatenate_cube()
+
+
+def rechunk_time(cube, chunk_budget=256):
+    """Make cube data lazy, chunked along time to fit a memory budget.
+
+    Parameters
+    ----------
+    cube : cube
+        input cube, time along the first dimension
+    chunk_budget : int
+        maximum size of a single chunk, in MB
+
+    Returns
+    -------
+    cube : cube
+        cube with lazy data, in chunks of whole fields along time
+    """
+    field_bytes = np.prod(cube.shape[1:], dtype=np.int64) * np.dtype(
+        cube.dtype
+    ).itemsize
+    steps = int(max(1, chunk_budget * 1024**2 // max(1, field_bytes)))
+    cube.data = cube.lazy_data().rechunk(
+        (steps,) + tuple(-1 for _ in cube.shape[1:])
+    )
+    logger.debug(
+        "Chunked %s into %s timesteps per chunk", cube.var_name, steps
+    )
+
+    return cube
+
+
+def rechunk_tiles(cube, chunk_budget=256):
+    """Make cube data lazy, chunked into spatial tiles to fit a budget.
+
+    Every tile holds the whole timeseries of its cells, so it can be
+    regressed on its own: tiles are bands of latitude rows, or parts of
+    single rows if even one row of the timeseries is over budget.
+
+    Parameters
+    ----------
+    cube : cube
+        input cube, (time, lat, lon)
+    chunk_budget : int
+        maximum size of a single tile, in MB
+
+    Returns
+    -------
+    cube : cube
+        cube with lazy data, in tiles of whole timeseries
+    """
+    n_time, n_rows, n_cols = cube.shape
+    cell_bytes = n_time * np.dtype(cube.dtype).itemsize
+    cells = int(max(1, chunk_budget * 1024**2 // cell_bytes))
+    if cells >= n_cols:
+        chunks = (-1, min(n_rows, cells // n_cols), -1)
+    else:
+        chunks = (-1, 1, cells)
+    cube.data = cube.lazy_data().rechunk(chunks)
+    logger.debug(
+        "Chunked %s into %s tiles", cube.var_name,
+        np.prod(cube.lazy_data().numblocks[1:]),
+    )
+
+    return cube
+
+
+class GridWeights:
+    """Normalised area weights of a horizontal grid.
+
+    Global weights are proportional to the area of every grid cell, and
+    sum to one. Land and ocean weights are proportional to the area of
+    land or ocean in every grid cell, ignoring fractions below 1%, divided
+    by the land or ocean area measured on the grid of the fraction, with
+    its own coordinate system, as ``area_avg_landsea`` always has. They
+    only sum to one if both grids assume the same Earth radius.
+
+    Parameters
+    ----------
+    cube : cube
+        cube on the grid, with latitude and longitude coords
+    ocean_frac : cube
+        optional ocean fraction on the grid
+    land_frac : cube
+        optional land fraction on the grid
+    """
+
+    def __init__(self, cube, ocean_frac=None, land_frac=None):
+        area = cell_areas(cube)
+
+        self.weights = {"global": area / area.sum()}
+        for region, frac in (("ocean", ocean_frac), ("land", land_frac)):
+            if frac is None:
+                continue
+            frac_data = np.ma.filled(frac.data, 0.0)
+            counted = frac_data >= 0.01
+            region_area = np.where(
+                counted, cell_areas(frac) * frac_data, 0.0
+            ).sum()
+            logger.debug(
+                "%s area: %s", region.capitalize(), region_area / 1e12
+            )
+            self.weights[region] = (
+                np.where(counted, area * frac_data, 0.0) / region_area
+            )
+
+    def average(self, cube, region="global", return_cube=None):
+        """Calculate the area-weighted mean of a cube over a region.
+
+        Parameters
+        ----------
+        cube : cube
+            input cube, on the grid of the weights
+        region : str
+            options: global, land, ocean
+        return_cube : bool
+            option to return a cube or array
+
+        Returns
+        -------
+        cube2 : cube
+            cube with collapsed lat-lons, mean over time
+        cube2.data : arr
+            array with collapsed lat-lons, mean over time
+        """
+        dims = cube.coord_dims("latitude") + cube.coord_dims("longitude")
+        weights = iris.util.broadcast_to_shape(
+            self.weights[region], cube.shape, dims
+        )
+
+        if region == "global":
+            # masked cells are left out of the mean
+            aggregator = iris.analysis.MEAN
+        else:
+            # masked cells still count towards the land or ocean area
+            aggregator = iris.analysis.SUM
+        cube2 = cube.collapsed(
+            ["latitude", "longitude"], aggregator, weights=weights
+        )
+
+        if return_cube:
+            return cube2
+
+        return cube2.data
+
+
+def cell_areas(cube):
+    """Calculate the area of every cell of the horizontal grid of a cube.
+
+    Parameters
+    ----------
+    cube : cube
+        cube with latitude and longitude coords
+
+    Returns
+    -------
+    area : arr
+        (lat, lon) array of cell areas, in m2
+    """
+    # guessing bounds on copies, so the cube is left as it is
+    lat = cube.coord("latitude").copy()
+    lon = cube.coord("longitude").copy()
+    for coord in (lat, lon):
+        if not coord.has_bounds():
+            coord.guess_bounds()
+    field = iris.cube.Cube(
+        np.zeros(lat.shape + lon.shape),
+        dim_coords_and_dims=[(lat, 0), (lon, 1)],
+    )
+
+    return iris.analysis.cartography.area_weights(field, normalize=False)
+
+
+def grid_key(cube, with_data=False):
+    """Make a key identifying the horizontal grid of a cube.
+
+    Parameters
+    ----------
+    cube : cube
+        cube with latitude and longitude coords
+    with_data : bool
+        also identify the data of the cube, e.g. of a land fraction
+
+    Returns
+    -------
+    key : str
+        hexadecimal key
+    """
+    key = hashlib.sha1()
+    for name in ("latitude", "longitude"):
+        coord = cube.coord(name)
+        key.update(np.ascontiguousarray(coord.points).tobytes())
+        # the coordinate system sets the radius of the cell areas
+        key.update(repr(coord.coord_system).encode())
+        if coord.has_bounds():
+            key.update(np.ascontiguousarray(coord.bounds).tobytes())
+    if with_data:
+        key.update(np.ma.filled(cube.data, np.nan).tobytes())
+
+    return key.hexdigest()
+
+
+def grid_weights(cube, ocean_frac=None, land_frac=None):
+    """Get the weights of the grid of a cube, computing them only once.
+
+    Parameters
+    ----------
+    cube : cube
+        cube on the grid, with latitude and longitude coords
+    ocean_frac : cube
+        optional ocean fraction on the grid
+    land_frac : cube
+        optional land fraction on the grid
+
+    Returns
+    -------
+    weights : GridWeights
+        normalised area weights of the grid
+    """
+    key = (grid_key(cube),) + tuple(
+        None if frac is None else grid_key(frac, with_data=True)
+        for frac in (ocean_frac, land_frac)
+    )
+    if key not in GRID_WEIGHTS:
+        GRID_WEIGHTS[key] = GridWeights(cube, ocean_frac, land_frac)
+
+    return GRID_WEIGHTS[key]
+
+
 def area_avg(cube, return_cube=None):
     """Calculate the global mean of a variable in a cube, area-weighted.
 
@@ -56,21 +331,154 @@ def area_avg(cube, return_cube=None):
     cube2.data : arr
         array with collapsed lat-lons, global mean over time
     """
-    if not cube.coord("latitude").has_bounds():
-        cube.coord("latitude").guess_bounds()
-    if not cube.coord("longitude").has_bounds():
-        cube.coord("longitude").guess_bounds()
-    area = iris.analysis.cartography.area_weights(cube, normalize=False)
-    cube2 = cube.collapsed(
-        ["latitude", "longitude"],
-        iris.analysis.MEAN,
-        weights=area
+    return grid_weights(cube).average(cube, "global", return_cube)
+
+
+def weighted_sums(data, weights):
+    """Sum the weighted values, and the weights, of every field of an array.
+
+    Masked cells are left out of both sums.
+
+    Parameters
+    ----------
+    data : arr
+        (time, lat, lon) array, masked where missing
+    weights : arr
+        (lat * lon, n) weights, e.g. of several areas
+
+    Returns
+    -------
+    sums : arr
+        (time, 2, n) array of the sums of weighted values and of weights
+    """
+    n_fields = data.shape[0]
+    mask = np.ma.getmaskarray(data).reshape(n_fields, -1)
+    values = np.ma.getdata(data).reshape(n_fields, -1)
+
+    return np.stack(
+        [np.where(mask, 0.0, values) @ weights, (~mask) @ weights], axis=1
+    )
+
+
+def spatial_sums(data, weights):
+    """Sum a lazy array like ``weighted_sums``, chunk by chunk.
+
+    Chunks may split time as well as space; the sums of the spatial
+    chunks of every time chunk are added up.
+
+    Parameters
+    ----------
+    data : dask array
+        lazy (time, lat, lon) array, masked where missing
+    weights : arr
+        (lat * lon, n) weights, e.g. of several areas
+
+    Returns
+    -------
+    sums : dask array
+        lazy (time, 2, n) array of the sums of weighted values and of
+        weights
+    """
+    n_weights = weights.shape[-1]
+    grid = weights.reshape(data.shape[1], data.shape[2], n_weights)
+
+    def block_sums(block, block_info=None):
+        _, rows, cols = block_info[0]["array-location"]
+        sums = weighted_sums(
+            block, grid[slice(*rows), slice(*cols)].reshape(-1, n_weights)
+        )
+        return sums[:, np.newaxis, np.newaxis]
+
+    sums = data.map_blocks(
+        block_sums,
+        new_axis=[3, 4],
+        chunks=(
+            data.chunks[0],
+            (1,) * data.numblocks[1],
+            (1,) * data.numblocks[2],
+            (2,),
+            (n_weights,),
+        ),
+        dtype=np.float64,
+        meta=np.array((), dtype=np.float64),
     )
 
-    if return_cube:
-        return cube2
+    return sums.sum(axis=(1, 2))
+
+
+def field_means(data, weights):
+    """Calculate the weighted means of every field of an array.
+
+    Parameters
+    ----------
+    data : arr
+        (time, lat, lon) array, masked where missing
+    weights : arr
+        (lat * lon) normalised area weights
+
+    Returns
+    -------
+    means : arr
+        (time,) array of means over the unmasked cells, NaN where all
+        cells are masked
+    """
+    return sum_ratios(weighted_sums(data, weights[:, np.newaxis]))[:, 0]
+
+
+def sum_ratios(sums):
+    """Divide the sums of weighted values by the sums of weights.
+
+    Parameters
+    ----------
+    sums : arr
+        (time, 2, n) array, as returned by ``weighted_sums``
+
+    Returns
+    -------
+    means : arr
+        (time, n) array of weighted means, NaN where all cells are masked
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return sums[:, 0] / sums[:, 1]
+
 
-    return cube2.data
+def global_means(cubes):
+    """Calculate the area-weighted global means of several cubes at once.
+
+    Equivalent to ``area_avg`` of every cube, but as one matrix-vector
+    product per cube with the cached grid weights, rather than
+    broadcasting the weights to the shape of the cube and collapsing it.
+    Lazy cubes are averaged chunk by chunk, along time or in tiles.
+
+    Parameters
+    ----------
+    cubes : cubelist
+        cubes with time (or month) along the first dimension
+
+    Returns
+    -------
+    means : dict
+        global mean timeseries of every cube, by var_name
+    """
+    means = {}
+    for cube in cubes:
+        weights = grid_weights(cube).weights["global"].ravel()
+        if cube.has_lazy_data():
+            sums = spatial_sums(cube.lazy_data(), weights[:, np.newaxis])
+            means[cube.var_name] = sums.map_blocks(
+                sum_ratios,
+                drop_axis=1,
+                dtype=np.float64,
+                meta=np.array((), dtype=np.float64),
+            )[:, 0]
+        else:
+            means[cube.var_name] = field_means(cube.data, weights)
+
+    (means,) = dask.compute(means)
+
+    return {
+        name: np.ma.masked_invalid(mean) for name, mean in means.items()
+    }
 
 
 def ocean_fraction_calc(sftlf):
@@ -128,66 +536,13 @@ def area_avg_landsea(cube, ocean_frac, land_frac, land=True, return_cube=None):
     cube2.data : arr
         array with collapsed lat-lons, global mean over time
     """
-    if not cube.coord("latitude").has_bounds():
-        cube.coord("latitude").guess_bounds()
-    if not cube.coord("longitude").has_bounds():
-        cube.coord("longitude").guess_bounds()
+    weights = grid_weights(cube, ocean_frac, land_frac)
+    region = "land" if land else "ocean"
 
-    global_weights = iris.analysis.cartography.area_weights(
-        cube,
-        normalize=False
-    )
+    return weights.average(cube, region, return_cube)
 
-    if land is False:
-        ocean_frac.data = np.ma.masked_less(ocean_frac.data, 0.01)
-        weights = iris.analysis.cartography.area_weights(
-            ocean_frac,
-            normalize=False
-        )
-        ocean_area = (
-            ocean_frac.collapsed(
-                ["latitude", "longitude"], iris.analysis.SUM, weights=weights
-            )
-            / 1e12
-        )
-        print("Ocean area: ", ocean_area.data)
-        cube2 = cube.copy()
-        cube2.data = cube2.data * global_weights * ocean_frac.data
-
-        cube2 = (
-            cube2.collapsed(["latitude", "longitude"], iris.analysis.SUM)
-            / 1e12
-            / ocean_area.data
-        )
-
-    if land:
-        land_frac.data = np.ma.masked_less(land_frac.data, 0.01)
-        weights = iris.analysis.cartography.area_weights(
-            land_frac,
-            normalize=False
-        )
-        land_area = (
-            land_frac.collapsed(
-                ["latitude", "longitude"], iris.analysis.SUM, weights=weights
-            )
-            / 1e12
-        )
-        print("Land area: ", land_area.data)
-        cube2 = cube.copy()
-        cube2.data = cube2.data * global_weights * land_frac.data
-        cube2 = (
-            cube2.collapsed(["latitude", "longitude"], iris.analysis.SUM)
-            / 1e12
-            / land_area.data
-        )
 
-    if return_cube:
-        return cube2
-
-    return cube2.data
-
-
-def make_model_dirs(cube_initial, work_path, plot_path):
+def make_model_dirs(cube_initial, work_path, plot_path, subdir=""):
     """Create directories for each input model for saving.
 
     Parameters
@@ -198,6 +553,8 @@ def make_model_dirs(cube_initial, work_path, plot_path):
         path to work_dir
     plot_path : path
         path to plot_dir
+    subdir : str
+        optional subdirectory of the model directories, e.g. a scenario
 
     Returns
     -------
@@ -206,43 +563,17 @@ def make_model_dirs(cube_initial, work_path, plot_path):
     model_plot_dir : path
         path to specific plot directory in plot_dir
     """
-    w_path = os.path.join(work_path, cube_initial.attributes["source_id"])
-    p_path = os.path.join(plot_path, cube_initial.attributes["source_id"])
-    os.mkdir(w_path)
-    os.mkdir(p_path)
+    w_path = os.path.join(
+        work_path, cube_initial.attributes["source_id"], subdir
+    )
+    p_path = os.path.join(
+        plot_path, cube_initial.attributes["source_id"], subdir
+    )
+    # scenarios of a model share its directories
+    os.makedirs(w_path, exist_ok=True)
+    os.makedirs(p_path, exist_ok=True)
 
-    model_work_dir = w_path + "/"
-    model_plot_dir = p_path + "/"
+    model_work_dir = os.path.join(w_path, "")
+    model_plot_dir = os.path.join(p_path, "")
 
     return model_work_dir, model_plot_dir
-
-
-def parallelise(function, processes=None):
-    """Parallelise any function, by George Ford, Met Office.
-
-    Parameters
-    ----------
-    function : function
-        function to be parallelised
-    processes : int
-        number of threads to be used in parallelisation
-
-    Returns
-    -------
-    result : any
-        results of parallelised elements
-    """
-    if processes is None:
-        processes = max(1, mp.cpu_count() - 1)
-    if processes <= 0:
-        processes = 1
-
-    def easy_parallise(func, sequence, cfg):
-        pool = mp.Pool(processes=processes)
-        config_wrapper = partial(func, cfg=cfg)
-        result = pool.map_async(config_wrapper, sequence).get()
-        pool.close()
-        pool.join()
-        return result
-
-    return partial(easy_parallise, function)
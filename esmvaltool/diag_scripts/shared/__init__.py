@@ -16,6 +16,7 @@ from ._base import (
     variables_available,
 )
 from ._diag import Datasets, Variable, Variables
+from ._metadata import MetadataList
 from ._validation import apply_supermeans, get_control_exper_obs
 
 __all__ = [
@@ -33,6 +34,7 @@ __all__ = [
     'sorted_metadata',
     'group_metadata',
     'sorted_group_metadata',
+    'MetadataList',
     'extract_variables',
     'variables_available',
     'names',
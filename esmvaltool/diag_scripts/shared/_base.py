@@ -1,12 +1,16 @@
 """Convenience functions for running a diagnostic script."""
 import argparse
+import collections
 import contextlib
+import fcntl
 import glob
 import logging
 import os
+import pickle
 import shutil
 import sys
 import time
+from concurrent import futures
 from pathlib import Path
 
 import distributed
@@ -14,8 +18,17 @@ import iris
 import matplotlib.pyplot as plt
 import yaml
 
+from . import _profiling
+from ._metadata import InputData, MetadataList
+
 logger = logging.getLogger(__name__)
 
+# the C loader and dumper of libyaml are much faster, where available
+_SafeLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+_SafeDumper = getattr(yaml, 'CSafeDumper', yaml.SafeDumper)
+
+INPUT_DATA_CACHE = 'input_data_cache.pickle'
+
 
 def get_plot_filename(basename, cfg):
     """Get a valid path for saving a diagnostic plot.
@@ -139,6 +152,11 @@ def save_data(basename, provenance, cfg, cube, **kwargs):
 class ProvenanceLogger:
     """Open the provenance logger.
 
+    Records are appended to the provenance file when leaving the context,
+    so any number of loggers, e.g. one per worker process, can be used at
+    the same time. Records of the same file by different loggers are
+    reported at the end of :func:`run_diagnostic`.
+
     Parameters
     ----------
     cfg: dict
@@ -175,12 +193,7 @@ class ProvenanceLogger:
         """Create a provenance logger."""
         self._log_file = os.path.join(cfg['run_dir'],
                                       'diagnostic_provenance.yml')
-
-        if not os.path.exists(self._log_file):
-            self.table = {}
-        else:
-            with open(self._log_file, 'r') as file:
-                self.table = yaml.safe_load(file)
+        self.table = {}
 
     def log(self, filename, record):
         """Record provenance.
@@ -216,12 +229,26 @@ class ProvenanceLogger:
         self.table[filename] = record
 
     def _save(self):
-        """Save the provenance log to file."""
+        """Append the provenance records to the log file.
+
+        The records are appended as top-level entries of the YAML mapping
+        in the file, under an exclusive lock, so loggers in concurrent
+        processes or threads never overwrite each other's records and the
+        cost of saving does not grow with the size of the file.
+        """
+        if not self.table:
+            return
         dirname = os.path.dirname(self._log_file)
-        if not os.path.exists(dirname):
-            os.makedirs(dirname)
-        with open(self._log_file, 'w') as file:
-            yaml.safe_dump(self.table, file)
+        os.makedirs(dirname, exist_ok=True)
+        content = yaml.safe_dump(self.table)
+        with open(self._log_file, 'a') as file:
+            fcntl.flock(file, fcntl.LOCK_EX)
+            try:
+                file.write(content)
+                file.flush()
+            finally:
+                fcntl.flock(file, fcntl.LOCK_UN)
+        self.table = {}
 
     def __enter__(self):
         """Enter context."""
@@ -232,6 +259,36 @@ class ProvenanceLogger:
         self._save()
 
 
+def _check_provenance(provenance_file):
+    """Check no file has more than one provenance record.
+
+    Records of different loggers are only appended to the provenance file,
+    so records of the same file by different loggers are found here, once
+    all loggers have finished.
+
+    Parameters
+    ----------
+    provenance_file: str
+        Path to the provenance file.
+
+    Raises
+    ------
+    KeyError
+        A file has more than one provenance record.
+    """
+    if not os.path.exists(provenance_file):
+        return
+    with open(provenance_file, 'r') as file:
+        node = yaml.compose(file, Loader=yaml.SafeLoader)
+    if node is None:
+        return
+    counts = collections.Counter(key.value for key, _ in node.value)
+    duplicates = sorted(name for name, count in counts.items() if count > 1)
+    if duplicates:
+        raise KeyError("Provenance records for {} already exist.".format(
+            ', '.join(duplicates)))
+
+
 def select_metadata(metadata, **attributes):
     """Select specific metadata describing preprocessed data.
 
@@ -247,8 +304,11 @@ def select_metadata(metadata, **attributes):
     Returns
     -------
     :obj:`list` of :obj:`dict`
-        A list of matching metadata.
+        A list of matching metadata, a :class:`MetadataList` if the
+        metadata are one.
     """
+    if isinstance(metadata, MetadataList):
+        return metadata.select(**attributes)
     selection = []
     for attribs in metadata:
         if all(a in attribs and (
@@ -273,14 +333,18 @@ def group_metadata(metadata, attribute, sort=None):
     Returns
     -------
     :obj:`dict` of :obj:`list` of :obj:`dict`
-        A dictionary containing the requested groups.
+        A dictionary containing the requested groups, each a
+        :class:`MetadataList` if the metadata are one.
     """
-    groups = {}
-    for attributes in metadata:
-        key = attributes.get(attribute)
-        if key not in groups:
-            groups[key] = []
-        groups[key].append(attributes)
+    if isinstance(metadata, MetadataList):
+        groups = metadata.group(attribute)
+    else:
+        groups = {}
+        for attributes in metadata:
+            key = attributes.get(attribute)
+            if key not in groups:
+                groups[key] = []
+            groups[key].append(attributes)
 
     if sort:
         groups = sorted_group_metadata(groups, sort)
@@ -303,7 +367,8 @@ def sorted_metadata(metadata, sort):
     Returns
     -------
     :obj:`list` of :obj:`dict`
-        The sorted list of variable metadata.
+        The sorted list of variable metadata, a :class:`MetadataList` if
+        the metadata are one.
     """
     if isinstance(sort, str):
         sort = [sort]
@@ -312,7 +377,10 @@ def sorted_metadata(metadata, sort):
         """Define a key to sort the list of attributes by."""
         return tuple(str(attributes.get(k, '')).lower() for k in sort)
 
-    return sorted(metadata, key=normalized_variable_key)
+    selection = sorted(metadata, key=normalized_variable_key)
+    if isinstance(metadata, MetadataList):
+        selection = MetadataList(selection)
+    return selection
 
 
 def sorted_group_metadata(metadata_groups, sort):
@@ -423,12 +491,30 @@ def get_cfg(filename=None):
     if filename is None:
         filename = sys.argv[1]
     with open(filename) as file:
-        cfg = yaml.safe_load(file)
+        cfg = yaml.load(file, Loader=_SafeLoader)
     return cfg
 
 
+def _read_metadata_file(filename):
+    """Read the contents of a metadata.yml file."""
+    with open(filename) as file:
+        return file.read()
+
+
 def _get_input_data_files(cfg):
-    """Get a dictionary containing all data input files."""
+    """Get a dictionary containing all data input files.
+
+    The metadata.yml files are read concurrently, hiding the latency of
+    parallel file systems, and parsed as they arrive. With the script setting
+    ``cache_input_data``, the merged metadata are also cached in run_dir,
+    keyed on the modification times and sizes of the metadata.yml files,
+    so re-running the script does not read them again.
+
+    Its values are an indexed :class:`MetadataList`, built once, so
+    diagnostics selecting and grouping metadata many times do not scan
+    all of them every time.
+    """
+    start = time.time()
     metadata_files = []
     for filename in cfg['input_files']:
         if os.path.isdir(filename):
@@ -437,15 +523,59 @@ def _get_input_data_files(cfg):
         elif os.path.basename(filename) == 'metadata.yml':
             metadata_files.append(filename)
 
-    input_files = {}
-    for filename in metadata_files:
-        with open(filename) as file:
-            metadata = yaml.safe_load(file)
-            input_files.update(metadata)
+    cache_file = None
+    if cfg.get('cache_input_data'):
+        cache_file = os.path.join(cfg['run_dir'], INPUT_DATA_CACHE)
+        key = []
+        for filename in metadata_files:
+            stat = os.stat(filename)
+            key.append((filename, stat.st_mtime_ns, stat.st_size))
+        input_files = _read_input_data_cache(cache_file, key)
+        if input_files is not None:
+            logger.info("Read metadata of %s input files from cache %s in "
+                        "%.1f s", len(input_files), cache_file,
+                        time.time() - start)
+            return InputData(input_files)
 
+    input_files = {}
+    with futures.ThreadPoolExecutor() as executor:
+        # parsed in the order of the files, as later files take precedence
+        for text in executor.map(_read_metadata_file, metadata_files):
+            input_files.update(yaml.load(text, Loader=_SafeLoader))
+
+    if cache_file is not None:
+        _write_input_data_cache(cache_file, key, input_files)
+    logger.info("Read metadata of %s input files from %s metadata files in "
+                "%.1f s", len(input_files), len(metadata_files),
+                time.time() - start)
+
+    return InputData(input_files)
+
+
+def _read_input_data_cache(cache_file, key):
+    """Read cached input data, if their metadata files are unchanged."""
+    try:
+        with open(cache_file, 'rb') as file:
+            cached_key, input_files = pickle.load(file)
+    except (OSError, EOFError, pickle.UnpicklingError, ValueError):
+        return None
+    if cached_key != key:
+        logger.info("Metadata files changed, not using cache %s", cache_file)
+        return None
     return input_files
 
 
+def _write_input_data_cache(cache_file, key, input_files):
+    """Cache input data, with the key of their metadata files."""
+    os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+    # written under another name first, so readers never see half a file
+    temporary = f'{cache_file}.{os.getpid()}'
+    with open(temporary, 'wb') as file:
+        pickle.dump((key, input_files), file,
+                    protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temporary, cache_file)
+
+
 @contextlib.contextmanager
 def run_diagnostic():
     """Run a Python diagnostic.
@@ -469,6 +599,20 @@ def run_diagnostic():
 
     The `cfg` dict passed to `main` contains the script configuration that
     can be used with the other functions in this module.
+
+    Any diagnostic can be profiled with these script settings in the
+    recipe, or the options ``--profiler`` and ``--resource-usage`` when
+    re-running it; all files are written to run_dir:
+
+    * ``profiler: cprofile`` profiles every function call with cProfile,
+      written to ``profile.bin`` in pstats format.
+    * ``profiler: sampling`` samples the call stacks of all threads every
+      ``profiler_interval`` seconds (default 0.01), at a much lower
+      overhead, written to ``profile_stacks.txt`` as collapsed stacks, as
+      read by flamegraph.pl or speedscope.
+    * ``resource_usage: true`` samples the CPU time, memory and I/O of the
+      script every ``resource_usage_interval`` seconds (default 1),
+      written to ``resource_usage.csv``, and logs its peak memory.
     """
     # Implemented as context manager so we can support clean up actions later
     parser = argparse.ArgumentParser(description="Diagnostic script")
@@ -502,13 +646,32 @@ def run_diagnostic():
         help=("Set the log-level"),
         choices=['debug', 'info', 'warning', 'error'],
     )
+    parser.add_argument(
+        '-p',
+        '--profiler',
+        help=("Profile the diagnostic script, overriding the 'profiler' "
+              "script setting, see the documentation of run_diagnostic."),
+        choices=_profiling.PROFILERS,
+    )
+    parser.add_argument(
+        '-r',
+        '--resource-usage',
+        help=("Sample the CPU, memory and I/O of the diagnostic script to "
+              f"{_profiling.RESOURCE_USAGE_FILE} in run_dir."),
+        action='store_true',
+    )
     args = parser.parse_args()
 
+    start = time.time()
     cfg = get_cfg(args.filename)
 
     # Set up logging
     if args.log_level:
         cfg['log_level'] = args.log_level
+    if args.profiler:
+        cfg['profiler'] = args.profiler
+    if args.resource_usage:
+        cfg['resource_usage'] = True
 
     logging.basicConfig(format="%(asctime)s [%(process)d] %(levelname)-8s "
                         "%(name)s,%(lineno)s\t%(message)s")
@@ -520,13 +683,17 @@ def run_diagnostic():
     cfg['input_data'] = _get_input_data_files(cfg)
 
     logger.info("Starting diagnostic script %s with configuration:\n%s",
-                cfg['script'], yaml.safe_dump(cfg))
+                cfg['script'], yaml.dump(cfg, Dumper=_SafeDumper))
 
     # Clean run_dir and output directories from previous runs
     default_files = {
         'diagnostic_provenance.yml',
+        INPUT_DATA_CACHE,
         'log.txt',
-        'profile.bin',
+        'netcdf_metadata_index.pickle',
+        _profiling.PROFILE_FILE,
+        _profiling.RESOURCE_USAGE_FILE,
+        _profiling.STACKS_FILE,
         'resource_usage.txt',
         'settings.yml',
     }
@@ -579,6 +746,9 @@ def run_diagnostic():
         client = contextlib.nullcontext()
 
     with client:
-        yield cfg
+        logger.info("Started diagnostic script in %.1f s", time.time() - start)
+        with _profiling.profile(cfg):
+            yield cfg
 
+    _check_provenance(provenance_file)
     logger.info("End of diagnostic script run.")
@@ -0,0 +1,167 @@
+"""Indexed collections of metadata describing preprocessed data."""
+import yaml
+
+# methods of list and dict changing their items, which invalidate indexes
+_LIST_MUTATORS = (
+    '__delitem__',
+    '__iadd__',
+    '__imul__',
+    '__setitem__',
+    'append',
+    'clear',
+    'extend',
+    'insert',
+    'pop',
+    'remove',
+    'reverse',
+    'sort',
+)
+_DICT_MUTATORS = (
+    '__delitem__',
+    '__ior__',
+    '__setitem__',
+    'clear',
+    'pop',
+    'popitem',
+    'setdefault',
+    'update',
+)
+
+
+def _invalidating(method):
+    """Wrap a method changing the items so it also clears the indexes."""
+    def wrapper(self, *args, **kwargs):
+        self._indexes = {}
+        return method(self, *args, **kwargs)
+
+    wrapper.__name__ = method.__name__
+    wrapper.__doc__ = method.__doc__
+    return wrapper
+
+
+class MetadataList(list):
+    """List of metadata describing preprocessed data, with hash indexes.
+
+    A drop-in replacement for a :obj:`list` of :obj:`dict`, e.g. the
+    metadata in ``cfg['input_data'].values()``. The first time metadata
+    are selected or grouped by an attribute, an index of the positions of
+    every value of the attribute is built, so later selections and
+    groupings by that attribute take time proportional to the number of
+    matches rather than to the length of the list. Indexes are cleared
+    when items are added, removed or replaced. Metadata changed in place,
+    e.g. ``metadata[0]['dataset'] = 'X'``, are not reindexed: call
+    :meth:`reindex` afterwards.
+
+    Selections, groups and sorted metadata are returned as
+    :class:`MetadataList` too, so they can be queried in turn.
+    """
+
+    def __init__(self, metadata=()):
+        super().__init__(metadata)
+        self._indexes = {}
+
+    def reindex(self):
+        """Clear the indexes, to be built again on the next query."""
+        self._indexes = {}
+
+    def _index(self, attribute):
+        """Get the index of an attribute, building it if needed.
+
+        Returns
+        -------
+        :obj:`tuple`
+            A dictionary of the positions of the metadata with every value
+            of the attribute, missing attributes counting as None, and a
+            list of the positions of metadata with unhashable values.
+        """
+        if attribute not in self._indexes:
+            positions = {}
+            unhashable = []
+            for i, attributes in enumerate(self):
+                value = attributes.get(attribute)
+                try:
+                    positions.setdefault(value, []).append(i)
+                except TypeError:
+                    unhashable.append(i)
+            self._indexes[attribute] = (positions, unhashable)
+        return self._indexes[attribute]
+
+    def select(self, **attributes):
+        """Select specific metadata, see :func:`select_metadata`."""
+        candidates = None
+        for attribute, value in attributes.items():
+            if isinstance(value, str) and value == '*':
+                continue
+            positions, unhashable = self._index(attribute)
+            try:
+                matches = positions.get(value, [])
+            except TypeError:
+                continue
+            matches = set(matches).union(unhashable)
+            if candidates is None:
+                candidates = matches
+            else:
+                candidates &= matches
+        if candidates is None:
+            candidates = range(len(self))
+        else:
+            candidates = sorted(candidates)
+
+        return MetadataList(
+            self[i] for i in candidates if _matches(self[i], attributes))
+
+    def group(self, attribute):
+        """Group metadata by attribute, see :func:`group_metadata`."""
+        positions, unhashable = self._index(attribute)
+        if unhashable:
+            # unhashable values cannot be group keys
+            hash(self[unhashable[0]][attribute])
+        return {
+            key: MetadataList(self[i] for i in group)
+            for key, group in positions.items()
+        }
+
+
+for _name in _LIST_MUTATORS:
+    setattr(MetadataList, _name, _invalidating(getattr(list, _name)))
+
+
+class InputData(dict):
+    """Metadata describing preprocessed data, by filename.
+
+    The dictionary of ``cfg['input_data']``; its values are a
+    :class:`MetadataList`, made once, so selections from
+    ``cfg['input_data'].values()`` share the same indexes.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._indexes = {}
+
+    def values(self):
+        """Get the metadata, as a :class:`MetadataList`."""
+        if 'values' not in self._indexes:
+            self._indexes['values'] = MetadataList(super().values())
+        return self._indexes['values']
+
+
+for _name in _DICT_MUTATORS:
+    setattr(InputData, _name, _invalidating(getattr(dict, _name)))
+
+
+def _matches(attributes, selection):
+    """Check if metadata have the selected attributes."""
+    return all(
+        a in attributes and (attributes[a] == value or value == '*')
+        for a, value in selection.items())
+
+
+# written like the list and dict they replace, e.g. to metadata files
+for _dumper in (
+        yaml.SafeDumper,
+        yaml.Dumper,
+        getattr(yaml, 'CSafeDumper', yaml.SafeDumper),
+        getattr(yaml, 'CDumper', yaml.Dumper),
+):
+    _dumper.add_representer(MetadataList, yaml.SafeDumper.represent_list)
+    _dumper.add_representer(InputData, yaml.SafeDumper.represent_dict)
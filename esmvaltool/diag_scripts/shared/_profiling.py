@@ -0,0 +1,229 @@
+"""Profiling and resource usage of Python diagnostics.
+
+Enabled with script settings of the recipe, or options of the diagnostic
+script when re-running it, so any diagnostic using
+:func:`esmvaltool.diag_scripts.shared.run_diagnostic` can be profiled
+without changes. All files are written to the run_dir of the diagnostic.
+"""
+import collections
+import contextlib
+import cProfile
+import logging
+import math
+import os
+import resource
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+PROFILERS = ('cprofile', 'sampling')
+PROFILE_FILE = 'profile.bin'
+STACKS_FILE = 'profile_stacks.txt'
+RESOURCE_USAGE_FILE = 'resource_usage.csv'
+
+
+def _peak_rss():
+    """Get the high-water mark of the resident memory of the process, in MB.
+
+    Diagnostics may reset it, e.g. to measure their own tasks, so it is
+    only the peak since the last reset.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        # in bytes rather than kB
+        peak /= 1024
+    return peak / 1024
+
+
+def _cpu_time():
+    """Get the CPU time of the process and its finished children, in s."""
+    return sum(
+        usage.ru_utime + usage.ru_stime for usage in (
+            resource.getrusage(resource.RUSAGE_SELF),
+            resource.getrusage(resource.RUSAGE_CHILDREN),
+        ))
+
+
+def _rss():
+    """Get the resident memory of the process, in MB, where available."""
+    try:
+        with open('/proc/self/statm') as file:
+            pages = int(file.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return float('nan')
+    return pages * os.sysconf('SC_PAGE_SIZE') / 1024**2
+
+
+def _io_counters():
+    """Get the MB read and written by the process, where available."""
+    try:
+        with open('/proc/self/io') as file:
+            fields = dict(line.split(':', 1) for line in file)
+        return (int(fields['rchar']) / 1024**2,
+                int(fields['wchar']) / 1024**2)
+    except (OSError, KeyError, ValueError):
+        return float('nan'), float('nan')
+
+
+class _Sampler(threading.Thread):
+    """Thread calling a function at regular intervals until stopped."""
+
+    def __init__(self, interval):
+        super().__init__(name=type(self).__name__, daemon=True)
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        """Sample until stopped."""
+        self.sample()
+        while not self._stop_event.wait(self.interval):
+            self.sample()
+        self.sample()
+
+    def sample(self):
+        """Take a sample."""
+        raise NotImplementedError
+
+    def stop(self):
+        """Stop sampling, after a last sample."""
+        self._stop_event.set()
+        self.join()
+
+
+class StackSampler(_Sampler):
+    """Sampling profiler, counting the call stacks of all threads.
+
+    The stacks are written as collapsed stacks, one line of frames
+    separated by semicolons and the number of samples per stack, as read
+    by flamegraph.pl or speedscope.
+    """
+
+    def __init__(self, interval):
+        super().__init__(interval)
+        self.stacks = collections.Counter()
+
+    def sample(self):
+        """Count the current stack of every other thread."""
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == self.ident:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                name = getattr(code, 'co_qualname', code.co_name)
+                stack.append(f"{name} ({os.path.basename(code.co_filename)}"
+                             f":{code.co_firstlineno})")
+                frame = frame.f_back
+            stack.append(names.get(ident, str(ident)))
+            self.stacks[';'.join(reversed(stack))] += 1
+
+    def write(self, filename):
+        """Write the collapsed stacks."""
+        with open(filename, 'w') as file:
+            for stack, count in self.stacks.most_common():
+                file.write(f"{stack} {count}\n")
+
+
+class ResourceSampler(_Sampler):
+    """Sampler of the CPU, memory and I/O of the process, to a CSV file.
+
+    The peak memory is the largest resident memory seen so far, sampled
+    or as the high-water mark of the process, so it still covers the
+    whole run if the diagnostic resets the high-water mark.
+    """
+
+    HEADER = ('time_s', 'cpu_time_s', 'cpu_percent', 'rss_mb',
+              'peak_rss_mb', 'read_mb', 'written_mb')
+
+    def __init__(self, interval, filename):
+        super().__init__(interval)
+        self._file = open(filename, 'w', buffering=1)
+        self._file.write(','.join(self.HEADER) + '\n')
+        self._start = self._last = (time.time(), _cpu_time())
+        self.peak_rss = 0.
+
+    def sample(self):
+        """Write the current resource usage."""
+        now, cpu = time.time(), _cpu_time()
+        elapsed = now - self._last[0]
+        percent = 100 * (cpu - self._last[1]) / elapsed if elapsed else 0.
+        self._last = (now, cpu)
+        rss = _rss()
+        self.peak_rss = max(self.peak_rss, _peak_rss(),
+                            0. if math.isnan(rss) else rss)
+        row = (now - self._start[0], cpu - self._start[1], percent, rss,
+               self.peak_rss, *_io_counters())
+        self._file.write(','.join(f"{value:.3f}" for value in row) + '\n')
+
+    def stop(self):
+        """Stop sampling, after a last sample."""
+        super().stop()
+        self._file.close()
+
+
+@contextlib.contextmanager
+def profile(cfg):
+    """Profile a diagnostic and sample its resource usage.
+
+    Parameters
+    ----------
+    cfg: dict
+        Dictionary with diagnostic configuration. Profiling is enabled by
+        the keys ``profiler``, either ``cprofile`` (deterministic, written
+        to ``profile.bin`` in pstats format) or ``sampling`` (written to
+        ``profile_stacks.txt`` as collapsed stacks, every
+        ``profiler_interval`` seconds, default 0.01), and
+        ``resource_usage`` (written to ``resource_usage.csv`` every
+        ``resource_usage_interval`` seconds, default 1).
+    """
+    profiler = cfg.get('profiler')
+    if profiler not in (None, *PROFILERS):
+        raise ValueError(
+            f"Unknown profiler '{profiler}', choose from {PROFILERS}")
+    run_dir = cfg['run_dir']
+    samplers = []
+    if cfg.get('resource_usage'):
+        samplers.append(ResourceSampler(
+            cfg.get('resource_usage_interval', 1.),
+            os.path.join(run_dir, RESOURCE_USAGE_FILE),
+        ))
+    if profiler == 'sampling':
+        samplers.append(StackSampler(cfg.get('profiler_interval', 0.01)))
+    for sampler in samplers:
+        sampler.start()
+    deterministic = cProfile.Profile() if profiler == 'cprofile' else None
+    start = time.time()
+    try:
+        if deterministic is None:
+            yield
+        else:
+            with deterministic:
+                yield
+    finally:
+        for sampler in samplers:
+            sampler.stop()
+            if isinstance(sampler, StackSampler):
+                filename = os.path.join(run_dir, STACKS_FILE)
+                sampler.write(filename)
+                logger.info("Wrote collapsed stacks of the diagnostic to %s",
+                            filename)
+            else:
+                logger.info("Wrote resource usage of the diagnostic to %s",
+                            os.path.join(run_dir, RESOURCE_USAGE_FILE))
+        if deterministic is not None:
+            filename = os.path.join(run_dir, PROFILE_FILE)
+            deterministic.dump_stats(filename)
+            logger.info("Wrote profile of the diagnostic to %s, view it "
+                        "with 'python -m pstats %s'", filename, filename)
+        peaks = [
+            sampler.peak_rss for sampler in samplers
+            if isinstance(sampler, ResourceSampler)
+        ]
+        if peaks:
+            logger.info("Diagnostic ran in %.1f s, peak memory %.1f MB",
+                        time.time() - start, peaks[0])
+        elif samplers or deterministic is not None:
+            logger.info("Diagnostic ran in %.1f s", time.time() - start)
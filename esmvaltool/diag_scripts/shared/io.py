@@ -2,15 +2,82 @@
 import fnmatch
 import logging
 import os
+import pickle
+import threading
+from concurrent import futures
 from pprint import pformat
 
 import iris
+import iris.std_names
+import netCDF4
 import numpy as np
+from cf_units import Unit
 
 from .iris_helpers import unify_1d_cubes
 
 logger = logging.getLogger(__name__)
 
+# HDF5 is not thread-safe, so netCDF files are only opened under the lock
+# iris uses, and never at the same time as iris reads a file in a thread
+try:
+    from iris.fileformats.netcdf._thread_safe_nc import (
+        _GLOBAL_NETCDF4_LOCK as _NETCDF_LOCK,
+    )
+except ImportError:
+    _NETCDF_LOCK = threading.Lock()
+
+NETCDF_METADATA_INDEX = 'netcdf_metadata_index.pickle'
+
+# metadata of netcdf files by (path, modification time, size)
+_METADATA_INDEX = {}
+_LOADED_INDEXES = set()
+
+# attributes of variables read by iris, which are not cube attributes
+_CF_VAR_ATTRS = {
+    'add_offset',
+    'ancillary_variables',
+    'axis',
+    'bounds',
+    'calendar',
+    'cell_measures',
+    'cell_methods',
+    'climatology',
+    'compress',
+    'coordinates',
+    '_FillValue',
+    'formula_terms',
+    'grid_mapping',
+    'leap_month',
+    'leap_year',
+    'long_name',
+    'missing_value',
+    'month_lengths',
+    'scale_factor',
+    'standard_error_multiplier',
+    'standard_name',
+    'units',
+}
+
+# attributes referring to other variables, which are then not data
+_CF_REFERENCES = (
+    'ancillary_variables',
+    'bounds',
+    'cell_measures',
+    'climatology',
+    'coordinates',
+    'formula_terms',
+    'grid_mapping',
+)
+
+# attributes only iris interprets, e.g. into STASH codes or meshes
+_IRIS_ATTRS = (
+    'location',
+    'mesh',
+    'ukmo__process_flags',
+    'ukmo__um_stash_source',
+    'um_stash_source',
+)
+
 VAR_KEYS = [
     'long_name',
     'units',
@@ -101,6 +168,12 @@ def get_ancestor_file(cfg, pattern):
 def netcdf_to_metadata(cfg, pattern=None, root=None):
     """Convert attributes of netcdf files to list of metadata.
 
+    Only the headers of the files are read, on a pool of threads, unless
+    a file needs iris to be understood, e.g. because it contains more than
+    one data variable. The metadata are kept in an index by path,
+    modification time and size, also saved in the run_dir of the
+    diagnostic, so files are not read again by later calls or re-runs.
+
     Parameters
     ----------
     cfg : dict
@@ -133,17 +206,7 @@ def netcdf_to_metadata(cfg, pattern=None, root=None):
     all_files = fnmatch.filter(all_files, '*.nc')
     all_files = sorted(all_files)
 
-    # Iterate over netcdf files
-    metadata = []
-    for path in all_files:
-        cube = iris.load_cube(path)
-        dataset_info = dict(cube.attributes)
-        for var_key in VAR_KEYS:
-            dataset_info[var_key] = str(getattr(cube, var_key))
-        dataset_info['short_name'] = cube.var_name
-        dataset_info['standard_name'] = cube.standard_name
-        dataset_info['filename'] = path
-        metadata.append(dataset_info)
+    metadata = _read_metadata(all_files, cfg.get('run_dir'))
 
     # Check if necessary keys are available
     if not _has_necessary_attributes(metadata, log_level='error'):
@@ -152,6 +215,128 @@ def netcdf_to_metadata(cfg, pattern=None, root=None):
     return metadata
 
 
+def _cube_metadata(cube):
+    """Get the metadata of a cube."""
+    dataset_info = dict(cube.attributes)
+    for var_key in VAR_KEYS:
+        dataset_info[var_key] = str(getattr(cube, var_key))
+    dataset_info['short_name'] = cube.var_name
+    dataset_info['standard_name'] = cube.standard_name
+    return dataset_info
+
+
+def _split_references(value):
+    """Get the names of the variables an attribute refers to."""
+    # e.g. "lat lon" or "area: areacella"
+    return [name for name in str(value).split() if not name.endswith(':')]
+
+
+def _read_header(path):
+    """Read the metadata of the data variable of a netcdf file.
+
+    Returns None if the file cannot be read, or only iris can convert it
+    like ``iris.load_cube`` would.
+    """
+    try:
+        with _NETCDF_LOCK, netCDF4.Dataset(path) as dataset:
+            global_attributes = dataset.__dict__
+            variables = {
+                name: (variable.__dict__, variable.dimensions)
+                for name, variable in dataset.variables.items()
+            }
+    except (OSError, RuntimeError):
+        return None
+
+    referenced = set()
+    for attributes, _ in variables.values():
+        for key in _CF_REFERENCES:
+            if key in attributes:
+                referenced.update(_split_references(attributes[key]))
+    data = [
+        name for name, (_, dimensions) in variables.items()
+        if name not in referenced and dimensions != (name, )
+    ]
+    if len(data) != 1:
+        return None
+    var_name = data[0]
+    attributes = variables[var_name][0]
+    standard_name = attributes.get('standard_name')
+    if standard_name is not None and (standard_name
+                                      not in iris.std_names.STD_NAMES):
+        return None
+    if any(key in attributes for key in _IRIS_ATTRS):
+        return None
+    try:
+        units = Unit(attributes.get('units', 'unknown'),
+                     calendar=attributes.get('calendar'))
+    except ValueError:
+        return None
+
+    dataset_info = dict(global_attributes)
+    dataset_info.update((key, value) for (key, value) in attributes.items()
+                        if key not in _CF_VAR_ATTRS)
+    dataset_info['long_name'] = str(attributes.get('long_name'))
+    dataset_info['units'] = str(units)
+    dataset_info['short_name'] = var_name
+    dataset_info['standard_name'] = standard_name
+    return dataset_info
+
+
+def _read_metadata(paths, run_dir=None):
+    """Read the metadata of netcdf files, using the index where possible."""
+    index_file = None
+    if run_dir is not None:
+        index_file = os.path.join(run_dir, NETCDF_METADATA_INDEX)
+        if index_file not in _LOADED_INDEXES and os.path.isfile(index_file):
+            try:
+                with open(index_file, 'rb') as file:
+                    _METADATA_INDEX.update(pickle.load(file))
+            except (OSError, EOFError, pickle.UnpicklingError, ValueError):
+                logger.debug("Ignoring unreadable index %s", index_file)
+        _LOADED_INDEXES.add(index_file)
+
+    keys = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            keys.append(None)
+        else:
+            keys.append((path, stat.st_mtime_ns, stat.st_size))
+    missing = [
+        path for (path, key) in zip(paths, keys)
+        if key not in _METADATA_INDEX
+    ]
+    with futures.ThreadPoolExecutor() as executor:
+        headers = dict(zip(missing, executor.map(_read_header, missing)))
+
+    metadata = []
+    for (path, key) in zip(paths, keys):
+        if key in _METADATA_INDEX:
+            dataset_info = dict(_METADATA_INDEX[key])
+        else:
+            dataset_info = headers[path]
+            if dataset_info is None:
+                logger.debug("Loading %s with iris", path)
+                dataset_info = _cube_metadata(iris.load_cube(path))
+            if key is not None:
+                _METADATA_INDEX[key] = dict(dataset_info)
+        dataset_info['filename'] = path
+        metadata.append(dataset_info)
+    logger.debug("Read headers of %i of %i netcdf files", len(missing),
+                 len(paths))
+
+    if missing and index_file is not None:
+        # written under another name first, so readers never see half a file
+        temporary = f'{index_file}.{os.getpid()}'
+        with open(temporary, 'wb') as file:
+            pickle.dump(_METADATA_INDEX, file,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary, index_file)
+
+    return metadata
+
+
 def metadata_to_netcdf(cube, metadata):
     """Convert single metadata dictionary to netcdf file.
 
@@ -79,6 +79,7 @@ REQUIREMENTS = {
     'test': [
         'flake8',
         'pytest>=3.9,!=6.0.0rc1,!=6.0.0',
+        'pytest-benchmark',
         'pytest-cov>=2.10.1',
         'pytest-env',
         'pytest-html!=2.1.0',
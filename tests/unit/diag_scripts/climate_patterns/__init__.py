@@ -0,0 +1,11 @@
+"""Tests for the climate_patterns diagnostic."""
+
+import sys
+from pathlib import Path
+
+import esmvaltool.diag_scripts
+
+# the diagnostic is a set of scripts, importing each other by name
+sys.path.insert(
+    0, str(Path(esmvaltool.diag_scripts.__file__).parent / "climate_patterns")
+)
@@ -0,0 +1,95 @@
+"""Fixtures of synthetic data for the climate_patterns tests.
+
+The size of the synthetic data can be set with environment variables:
+
+* CLIMATE_PATTERNS_GRID: number of latitudes and longitudes, e.g. 145x192
+  (default 64x96)
+* CLIMATE_PATTERNS_YEARS: number of years from 1850 (default 90)
+* CLIMATE_PATTERNS_VARIABLES: comma-separated short names (default, the
+  variables of recipe_climate_patterns.yml)
+* CLIMATE_PATTERNS_MASKED_FRACTION: fraction of masked grid cells
+  (default 0)
+"""
+
+import os
+
+import climate_patterns as cp
+import iris.cube
+import pytest
+import rename_variables
+import sub_functions as sf
+
+from tests.unit.diag_scripts.climate_patterns import synthetic_data
+
+RECIPE_VARIABLES = "tasmax,tasmin,tas,huss,pr,sfcWind,ps,rsds,rlds"
+
+
+@pytest.fixture(scope="session")
+def synthetic_config():
+    """Size of the synthetic data, from the environment."""
+    n_lat, n_lon = os.environ.get("CLIMATE_PATTERNS_GRID", "64x96").split("x")
+    variables = os.environ.get("CLIMATE_PATTERNS_VARIABLES", RECIPE_VARIABLES)
+
+    return {
+        "n_lat": int(n_lat),
+        "n_lon": int(n_lon),
+        "n_years": int(os.environ.get("CLIMATE_PATTERNS_YEARS", 90)),
+        "masked_fraction": float(
+            os.environ.get("CLIMATE_PATTERNS_MASKED_FRACTION", 0.0)
+        ),
+        "variables": tuple(variables.split(",")),
+    }
+
+
+@pytest.fixture(scope="session")
+def regression_years(synthetic_config):
+    """Number of years regressed, as in the diagnostic if possible."""
+    return min(85, synthetic_config["n_years"])
+
+
+@pytest.fixture(scope="session")
+def timeseries(synthetic_config):
+    """Monthly timeseries of all variables; do not modify."""
+    config = dict(synthetic_config)
+
+    return synthetic_data.make_cubes(config.pop("variables"), **config)
+
+
+@pytest.fixture(scope="session")
+def fractions(synthetic_config):
+    """Ocean and land fractions."""
+    sftlf = synthetic_data.make_land_fraction(
+        synthetic_config["n_lat"], synthetic_config["n_lon"]
+    )
+
+    return sf.ocean_fraction_calc(sftlf)
+
+
+@pytest.fixture(scope="session")
+def climatologies(timeseries):
+    """Monthly climatologies of all variables; do not modify."""
+    return iris.cube.CubeList([cp.climatology(cube) for cube in timeseries])
+
+
+@pytest.fixture(scope="session")
+def anomalies(climatologies, timeseries):
+    """Renamed climatologies and anomalies, with diurnal range."""
+    clim_list, anom_list = cp.calculate_anomaly(
+        [cube.copy() for cube in climatologies],
+        [cube.copy() for cube in timeseries],
+    )
+    for clim_cube, anom_cube in zip(clim_list, anom_list):
+        rename_variables.rename_clim_variables(clim_cube)
+        rename_variables.rename_anom_variables(anom_cube)
+
+    return clim_list, anom_list
+
+
+@pytest.fixture(scope="session")
+def patterns(anomalies, fractions, regression_years):
+    """Regression slopes and scores of all variables."""
+    regr_list, score_list, _ = cp.calculate_regressions(
+        anomalies[1], *fractions, "global", yrs=regression_years
+    )
+
+    return regr_list, score_list
@@ -0,0 +1,295 @@
+"""Synthetic CMIP6-like input data for the climate_patterns diagnostic.
+
+Monthly cubes look like preprocessed ESMValCore output: mid-month times
+with bounds, ``month_number`` and ``year`` coords, bounded latitude and
+longitude, and CMIP6 global attributes. Every variable is a seasonal
+cycle plus a response to a warming signal plus noise, so regressions on
+it give meaningful patterns.
+"""
+
+import datetime
+
+import iris.coord_categorisation
+import iris.coords
+import iris.cube
+import numpy as np
+from cf_units import Unit
+
+# short_name: standard_name, units, mean, seasonal amplitude, response to
+# 1 K of global warming, and noise
+VARIABLES = {
+    "tasmax": ("air_temperature", "K", 292.0, 8.0, 1.2, 1.0),
+    "tasmin": ("air_temperature", "K", 280.0, 8.0, 1.0, 1.0),
+    "tas": ("air_temperature", "K", 286.0, 8.0, 1.1, 1.0),
+    "hurs": ("relative_humidity", "%", 75.0, 5.0, -0.5, 2.0),
+    "huss": ("specific_humidity", "1", 8e-3, 2e-3, 5e-4, 3e-4),
+    "pr": ("precipitation_flux", "kg m-2 s-1", 3e-5, 1e-5, 1e-6, 3e-6),
+    "sfcWind": ("wind_speed", "m s-1", 6.0, 1.0, -0.05, 0.5),
+    "ps": ("surface_air_pressure", "Pa", 98000.0, 500.0, -10.0, 100.0),
+    "rsds": (
+        "surface_downwelling_shortwave_flux_in_air",
+        "W m-2",
+        180.0,
+        60.0,
+        -1.0,
+        10.0,
+    ),
+    "rlds": (
+        "surface_downwelling_longwave_flux_in_air",
+        "W m-2",
+        340.0,
+        20.0,
+        5.0,
+        5.0,
+    ),
+}
+
+TIME_UNITS = Unit("days since 1850-01-01", calendar="standard")
+
+
+def make_time_coord(start_year=1850, n_years=90):
+    """Make a monthly time coord, with points in the middle of each month.
+
+    Parameters
+    ----------
+    start_year : int
+        first year
+    n_years : int
+        number of years
+
+    Returns
+    -------
+    time : DimCoord
+        time coord, in days since 1850-01-01
+    """
+    starts = TIME_UNITS.date2num(
+        [
+            datetime.datetime(start_year + i // 12, i % 12 + 1, 1)
+            for i in range(12 * n_years + 1)
+        ]
+    )
+    bounds = np.stack([starts[:-1], starts[1:]], axis=-1)
+
+    return iris.coords.DimCoord(
+        bounds.mean(axis=1),
+        standard_name="time",
+        var_name="time",
+        units=TIME_UNITS,
+        bounds=bounds,
+    )
+
+
+def make_horizontal_coords(n_lat=64, n_lon=96):
+    """Make regular, bounded latitude and longitude coords.
+
+    Parameters
+    ----------
+    n_lat : int
+        number of latitudes
+    n_lon : int
+        number of longitudes
+
+    Returns
+    -------
+    lat : DimCoord
+        latitude coord
+    lon : DimCoord
+        longitude coord
+    """
+    lat_bounds = np.linspace(-90.0, 90.0, n_lat + 1)
+    lon_bounds = np.linspace(0.0, 360.0, n_lon + 1)
+    lat = iris.coords.DimCoord(
+        (lat_bounds[:-1] + lat_bounds[1:]) / 2,
+        standard_name="latitude",
+        var_name="lat",
+        units="degrees",
+        bounds=np.stack([lat_bounds[:-1], lat_bounds[1:]], axis=-1),
+    )
+    lon = iris.coords.DimCoord(
+        (lon_bounds[:-1] + lon_bounds[1:]) / 2,
+        standard_name="longitude",
+        var_name="lon",
+        units="degrees",
+        bounds=np.stack([lon_bounds[:-1], lon_bounds[1:]], axis=-1),
+        circular=True,
+    )
+
+    return lat, lon
+
+
+def warming_signal(n_years):
+    """Make a global warming signal, accelerating to 4 K at the end.
+
+    Parameters
+    ----------
+    n_years : int
+        number of years
+
+    Returns
+    -------
+    warming : arr
+        monthly warming, in K
+    """
+    return 4.0 * np.linspace(0.0, 1.0, 12 * n_years) ** 2
+
+
+def land_mask(n_lat=64, n_lon=96):
+    """Make a smooth pattern of continents, as a land fraction from 0 to 1.
+
+    Parameters
+    ----------
+    n_lat : int
+        number of latitudes
+    n_lon : int
+        number of longitudes
+
+    Returns
+    -------
+    land : arr
+        (lat, lon) land fraction
+    """
+    lat, lon = make_horizontal_coords(n_lat, n_lon)
+    lats, lons = np.meshgrid(
+        np.deg2rad(lat.points), np.deg2rad(lon.points), indexing="ij"
+    )
+    relief = np.sin(2 * lons) * np.cos(lats) + 0.5 * np.sin(3 * lats)
+
+    return np.clip(2 * relief, 0.0, 1.0)
+
+
+def make_land_fraction(n_lat=64, n_lon=96, dataset="SYNTHETIC"):
+    """Make a CMIP6-like sftlf cube.
+
+    Parameters
+    ----------
+    n_lat : int
+        number of latitudes
+    n_lon : int
+        number of longitudes
+    dataset : str
+        source_id of the data
+
+    Returns
+    -------
+    cube : cube
+        land fraction, in %
+    """
+    lat, lon = make_horizontal_coords(n_lat, n_lon)
+
+    return iris.cube.Cube(
+        (100 * land_mask(n_lat, n_lon)).astype(np.float32),
+        standard_name="land_area_fraction",
+        var_name="sftlf",
+        units="%",
+        dim_coords_and_dims=[(lat, 0), (lon, 1)],
+        attributes={
+            "source_id": dataset,
+            "experiment_id": "piControl",
+            "table_id": "fx",
+            "mip_era": "CMIP6",
+        },
+    )
+
+
+def make_cube(
+    short_name,
+    n_lat=64,
+    n_lon=96,
+    start_year=1850,
+    n_years=90,
+    masked_fraction=0.0,
+    dataset="SYNTHETIC",
+    seed=0,
+):
+    """Make a CMIP6-like monthly cube of a variable.
+
+    Parameters
+    ----------
+    short_name : str
+        CMIP6 short name, one of ``VARIABLES``
+    n_lat : int
+        number of latitudes
+    n_lon : int
+        number of longitudes
+    start_year : int
+        first year
+    n_years : int
+        number of years
+    masked_fraction : float
+        fraction of grid cells masked at all times, chosen at random
+    dataset : str
+        source_id of the data
+    seed : int
+        seed of the noise and of the masked cells
+
+    Returns
+    -------
+    cube : cube
+        float32 cube of the variable, (time, lat, lon)
+    """
+    standard_name, units, mean, amplitude, response, noise = VARIABLES[
+        short_name
+    ]
+    rng = np.random.default_rng(
+        [seed, sorted(VARIABLES).index(short_name)]
+    )
+    time = make_time_coord(start_year, n_years)
+    lat, lon = make_horizontal_coords(n_lat, n_lon)
+
+    months = np.arange(time.shape[0]) % 12
+    season = np.cos(2 * np.pi * months / 12)[:, np.newaxis, np.newaxis]
+    hemisphere = np.sin(np.deg2rad(lat.points))[:, np.newaxis]
+    # land warms faster than the ocean
+    amplification = 1.0 + 0.5 * land_mask(n_lat, n_lon)
+    warming = warming_signal(n_years)[:, np.newaxis, np.newaxis]
+
+    data = (
+        mean
+        + amplitude * season * hemisphere
+        + response * warming * amplification
+        + noise * rng.standard_normal((time.shape[0], n_lat, n_lon))
+    ).astype(np.float32)
+    mask = np.zeros((n_lat, n_lon), dtype=bool)
+    n_masked = int(round(masked_fraction * mask.size))
+    mask.flat[rng.choice(mask.size, n_masked, replace=False)] = True
+
+    cube = iris.cube.Cube(
+        np.ma.masked_array(
+            data, mask=np.broadcast_to(mask, data.shape).copy()
+        ),
+        standard_name=standard_name,
+        var_name=short_name,
+        units=units,
+        dim_coords_and_dims=[(time, 0), (lat, 1), (lon, 2)],
+        attributes={
+            "source_id": dataset,
+            "experiment_id": "historical-ssp585",
+            "variant_label": "r1i1p1f1",
+            "table_id": "Amon",
+            "mip_era": "CMIP6",
+        },
+    )
+    iris.coord_categorisation.add_month_number(cube, "time", "month_number")
+    iris.coord_categorisation.add_year(cube, "time", "year")
+
+    return cube
+
+
+def make_cubes(variables=tuple(VARIABLES), **kwargs):
+    """Make CMIP6-like monthly cubes of several variables.
+
+    Parameters
+    ----------
+    variables : tuple
+        CMIP6 short names
+    **kwargs : dict
+        keyword arguments of ``make_cube``
+
+    Returns
+    -------
+    cubes : cubelist
+        cubes of the variables, in order
+    """
+    return iris.cube.CubeList(
+        [make_cube(short_name, **kwargs) for short_name in variables]
+    )
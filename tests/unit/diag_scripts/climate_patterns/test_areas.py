@@ -0,0 +1,102 @@
+"""Tests for the areas of the climate_patterns regression predictor."""
+
+import areas as ar
+import iris
+import numpy as np
+import pytest
+import sub_functions as sf
+
+
+@pytest.fixture(scope="module")
+def tas(anomalies):
+    """Near-surface air temperature anomaly."""
+    return anomalies[1].extract_cube(iris.NameConstraint(var_name="tl1_anom"))
+
+
+def test_parse_areas(tmp_path):
+    """Test areas are named, and relative mask paths resolved."""
+    areas = ar.parse_areas(["land", "tropics", "masks/sahel.nc"], tmp_path)
+
+    assert areas == {
+        "land": "land",
+        "tropics": "tropics",
+        "sahel": str(tmp_path / "masks" / "sahel.nc"),
+    }
+    assert ar.parse_areas("global") == {"global": "global"}
+
+
+@pytest.mark.parametrize(
+    "area, message",
+    [
+        ("mars", "Unknown area 'mars'"),
+        ([], "No area chosen"),
+        (["land", "/masks/land.nc"], "'land' chosen more than once"),
+    ],
+)
+def test_parse_areas_invalid(area, message):
+    """Test unknown, missing and duplicate areas are rejected."""
+    with pytest.raises(ValueError, match=message):
+        ar.parse_areas(area)
+
+
+def test_area_means(tas, fractions):
+    """Test one pass over all areas matches averaging each area."""
+    areas = ar.parse_areas(["global", "land", "ocean", "tropics"])
+
+    means = ar.area_means(tas, areas, *fractions)
+
+    np.testing.assert_allclose(
+        means["global"], sf.area_avg(tas, return_cube=False), rtol=1e-10
+    )
+    for name in ("land", "ocean"):
+        np.testing.assert_allclose(
+            means[name],
+            sf.area_avg_landsea(
+                tas, *fractions, land=name == "land", return_cube=False
+            ),
+            rtol=1e-10,
+        )
+    tropics = tas.extract(
+        iris.Constraint(latitude=lambda cell: -30.0 <= cell <= 30.0)
+    )
+    np.testing.assert_allclose(
+        means["tropics"], sf.area_avg(tropics, return_cube=False), rtol=1e-10
+    )
+
+
+@pytest.mark.parametrize("chunks", [(100, -1, -1), (-1, 7, 13)])
+def test_area_means_lazy(tas, fractions, chunks):
+    """Test lazy cubes, in time chunks or tiles, match realised ones."""
+    areas = ar.parse_areas(["global", "land"])
+    lazy_tas = tas.copy(data=tas.lazy_data().rechunk(chunks))
+
+    means = ar.area_means(lazy_tas, areas, *fractions)
+
+    expected = ar.area_means(tas, areas, *fractions)
+    for name in areas:
+        np.testing.assert_allclose(means[name], expected[name])
+
+
+def test_mask_area(tmp_path, tas, fractions):
+    """Test a mask file averages over the cells it covers."""
+    land_frac = fractions[1]
+    path = tmp_path / "half_land.nc"
+    mask = land_frac.copy(data=np.ma.masked_equal(land_frac.data, 0.0))
+    mask.data[:, : mask.shape[1] // 2] = np.ma.masked
+    mask.units = "1"
+    iris.save(mask, str(path))
+
+    means = ar.area_means(tas, ar.parse_areas(str(path)), *fractions)
+
+    weights = sf.grid_weights(tas).weights["global"] * mask.data.filled(0.0)
+    expected = np.einsum("tij,ij->t", tas.data, weights) / weights.sum()
+    np.testing.assert_allclose(means["half_land"], expected, rtol=1e-10)
+
+
+def test_mask_other_grid(tmp_path, tas):
+    """Test masks on another grid are rejected."""
+    path = tmp_path / "coarse.nc"
+    iris.save(tas[0, ::2, ::2], str(path))
+
+    with pytest.raises(ValueError, match="not on the grid"):
+        ar.load_mask(str(path), tas)
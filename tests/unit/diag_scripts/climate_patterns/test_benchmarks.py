@@ -0,0 +1,216 @@
+"""Benchmarks of the climate_patterns diagnostic, on synthetic data.
+
+Besides the runtime, every benchmark records in ``extra_info`` the peak
+memory allocated by a separate run of the benchmarked function, and the
+peak resident set size of the process so far. Timing is disabled when
+pytest-xdist is active, so the benchmarks then just run once as tests.
+To track runtime and memory, run them without xdist, e.g.
+
+    pytest -n 0 --benchmark-only --benchmark-autosave \
+        tests/unit/diag_scripts/climate_patterns
+
+and compare runs with ``pytest-benchmark compare``. See ``conftest.py``
+for the size of the synthetic data.
+"""
+
+import os
+import resource
+import sys
+import tracemalloc
+
+import climate_patterns as cp
+import iris.cube
+import plotting
+import pytest
+import sub_functions as sf
+
+ROUNDS = int(os.environ.get("CLIMATE_PATTERNS_ROUNDS", 3))
+
+
+def max_rss():
+    """Get the peak resident set size of the process so far, in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        # in bytes rather than kB
+        peak /= 1024
+
+    return peak / 1024
+
+
+def peak_memory(function, setup):
+    """Measure the peak memory allocated by a function, in MB.
+
+    Parameters
+    ----------
+    function : callable
+        benchmarked function
+    setup : callable
+        function returning the args and kwargs of the benchmarked function
+
+    Returns
+    -------
+    peak : float
+        peak memory allocated by the function, including numpy arrays
+    """
+    args, kwargs = setup()
+    tracemalloc.start()
+    try:
+        function(*args, **kwargs)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return peak / 1024**2
+
+
+def run_benchmark(benchmark, function, *args, setup=None):
+    """Benchmark the runtime and peak memory of a function.
+
+    Parameters
+    ----------
+    benchmark : BenchmarkFixture
+        pytest-benchmark fixture
+    function : callable
+        benchmarked function
+    *args : any
+        arguments of the function, if there is no setup
+    setup : callable
+        function returning fresh args and kwargs for every round, for
+        functions modifying their arguments
+
+    Returns
+    -------
+    result : any
+        result of the function
+    """
+    if setup is None:
+        def setup():
+            return args, {}
+
+    if not benchmark.disabled:
+        # in a separate run, as tracing slows the function down
+        benchmark.extra_info["peak_memory_mb"] = peak_memory(function, setup)
+
+    result = benchmark.pedantic(function, setup=setup, rounds=ROUNDS)
+    benchmark.extra_info["peak_rss_mb"] = max_rss()
+
+    return result
+
+
+def copies(cubes):
+    """Copy cubes, for functions modifying them in place."""
+    return iris.cube.CubeList([cube.copy() for cube in cubes])
+
+
+def climatologies_of(timeseries):
+    """Make the climatologies of all variables."""
+    return [cp.climatology(cube) for cube in timeseries]
+
+
+def test_climatology(benchmark, timeseries):
+    """Benchmark making monthly climatologies."""
+    result = run_benchmark(benchmark, climatologies_of, timeseries)
+
+    assert len(result) == len(timeseries)
+    assert all(cube.shape[0] == 12 for cube in result)
+
+
+def test_calculate_anomaly(benchmark, climatologies, timeseries):
+    """Benchmark calculating anomalies, including the diurnal range."""
+    clim_list, anom_list = run_benchmark(
+        benchmark,
+        cp.calculate_anomaly,
+        setup=lambda: ((climatologies, copies(timeseries)), {}),
+    )
+
+    # tasmax and tasmin are replaced by the diurnal range
+    assert len(anom_list) == len(timeseries) - 1
+    assert anom_list[-1].var_name == "range_tl1"
+
+
+def test_calculate_regressions(
+    benchmark, anomalies, fractions, regression_years
+):
+    """Benchmark the regressions of all variables on global temperature."""
+    regressions, scores, uncertainties = run_benchmark(
+        benchmark,
+        cp.calculate_regressions,
+        anomalies[1],
+        *fractions,
+        "global",
+        regression_years,
+    )
+
+    assert len(regressions) == len(scores) == len(anomalies[1])
+    assert regressions[0].shape[0] == 12
+    assert not uncertainties
+
+
+@pytest.mark.parametrize("cached_weights", [False, True])
+def test_area_avg_landsea(benchmark, anomalies, fractions, cached_weights):
+    """Benchmark land averages, with or without precomputed weights."""
+    tas = [cube for cube in anomalies[1] if cube.var_name == "tl1_anom"][0]
+
+    def setup():
+        if not cached_weights:
+            sf.GRID_WEIGHTS.clear()
+        return (tas, *fractions), {"land": True, "return_cube": False}
+
+    result = run_benchmark(benchmark, sf.area_avg_landsea, setup=setup)
+
+    assert result.shape == tas.shape[:1]
+
+
+@pytest.mark.parametrize(
+    "output_options",
+    [None, {"compression": "zlib"}, {"dtype": "float32"}],
+    ids=["default", "zlib", "float32"],
+)
+def test_cube_saver(benchmark, tmp_path, anomalies, patterns,
+                    output_options):
+    """Benchmark saving all outputs, as in IMOGEN mode."""
+    list_of_cubelists = [*anomalies, *patterns]
+
+    run_benchmark(
+        benchmark,
+        cp.cube_saver,
+        list_of_cubelists,
+        str(tmp_path) + "/",
+        cp.OUTPUT_FILES,
+        "imogen_scores",
+        output_options,
+    )
+
+    assert sorted(path.name for path in tmp_path.iterdir()) == sorted(
+        cp.OUTPUT_FILES
+    )
+
+
+def test_plot_patterns(benchmark, tmp_path, patterns):
+    """Benchmark plotting patterns."""
+    run_benchmark(
+        benchmark, plotting.plot_patterns, patterns[0], str(tmp_path) + "/"
+    )
+
+    assert (tmp_path / "Patterns.png").exists()
+
+
+def test_plot_scores(benchmark, tmp_path, patterns):
+    """Benchmark plotting regression scores."""
+    run_benchmark(
+        benchmark, plotting.plot_scores, patterns[1], str(tmp_path) + "/"
+    )
+
+    assert (tmp_path / "score_timeseries.png").exists()
+
+
+def test_plot_cp_timeseries(benchmark, tmp_path, anomalies, patterns):
+    """Benchmark plotting climatologies, anomalies and patterns."""
+    run_benchmark(
+        benchmark,
+        plotting.plot_cp_timeseries,
+        [*anomalies, *patterns],
+        str(tmp_path) + "/",
+    )
+
+    assert (tmp_path / "Anomalies.png").exists()
@@ -0,0 +1,149 @@
+"""Tests for the climatology and anomaly cache of climate_patterns."""
+
+import os
+
+import cache
+import iris.cube
+import numpy as np
+import pytest
+from cache import AnomalyCache
+
+
+def make_cubes(value):
+    """Make small climatology and anomaly cubes."""
+    clim_cube = iris.cube.Cube(
+        np.full((12, 3), value, dtype=np.float32), var_name="tl1_clim"
+    )
+    anom_cube = iris.cube.Cube(
+        np.full((24, 3), value + 1, dtype=np.float32), var_name="tl1_anom"
+    )
+
+    return clim_cube, anom_cube
+
+
+@pytest.fixture(name="input_file")
+def fixture_input_file(tmp_path):
+    """Input file of cached entries."""
+    path = tmp_path / "tas.nc"
+    path.write_bytes(b"tas data")
+
+    return path
+
+
+def set_mtime(path, mtime):
+    """Set the modification time of a file, in seconds."""
+    os.utime(path, (mtime, mtime))
+
+
+def test_hit_miss(tmp_path, input_file):
+    """Test entries are missed until stored, then found and loaded."""
+    anomaly_cache = AnomalyCache(tmp_path / "cache")
+    key = anomaly_cache.key([input_file], variable="tas")
+
+    assert not anomaly_cache.contains(key)
+    anomaly_cache.put(key, *make_cubes(2.0))
+    assert anomaly_cache.contains(key)
+
+    clim_cube, anom_cube = anomaly_cache.get(key)
+    np.testing.assert_array_equal(clim_cube.data, 2.0)
+    np.testing.assert_array_equal(anom_cube.data, 3.0)
+    assert (anomaly_cache.hits, anomaly_cache.misses) == (1, 1)
+    # a new run finds entries of earlier ones
+    assert AnomalyCache(tmp_path / "cache").contains(key)
+
+
+def test_key_options(tmp_path, input_file):
+    """Test keys change with the options of the entry."""
+    anomaly_cache = AnomalyCache(tmp_path / "cache")
+
+    key = anomaly_cache.key([input_file], variable="tas", grid="full")
+
+    assert key == anomaly_cache.key(
+        [input_file], grid="full", variable="tas"
+    )
+    assert key != anomaly_cache.key(
+        [input_file], variable="tas", grid="constrained"
+    )
+
+
+def test_invalidation(tmp_path, input_file, monkeypatch):
+    """Test keys change with the contents of changed input files."""
+    checksummed = []
+    file_checksum = cache.file_checksum
+
+    def count_checksums(filename, *args):
+        checksummed.append(filename)
+        return file_checksum(filename, *args)
+
+    monkeypatch.setattr(cache, "file_checksum", count_checksums)
+    anomaly_cache = AnomalyCache(tmp_path / "cache")
+    set_mtime(input_file, 1000)
+    key = anomaly_cache.key([input_file])
+    anomaly_cache.put(key, *make_cubes(2.0))
+
+    # unchanged files are not read again, also by later runs
+    assert AnomalyCache(tmp_path / "cache").key([input_file]) == key
+    assert len(checksummed) == 1
+
+    # touched, but with the same contents
+    set_mtime(input_file, 2000)
+    assert anomaly_cache.key([input_file]) == key
+    assert len(checksummed) == 2
+
+    # same size, new contents and modification time
+    input_file.write_bytes(b"TAS DATA")
+    set_mtime(input_file, 3000)
+    changed_key = anomaly_cache.key([input_file])
+    assert changed_key != key
+    assert not anomaly_cache.contains(changed_key)
+
+    # new size, same modification time
+    input_file.write_bytes(b"more tas data")
+    set_mtime(input_file, 3000)
+    assert anomaly_cache.key([input_file]) not in (key, changed_key)
+    assert len(checksummed) == 4
+
+
+def test_evict(tmp_path):
+    """Test least recently used entries are evicted beyond the limit."""
+    anomaly_cache = AnomalyCache(tmp_path / "cache", max_size=1000)
+    for i, key in enumerate(["first", "second", "third"]):
+        anomaly_cache.put(key, *make_cubes(float(i)))
+        for path in anomaly_cache.cache_dir.glob(f"{key}_*.nc"):
+            set_mtime(path, 1000 + i)
+    entry_size = sum(
+        path.stat().st_size
+        for path in anomaly_cache.cache_dir.glob("first_*.nc")
+    )
+    # found again, so no longer the least recently used entry
+    assert anomaly_cache.contains("first")
+    anomaly_cache.in_use.clear()
+
+    anomaly_cache.max_size = 2.5 * entry_size / 1024**2
+    anomaly_cache.evict()
+
+    assert not anomaly_cache.contains("second")
+    assert anomaly_cache.contains("first")
+    assert anomaly_cache.contains("third")
+
+    # entries of the current run are kept, even beyond the limit
+    anomaly_cache.max_size = 0
+    anomaly_cache.in_use = {"third"}
+    anomaly_cache.evict()
+
+    assert sorted(
+        path.name for path in anomaly_cache.cache_dir.glob("*.nc")
+    ) == ["third_anom.nc", "third_clim.nc"]
+
+
+def test_unreadable_checksums(tmp_path, input_file):
+    """Test an unreadable checksums file is ignored, then replaced."""
+    cache_dir = tmp_path / "cache"
+    key = AnomalyCache(cache_dir).key([input_file])
+    (cache_dir / "checksums.yml").write_text("{a: [b")
+
+    anomaly_cache = AnomalyCache(cache_dir)
+
+    assert anomaly_cache.key([input_file]) == key
+    assert list(cache_dir.iterdir()) == [cache_dir / "checksums.yml"]
+    assert AnomalyCache(cache_dir).key([input_file]) == key
@@ -0,0 +1,80 @@
+"""Tests for the checkpoints of the climate_patterns diagnostic."""
+
+import checkpoint as ckpt
+import climate_patterns as cp
+
+DATASETS = [
+    {"dataset": "MODA", "short_name": "tas", "exp": "ssp585"},
+    {"dataset": "MODA", "short_name": "pr", "exp": "ssp585"},
+]
+
+
+def make_model(path, model):
+    """Write the outputs of a model, and its manifest."""
+    work_dir = path / "work" / model
+    plot_dir = path / "plots" / model
+    (work_dir / "global").mkdir(parents=True)
+    plot_dir.mkdir(parents=True)
+    (work_dir / "global" / "patterns.nc").write_bytes(bytes(10))
+    (plot_dir / "patterns.png").write_bytes(bytes(5))
+    key = ckpt.run_key(DATASETS, {"area": "global"})
+    ckpt.write_manifest(
+        model, key, work_dir, plot_dir, {"ssp585": {"global": "global"}}
+    )
+
+    return key
+
+
+def test_run_key():
+    """Test keys change with the datasets and options, not their order."""
+    key = ckpt.run_key(DATASETS, {"area": "global"})
+
+    assert key == ckpt.run_key(DATASETS[::-1], {"area": "global"})
+    assert key != ckpt.run_key(DATASETS[:1], {"area": "global"})
+    assert key != ckpt.run_key(DATASETS, {"area": "land"})
+
+
+def test_checkpoint_key():
+    """Test folding into stored statistics changes the key of a model."""
+    cfg = {"input_data": dict(enumerate(DATASETS))}
+    incremental = dict(cfg, incremental=True)
+    key = cp.checkpoint_key(incremental, "MODA")
+
+    assert key != cp.checkpoint_key(cfg, "MODA")
+    assert key != cp.checkpoint_key(
+        dict(incremental, statistics_dir="/shared/statistics"), "MODA"
+    )
+
+
+def test_complete_models(tmp_path):
+    """Test only models with the same key and all files are complete."""
+    key = make_model(tmp_path, "MODA")
+    make_model(tmp_path, "MODB")
+    make_model(tmp_path, "MODC")
+    (tmp_path / "plots" / "MODB" / "patterns.png").write_bytes(bytes(2))
+
+    manifests = ckpt.complete_models(
+        tmp_path / "work", {"MODA": key, "MODB": key, "MODC": "changed"}
+    )
+
+    assert list(manifests) == ["MODA"]
+    assert manifests["MODA"]["work_files"] == {"global/patterns.nc": 10}
+    assert manifests["MODA"]["runs"] == {"ssp585": {"global": "global"}}
+
+
+def test_restore_model(tmp_path):
+    """Test restoring copies the files and manifest into a new run."""
+    key = make_model(tmp_path, "MODA")
+    manifest = ckpt.complete_models(tmp_path / "work", {"MODA": key})["MODA"]
+
+    work_dir, copied = ckpt.restore_model(
+        manifest, tmp_path / "new_work", tmp_path / "new_plots"
+    )
+
+    assert copied == [str(tmp_path / "new_work" / "MODA" / "global" /
+                          "patterns.nc")]
+    assert (tmp_path / "new_plots" / "MODA" / "patterns.png").exists()
+    assert list(ckpt.complete_models(tmp_path / "new_work", {"MODA": key}))
+    assert ckpt.restore_model(
+        manifest, tmp_path / "work", tmp_path / "plots"
+    ) == (str(tmp_path / "work" / "MODA"), [])
@@ -0,0 +1,119 @@
+"""Tests for the climate_patterns emulator."""
+
+import climate_patterns as cp
+import iris
+import numpy as np
+import pytest
+from emulator import PatternEmulator
+
+from tests.unit.diag_scripts.climate_patterns import synthetic_data
+
+
+@pytest.fixture(scope="module")
+def model_dir(tmp_path_factory, anomalies, patterns):
+    """Outputs of the synthetic model, as saved in imogen_mode."""
+    path = tmp_path_factory.mktemp("SYNTHETIC")
+    cp.cube_saver(
+        [*anomalies, *patterns], str(path) + "/", cp.OUTPUT_FILES, "imogen"
+    )
+
+    return path
+
+
+@pytest.fixture(scope="module")
+def delta_t():
+    """Ten warming trajectories of 30 months."""
+    rng = np.random.default_rng(0)
+
+    return np.cumsum(rng.normal(0.01, 0.1, (10, 30)), axis=1)
+
+
+def test_emulate(model_dir, delta_t):
+    """Test fields are the climatology plus the pattern times warming."""
+    emulator = PatternEmulator.from_model_dir(model_dir)
+    pattern = iris.load_cube(model_dir / "patterns.nc", "range_tl1_patt")
+    clim = iris.load_cube(
+        model_dir / "climatology_variables.nc", "range_tl1_clim"
+    )
+
+    fields = emulator.emulate(delta_t, "range_tl1", start_month=3)
+
+    assert "range_tl1" in emulator.variables
+    assert fields.shape == delta_t.shape + pattern.shape[1:]
+    assert fields.dtype == np.float32
+    # the 12th step is in February
+    np.testing.assert_allclose(
+        fields[:, 11],
+        clim.data[1] + delta_t[:, 11, np.newaxis, np.newaxis]
+        * pattern.data[1],
+        rtol=1e-5,
+    )
+
+
+def test_emulate_anomalies(model_dir, delta_t):
+    """Test emulating anomalies, without a climatology."""
+    emulator = PatternEmulator(model_dir / "patterns.nc", variables=["tl1"])
+    pattern = iris.load_cube(model_dir / "patterns.nc", "tl1_patt")
+
+    fields = emulator.emulate(delta_t[0], "tl1")
+
+    assert emulator.variables == ["tl1"]
+    assert emulator.units["tl1"] == "K"
+    months = np.arange(delta_t.shape[1]) % 12
+    np.testing.assert_allclose(
+        fields,
+        delta_t[0, :, np.newaxis, np.newaxis] * pattern.data[months],
+        rtol=1e-5,
+    )
+
+
+def test_missing_variable(model_dir):
+    """Test asking for a variable without patterns."""
+    with pytest.raises(ValueError, match="not in"):
+        PatternEmulator(model_dir / "patterns.nc", variables=["tas"])
+
+
+def test_stream(model_dir, delta_t):
+    """Test streaming batches gives the same fields as one batch."""
+    emulator = PatternEmulator.from_model_dir(model_dir)
+    expected = emulator.emulate(delta_t, "tl1")
+    memory_budget = 3 * emulator.field_bytes(delta_t.shape[1]) / 1024**2
+
+    batches = list(
+        emulator.stream(delta_t, variables=["tl1"],
+                        memory_budget=memory_budget)
+    )
+
+    assert [batch for batch, _ in batches] == [
+        slice(0, 3), slice(3, 6), slice(6, 9), slice(9, 10)
+    ]
+    np.testing.assert_array_equal(
+        np.concatenate([fields["tl1"] for _, fields in batches]), expected
+    )
+
+
+def test_emulate_to_files(model_dir, delta_t, tmp_path):
+    """Test emulating into memory-mapped files."""
+    emulator = PatternEmulator.from_model_dir(model_dir)
+
+    paths = emulator.emulate_to_files(
+        delta_t, tmp_path, start_month=6, memory_budget=1
+    )
+
+    assert sorted(paths) == sorted(emulator.variables)
+    np.testing.assert_array_equal(
+        np.load(paths["precip"], mmap_mode="r"),
+        emulator.emulate(delta_t, "precip", start_month=6),
+    )
+
+
+def test_to_cube(model_dir, delta_t):
+    """Test emulating one trajectory as a cube."""
+    emulator = PatternEmulator.from_model_dir(model_dir)
+    time = synthetic_data.make_time_coord(2015, 2)
+
+    cube = emulator.to_cube(delta_t[0, :24], "tl1", time)
+
+    assert cube.shape[0] == 24
+    assert cube.units == "K"
+    assert cube.coord("time") == time
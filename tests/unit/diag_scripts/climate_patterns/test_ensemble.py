@@ -0,0 +1,118 @@
+"""Tests for the multi-model statistics of climate patterns."""
+
+import ensemble as ens
+import iris
+import iris.cube
+import numpy as np
+import pytest
+
+from tests.unit.diag_scripts.climate_patterns import synthetic_data
+
+
+def pattern_cube(data, var_name="tl1_patt", n_lat=4, n_lon=6):
+    """Make a (month, lat, lon) pattern cube."""
+    lat, lon = synthetic_data.make_horizontal_coords(n_lat, n_lon)
+    month = iris.coords.DimCoord(
+        np.arange(1, 13), var_name="imogen_drive", units="1"
+    )
+
+    return iris.cube.Cube(
+        data,
+        var_name=var_name,
+        long_name=var_name,
+        units="1",
+        dim_coords_and_dims=[(month, 0), (lat, 1), (lon, 2)],
+    )
+
+
+@pytest.fixture
+def pattern_files(tmp_path):
+    """Patterns files of three models on the same grid."""
+    rng = np.random.default_rng(0)
+    files = {}
+    for model in ("A", "B", "C"):
+        path = tmp_path / f"{model}_patterns.nc"
+        iris.save(
+            iris.cube.CubeList([
+                pattern_cube(rng.normal(1.0, 0.5, (12, 4, 6))),
+                pattern_cube(
+                    rng.normal(0.0, 1.0, (12, 4, 6)), "range_tl1_patt"
+                ),
+            ]),
+            str(path),
+        )
+        files[model] = path
+
+    return files
+
+
+def test_statistic_names():
+    """Test the names of the statistics."""
+    assert ens.statistic_names([5, 50, 97.5]) == [
+        "mean", "std", "p5", "p50", "p97.5", "agreement"
+    ]
+
+
+def test_ensemble_statistics(pattern_files):
+    """Test the statistics against numpy, for every variable."""
+    cubes = ens.ensemble_statistics(pattern_files, [10, 90])
+
+    assert len(cubes) == 2 * 5
+    for var_name in ("tl1_patt", "range_tl1_patt"):
+        data = np.stack([
+            iris.load_cube(str(path), var_name).data.filled()
+            for path in pattern_files.values()
+        ])
+        stats = {
+            cube.attributes["ensemble_statistic"]: cube
+            for cube in cubes
+            if cube.var_name.startswith(var_name + "_")
+        }
+        np.testing.assert_allclose(stats["mean"].data, data.mean(axis=0))
+        np.testing.assert_allclose(
+            stats["std"].data, data.std(axis=0, ddof=1)
+        )
+        np.testing.assert_allclose(
+            stats["p90"].data, np.percentile(data, 90, axis=0)
+        )
+        agreement = np.mean(
+            np.sign(data) == np.sign(data.mean(axis=0)), axis=0
+        )
+        np.testing.assert_allclose(stats["agreement"].data, agreement)
+        assert stats["agreement"].units == "1"
+        assert stats["mean"].attributes["ensemble_models"] == "A B C"
+        assert stats["std"].cell_methods[0].method == "standard_deviation"
+
+
+def test_block_statistics_missing():
+    """Test cells without data in some or all models."""
+    block = np.ma.masked_array(
+        [[1.0, 2.0, -1.0], [3.0, 4.0, -1.0], [5.0, 6.0, -1.0]],
+        mask=[[False, True, True], [False, False, True],
+              [False, False, True]],
+    )
+
+    stats = ens.block_statistics(block, [50])
+
+    np.testing.assert_allclose(stats[:, 0], [3.0, 2.0, 3.0, 1.0])
+    np.testing.assert_allclose(stats[:2, 1], [5.0, np.sqrt(2.0)])
+    assert np.all(np.isnan(stats[:3, 2]))
+
+
+def test_regrid_to_first_model(tmp_path):
+    """Test patterns on another grid are regridded to the first model's."""
+    files = {}
+    for model, (n_lat, n_lon) in {"A": (4, 6), "B": (8, 12)}.items():
+        files[model] = tmp_path / f"{model}_patterns.nc"
+        iris.save(
+            pattern_cube(np.ones((12, n_lat, n_lon)), n_lat=n_lat,
+                         n_lon=n_lon),
+            str(files[model]),
+        )
+
+    patterns = ens.load_patterns(files)
+
+    (_, first), (_, second) = patterns["tl1_patt"]
+    assert ens.same_grid(second, first)
+    cubes = ens.ensemble_statistics(files, [50])
+    assert cubes[0].shape == (12, 4, 6)
@@ -0,0 +1,66 @@
+"""Tests for the incremental regressions of climate_patterns."""
+
+import climate_patterns as cp
+import incremental as inc
+import iris
+import numpy as np
+
+
+def test_fold_years(tmp_path, anomalies, fractions, regression_years):
+    """Test folding years in one at a time matches one full regression."""
+    anom_list = anomalies[1]
+    tas = anom_list.extract_cube(iris.NameConstraint(var_name="tl1_anom"))
+    cube = anom_list.extract_cube(iris.NameConstraint(var_name="wind_anom"))
+    cube = cube.copy(data=(cube.data + 5.0).astype(np.float32))
+    predictor = cp.regression_predictor(
+        tas, *fractions, "global", yrs=regression_years
+    )
+    regr_cube, score_cube = cp.regress_variable(
+        cube, predictor, yrs=regression_years
+    )
+
+    path = tmp_path / inc.STATISTICS_FILE
+    stats_cube = None
+    n_time = cube.shape[0]
+    for year in range(regression_years):
+        end = n_time - (regression_years - 1 - year) * 12
+        year_tas = predictor["tas_data"][year * 12:(year + 1) * 12]
+        year_predictor = cp.make_predictor(tas[:end], year_tas, yrs=1)
+        folded = {"r1": (0, year)}
+        fold_regr, fold_score, stats_cube = cp.regress_increment(
+            "sfcWind", 1, folded, stats_cube, year_predictor,
+            (None, cube[:end]),
+        )
+        if year == regression_years // 2:
+            # the statistics are stored between runs
+            inc.save_state(path, {}, [stats_cube], folded)
+            stats_cube = inc.load_state(path)["stats"]["sfcWind"]
+
+    np.testing.assert_allclose(fold_regr.data, regr_cube.data, rtol=1e-10)
+    np.testing.assert_allclose(
+        fold_score.data, score_cube.data, rtol=1e-10, atol=1e-12
+    )
+    stored_regr, stored_score, _ = cp.patterns_from_statistics(
+        stats_cube, stats_cube, folded
+    )
+    assert stored_regr.attributes["regression_folded_years"] == (
+        f"r1:0-{regression_years - 1}"
+    )
+    assert fold_score.attributes == stored_score.attributes
+    np.testing.assert_allclose(stored_regr.data, regr_cube.data, rtol=1e-10)
+    np.testing.assert_allclose(
+        stored_score.data, score_cube.data, rtol=1e-10, atol=1e-12
+    )
+
+
+def test_years_to_fold():
+    """Test new members are folded over 85 years, known ones extended."""
+    n_years, folded = inc.years_to_fold({}, "r1", 1850, 2100)
+    assert (n_years, folded) == (85, {"r1": (2016, 2100)})
+
+    n_years, folded = inc.years_to_fold(folded, "r1", 1850, 2110)
+    assert (n_years, folded) == (10, {"r1": (2016, 2110)})
+
+    n_years, folded = inc.years_to_fold(folded, "r2", 2015, 2050)
+    assert n_years == 36
+    assert inc.format_folded_years(folded) == "r1:2016-2110 r2:2015-2050"
@@ -0,0 +1,300 @@
+"""Tests for the measurements of climate_patterns tasks per stage."""
+
+import csv
+import os
+import threading
+
+import instrumentation as inst
+import pytest
+import scheduler
+from scheduler import Scheduler
+
+
+def make_stats(wall, peak_rss=100.0, read=1.0):
+    """Make the measurements of a task."""
+    return {
+        "wall": wall,
+        "cpu": wall / 2,
+        "peak_rss": peak_rss,
+        "read": read,
+        "written": None,
+    }
+
+
+@pytest.mark.parametrize(
+    "key, run, stage",
+    [
+        (("MOD", "ssp585", "load", "tas"), ("MOD", "ssp585"), "load"),
+        (("MOD", "climatology", "tas", "r1"), ("MOD",), "climatology"),
+        (("MOD", "ssp585", "plot", "scores", 0), ("MOD", "ssp585"), "plot"),
+        (("ensemble", "ssp585"), (), "ensemble"),
+        (("MOD", "unknown"), ("MOD", "unknown"), "other"),
+    ],
+)
+def test_task_stage(key, run, stage):
+    """Test tasks are grouped by the name of their stage."""
+    assert inst.task_stage(key) == (run, stage)
+
+
+def test_stage_totals():
+    """Test times and bytes are summed, and peak memory is the largest."""
+    stats = {
+        ("MOD", "ssp585", "regression", "tas"): make_stats(2.0, 300.0),
+        ("MOD", "ssp585", "load", "tas"): make_stats(1.0, 200.0),
+        ("MOD", "ssp585", "load", "pr"): make_stats(3.0, 100.0, None),
+        ("OTHER", "ssp585", "load", "tas"): make_stats(5.0),
+    }
+
+    totals = inst.stage_totals(
+        stats, lambda run: run[0] if run[0] == "MOD" else None
+    )
+
+    assert list(totals) == ["MOD"]
+    assert list(totals["MOD"]) == ["load", "regression"]
+    assert totals["MOD"]["load"] == {
+        "tasks": 2,
+        "wall": 4.0,
+        "cpu": 2.0,
+        "peak_rss": 200.0,
+        "read": 1.0,
+        "written": None,
+    }
+
+
+def test_write_stats(tmp_path):
+    """Test the totals are written one stage per row."""
+    stats = {
+        ("MOD", "load", "tas"): make_stats(1.0),
+        ("MOD", "plot", "patterns"): make_stats(2.0),
+    }
+    path = tmp_path / inst.STATS_FILE
+
+    inst.write_stats(path, inst.stage_totals(stats)[None])
+
+    with open(path, encoding="utf-8") as file:
+        rows = list(csv.DictReader(file))
+    assert [row["stage"] for row in rows] == ["load", "plot"]
+    assert rows[1]["wall_s"] == "2.000"
+    assert rows[1]["written_mb"] == ""
+
+    table = inst.summary_table(inst.stage_totals(stats)[None])
+    assert table.splitlines()[-1].split()[:3] == ["total", "2", "3.0"]
+
+
+@pytest.mark.parametrize("backend", ["serial", "thread"])
+def test_scheduler_stats(backend):
+    """Test every task run by the scheduler is measured."""
+    tasks = Scheduler(backend=backend, workers=2)
+    tasks.add(("a",), sum, [1, 2])
+    tasks.add(("b",), lambda a: a * 2, depends=[("a",)])
+
+    results = tasks.run()
+
+    assert results[("b",)] == 6
+    assert set(tasks.stats) == {("a",), ("b",)}
+    for stats in tasks.stats.values():
+        assert set(stats) == {"wall", "cpu", "peak_rss", "read", "written"}
+        assert stats["wall"] >= 0.0
+
+
+def test_run_task_io(tmp_path):
+    """Test the bytes written by a task are measured."""
+    if scheduler.io_counters() is None:
+        pytest.skip("/proc/self/io is not available")
+
+    _, stats = scheduler.run_task(
+        (tmp_path / "data").write_bytes, (bytes(2 * 1024**2),)
+    )
+
+    assert stats["written"] == pytest.approx(2.0, abs=0.1)
+
+
+def allocate(size):
+    """Hold a buffer of a number of MB for a moment."""
+    buffer = bytearray(size * 1024**2)
+    return len(buffer)
+
+
+def test_run_task_peak():
+    """Test the peak memory of the main process is never reset."""
+    if not scheduler.reset_peak_rss():
+        pytest.skip("the peak memory cannot be reset")
+    allocate(200)
+    process_peak = scheduler.peak_rss()
+
+    _, stats = scheduler.run_task(allocate, (10,))
+    # reset only where asked, and not in the main process by the scheduler
+    tasks = Scheduler(backend="serial")
+    tasks.add(("a",), allocate, 10)
+    tasks.run()
+
+    assert stats["peak_rss"] is None
+    assert tasks.stats[("a",)]["peak_rss"] is None
+    assert scheduler.peak_rss() >= process_peak
+
+    _, stats = scheduler.run_task(allocate, (10,), reset_peak=True)
+    assert stats["peak_rss"] < process_peak
+
+
+def fail_once(path):
+    """Fail the first time, by killing the worker process, then succeed."""
+    if not path.exists():
+        path.touch()
+        os._exit(1)
+    return 1
+
+
+def fail():
+    """Fail."""
+    raise ValueError("failed")
+
+
+def add_one(value):
+    """Add one to a value."""
+    return value + 1
+
+
+@pytest.mark.parametrize("backend", ["serial", "thread", "process"])
+def test_scheduler_retries(backend, tmp_path):
+    """Test failed tasks run again, even if their worker process died."""
+    if backend == "process":
+        task = fail_once
+    else:
+        def task(path):
+            if not path.exists():
+                path.touch()
+                raise OSError("failed")
+            return 1
+
+    tasks = Scheduler(backend=backend, workers=2, retries=1)
+    tasks.add(("a",), task, tmp_path / "a")
+    tasks.add(("b",), add_one, depends=[("a",)])
+
+    assert tasks.run() == {("b",): 2}
+
+    tasks = Scheduler(backend=backend, workers=2)
+    tasks.add(("a",), task, tmp_path / "c")
+    with pytest.raises(Exception):
+        tasks.run()
+
+
+@pytest.mark.parametrize("backend", ["serial", "thread"])
+def test_scheduler_isolate(backend):
+    """Test tasks depending on a failed task are skipped, others run."""
+    tasks = Scheduler(backend=backend, workers=2, isolate=True)
+    tasks.add(("a", "load"), fail)
+    tasks.add(("a", "fit"), lambda a: a, depends=[("a", "load")])
+    tasks.add(("b", "load"), sum, [1, 2])
+    tasks.add(("b", "fit"), lambda b: b * 2, depends=[("b", "load")])
+    tasks.add(
+        ("ensemble",), lambda a, b: a + b, depends=[("a", "fit"), ("b", "fit")]
+    )
+
+    results = tasks.run()
+
+    assert results == {}
+    assert list(tasks.failures) == [("a", "load")]
+    assert isinstance(tasks.failures[("a", "load")], ValueError)
+    assert tasks.skipped == {
+        ("a", "fit"): ("a", "load"),
+        ("ensemble",): ("a", "load"),
+    }
+    assert set(tasks.stats) == {("b", "load"), ("b", "fit")}
+
+
+def locked_pid(lock):
+    """Get the process a lock, which cannot be pickled, was passed in."""
+    with lock:
+        return os.getpid()
+
+
+def die():
+    """Kill the worker process."""
+    os._exit(1)
+
+
+@pytest.mark.parametrize("workers", [2, 4])
+def test_scheduler_groups(workers):
+    """Test tasks of a group share a process, and only export results."""
+    tasks = Scheduler(backend="process", workers=workers, group_depth=1)
+    for name in ("a", "b"):
+        tasks.add((name, "load"), threading.Lock)
+        tasks.add((name, "fit"), locked_pid, depends=[(name, "load")])
+        tasks.add((name, "check"), locked_pid, depends=[(name, "load")])
+    tasks.add(("ensemble",), list, depends=[[("a", "fit"), ("b", "fit")]])
+
+    results = tasks.run()
+
+    assert list(results) == [
+        ("a", "check"), ("b", "check"), ("ensemble",)
+    ]
+    pids = results[("ensemble",)]
+    assert os.getpid() not in pids
+    assert pids == [results[("a", "check")], results[("b", "check")]]
+    assert set(tasks.stats) == set(tasks.tasks)
+
+
+def wait(barrier):
+    """Wait for all parties of a barrier."""
+    return barrier.wait()
+
+
+def test_scheduler_groups_share_workers():
+    """Test free workers run the tasks of the last group in parallel."""
+    tasks = Scheduler(backend="process", workers=2, group_depth=1)
+    for name in ("a", "b", "c"):
+        tasks.add((name, "load"), sum, [1, 2])
+    # both tasks only finish if they run at the same time
+    tasks.add(("c", "barrier"), threading.Barrier, 2, None, 10.0)
+    for index in range(2):
+        tasks.add(("c", "fit", index), wait, depends=[("c", "barrier")])
+
+    results = tasks.run()
+
+    assert {results[("c", "fit", index)] for index in range(2)} == {0, 1}
+    assert not tasks.failures
+
+
+def test_scheduler_groups_isolate(tmp_path):
+    """Test failed tasks, and dead workers, of groups skip dependents."""
+    tasks = Scheduler(
+        backend="process", workers=2, isolate=True, group_depth=1
+    )
+    tasks.add(("a", "load"), fail)
+    tasks.add(("a", "fit"), add_one, depends=[("a", "load")])
+    tasks.add(("b", "load"), sum, [1, 2])
+    tasks.add(("b", "fit"), add_one, depends=[("b", "load")])
+    tasks.add(("c", "load"), die)
+    tasks.add(("c", "fit"), add_one, depends=[("c", "load")])
+    tasks.add(("ensemble",), list, depends=[[("a", "fit"), ("b", "fit")]])
+    tasks.add(("ensemble_b",), add_one, depends=[("b", "fit")])
+
+    results = tasks.run()
+
+    assert results == {("ensemble_b",): 5}
+    assert list(tasks.failures) in (
+        [("a", "load"), ("c",)], [("c",), ("a", "load")]
+    )
+    assert tasks.skipped == {
+        ("a", "fit"): ("a", "load"),
+        ("c", "load"): ("c",),
+        ("c", "fit"): ("c",),
+        ("ensemble",): ("a", "load"),
+    }
+    assert set(tasks.stats) == {("b", "load"), ("b", "fit"), ("ensemble_b",)}
+
+
+def test_scheduler_remove_leaves():
+    """Test removing and finding the last tasks of a model."""
+    tasks = Scheduler()
+    tasks.add(("a", "load"), sum, [1, 2])
+    tasks.add(("a", "fit"), lambda a: a, depends=[("a", "load")])
+    tasks.add(("a", "plot"), lambda a: a, depends=[("a", "load")])
+    tasks.add(("b", "load"), sum, [3])
+
+    assert tasks.leaves(("a",)) == [("a", "fit"), ("a", "plot")]
+
+    tasks.remove(("a",))
+
+    assert tasks.leaves() == [("b", "load")]
+    assert tasks.run() == {("b", "load"): 3}
@@ -0,0 +1,168 @@
+"""Tests for the tasks building the patterns of a model, per scenario."""
+
+import climate_patterns as cp
+import iris
+import numpy as np
+import pytest
+from scheduler import Scheduler
+
+from tests.unit.diag_scripts.climate_patterns import synthetic_data
+
+N_LAT, N_LON = 4, 6
+
+
+def dataset_dicts(path, exp, ensemble,
+                  variables=tuple(synthetic_data.VARIABLES)):
+    """Make the metadata of the datasets of a scenario of MOD."""
+    return [
+        {
+            "dataset": "MOD",
+            "short_name": short_name,
+            "exp": exp,
+            "ensemble": ensemble,
+            "start_year": 1850,
+            "end_year": 1939,
+            "filename": str(path / f"{short_name}_{exp}_{ensemble}.nc"),
+        }
+        for short_name in variables
+        if short_name != "hurs"
+    ]
+
+
+def make_cfg(path, datasets, **options):
+    """Make the config of a diagnostic run on the datasets."""
+    sftlf = {
+        "dataset": "MOD",
+        "short_name": "sftlf",
+        "exp": "piControl",
+        "filename": str(path / "sftlf.nc"),
+    }
+    cfg = {
+        "input_data": {
+            dataset["filename"]: dataset for dataset in [sftlf, *datasets]
+        },
+        "grid": "full",
+        "imogen_mode": "off",
+        "output_r2_scores": False,
+        "plots": False,
+        "work_dir": str(path / "work"),
+        "plot_dir": str(path / "plots"),
+        "run_dir": str(path / "run"),
+    }
+    cfg.update(options)
+
+    return cfg
+
+
+def write_datasets(path, datasets, seed=0):
+    """Write synthetic files of the datasets, and of the land fraction."""
+    iris.save(
+        synthetic_data.make_land_fraction(N_LAT, N_LON, dataset="MOD"),
+        str(path / "sftlf.nc"),
+    )
+    for dataset in datasets:
+        cube = synthetic_data.make_cube(
+            dataset["short_name"],
+            n_lat=N_LAT,
+            n_lon=N_LON,
+            dataset="MOD",
+            seed=seed,
+        )
+        cube.attributes["experiment_id"] = dataset["exp"]
+        iris.save(cube, dataset["filename"])
+
+
+def test_scenario_outputs(tmp_path):
+    """Test every scenario is saved in its own subdirectory."""
+    datasets = (
+        dataset_dicts(tmp_path, "historical-ssp126", "r1i1p1f1")
+        + dataset_dicts(tmp_path, "historical-ssp585", "r1i1p1f1")
+    )
+    write_datasets(tmp_path, datasets)
+    scheduler = Scheduler(backend="serial")
+
+    runs = cp.add_model_tasks(scheduler, "MOD", make_cfg(tmp_path, datasets))
+    results = scheduler.run(
+        keep=[area_runs["global"][0] for area_runs in runs.values()]
+    )
+
+    assert sorted(runs) == ["ssp126", "ssp585"]
+    for scenario, area_runs in runs.items():
+        saved = results[area_runs["global"][0]]
+        assert saved["work_dir"] == str(
+            tmp_path / "work" / "MOD" / scenario
+        ) + "/"
+        patterns = iris.load_cube(
+            str(tmp_path / "work" / "MOD" / scenario / cp.OUTPUT_FILES[2]),
+            iris.NameConstraint(var_name="tl1_patt"),
+        )
+        assert patterns.shape == (12, N_LAT, N_LON)
+    assert not scheduler.failures
+    # identical data in both scenarios gives identical patterns
+    first, second = (
+        iris.load_cube(
+            str(tmp_path / "work" / "MOD" / scenario / cp.OUTPUT_FILES[2]),
+            iris.NameConstraint(var_name="precip_patt"),
+        )
+        for scenario in runs
+    )
+    np.testing.assert_array_equal(first.data, second.data)
+
+
+def test_single_scenario_outputs(tmp_path):
+    """Test a single scenario is saved in the model directory."""
+    datasets = dataset_dicts(tmp_path, "historical-ssp585", "r1i1p1f1")
+    scheduler = Scheduler(backend="serial")
+
+    runs = cp.add_model_tasks(scheduler, "MOD", make_cfg(tmp_path, datasets))
+
+    save_key = runs["ssp585"]["global"][0]
+    assert scheduler.tasks[save_key][1][0]["scenario_dir"] == ""
+
+
+def test_shared_climatology(tmp_path):
+    """Test climatologies are shared by the scenarios of one member."""
+    datasets = (
+        dataset_dicts(tmp_path, "historical-ssp585", "r1i1p1f1")
+        + dataset_dicts(tmp_path, "historical-ssp245", "r2i1p1f1")
+        + dataset_dicts(tmp_path, "ssp126", "r1i1p1f1")
+        + dataset_dicts(tmp_path, "ssp370", "r3i1p1f1")
+    )
+    scheduler = Scheduler(backend="serial")
+
+    cp.add_model_tasks(scheduler, "MOD", make_cfg(tmp_path, datasets))
+
+    climatologies = {
+        key[2:]: scheduler.tasks[key][1][0]["filename"]
+        for key in scheduler.tasks
+        if key[1] == "climatology"
+    }
+    assert climatologies[("tas", "r1i1p1f1")].endswith(
+        "tas_historical-ssp585_r1i1p1f1.nc"
+    )
+    assert climatologies[("tas", "r2i1p1f1")].endswith(
+        "tas_historical-ssp245_r2i1p1f1.nc"
+    )
+    assert len(climatologies) == 2 * (len(synthetic_data.VARIABLES) - 1)
+
+    def depends(scenario):
+        return scheduler.tasks["MOD", scenario, "load", "tas"][2]
+
+    assert depends("ssp585") == (("MOD", "climatology", "tas", "r1i1p1f1"),)
+    assert depends("ssp126") == (("MOD", "climatology", "tas", "r1i1p1f1"),)
+    assert depends("ssp245") == (("MOD", "climatology", "tas", "r2i1p1f1"),)
+    # no historical period of r3, its anomalies are from its first year
+    assert depends("ssp370") == ()
+
+
+def test_duplicate_variables(tmp_path):
+    """Test several members of a variable in one scenario are rejected."""
+    datasets = (
+        dataset_dicts(tmp_path, "historical-ssp585", "r1i1p1f1")
+        + dataset_dicts(tmp_path, "historical-ssp585", "r2i1p1f1", ["tas"])
+    )
+
+    with pytest.raises(ValueError, match="Several tas datasets of MOD ssp585"):
+        cp.add_model_tasks(
+            Scheduler(backend="serial"), "MOD", make_cfg(tmp_path, datasets)
+        )
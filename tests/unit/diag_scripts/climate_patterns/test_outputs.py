@@ -0,0 +1,85 @@
+"""Tests for the encoding of the output files of climate_patterns."""
+
+import climate_patterns as cp
+import iris
+import iris.cube
+import netCDF4
+import numpy as np
+import pytest
+
+
+@pytest.fixture(name="output_cubes")
+def fixture_output_cubes(anomalies, patterns):
+    """Anomalies and patterns, with missing values of both kinds."""
+    anom_cube = anomalies[1][0][:24].copy()
+    anom_cube.data = np.ma.masked_array(anom_cube.data)
+    anom_cube.data[:, 0, :3] = np.ma.masked
+    regr_cube = patterns[0][0].copy()
+    regr_cube.data = np.ma.masked_array(regr_cube.data, copy=True)
+    regr_cube.data[:, 1, :2] = np.nan
+    regr_cube.data[:, 2, :2] = np.ma.masked
+
+    return iris.cube.CubeList([anom_cube, regr_cube])
+
+
+@pytest.mark.parametrize(
+    "output_options",
+    [
+        {"compression": "zlib", "complevel": 4},
+        {"dtype": "float32"},
+        {"compression": "zlib", "complevel": 1, "dtype": "float32"},
+        {"dtype": "int16"},
+        {"compression": "zlib", "complevel": 4, "dtype": "int16"},
+    ],
+)
+def test_round_trip(tmp_path, output_cubes, output_options):
+    """Test encoded files decode to the data, with missing values kept."""
+    path = str(tmp_path / "output.nc")
+
+    for cube in output_cubes:
+        cp.save_cubelist(
+            iris.cube.CubeList([cube]),
+            path,
+            output_options=output_options,
+        )
+        loaded = iris.load_cube(path)
+
+        with netCDF4.Dataset(path) as dataset:
+            variable = dataset[cube.var_name]
+            filters = variable.filters()
+            chunking = variable.chunking()
+            scale = variable.__dict__.get("scale_factor", 0.0)
+            dtype = variable.dtype
+            fill_value = variable.__dict__.get("_FillValue")
+
+        if output_options.get("dtype") == "int16":
+            assert dtype == np.int16
+            assert fill_value == cp.INT16_FILL_VALUE
+        else:
+            assert dtype == (output_options.get("dtype") or cube.dtype)
+
+        if output_options.get("compression") == "zlib":
+            assert filters["zlib"]
+            assert filters["complevel"] == output_options["complevel"]
+            if cube.ndim == 3:
+                assert chunking == [1, *cube.shape[1:]]
+        else:
+            assert not filters["zlib"]
+
+        # NaNs are missing in the file, like masked points
+        missing = np.ma.getmaskarray(cube.data) | np.isnan(cube.data.data)
+        np.testing.assert_array_equal(
+            np.ma.getmaskarray(np.ma.masked_invalid(loaded.data)), missing
+        )
+        expected = np.ma.masked_invalid(cube.data)
+        valid = ~missing
+        # packed values are rounded to the nearest step of the scale
+        np.testing.assert_allclose(
+            loaded.data.data[valid],
+            expected.data[valid],
+            rtol=0 if scale else 1e-7,
+            atol=scale / 2 * (1 + 1e-6),
+        )
+        assert loaded.metadata == cube.metadata._replace(
+            attributes=loaded.attributes
+        )
@@ -0,0 +1,100 @@
+"""Tests for the climate_patterns figures and plots-only mode."""
+
+import climate_patterns as cp
+import numpy as np
+import plotting
+import pytest
+import sub_functions as sf
+from scheduler import Scheduler
+
+from tests.unit.diag_scripts.climate_patterns import synthetic_data
+
+FIGURES = [
+    "Anomalies.png",
+    "Climatologies.png",
+    "Patterns Timeseries.png",
+    "Patterns.png",
+    "score_timeseries.png",
+]
+
+
+def test_map_mesh_roll():
+    """Test global grids are rolled to start at the dateline."""
+    cube = synthetic_data.make_cube("tas", n_lat=4, n_lon=8, n_years=1)
+
+    mesh = plotting.MapMesh(cube)
+
+    np.testing.assert_allclose(
+        mesh.lon_bounds, np.linspace(-180.0, 180.0, 9)
+    )
+    np.testing.assert_allclose(mesh.lat_bounds, np.linspace(-90, 90, 5))
+    # the first cell of the rolled grid, centred at -157.5, is the one
+    # centred at 202.5
+    rolled = np.roll(cube[0].data, mesh.roll, axis=-1)
+    np.testing.assert_array_equal(rolled[:, 0], cube[0].data[:, 4])
+
+
+def test_global_means(anomalies):
+    """Test the global means match area averages of every cube."""
+    cubes = [cube.copy() for cube in anomalies[1][:2]]
+    cubes[0].data[:, :3] = np.ma.masked
+
+    means = sf.global_means(cubes)
+
+    for cube in cubes:
+        np.testing.assert_allclose(
+            means[cube.var_name],
+            sf.area_avg(cube, return_cube=False),
+            rtol=1e-5,
+        )
+
+
+def test_global_means_lazy(anomalies):
+    """Test lazy cubes are averaged like realised ones."""
+    cube = anomalies[1][0]
+    lazy_cube = cube.copy(data=cube.lazy_data().rechunk((100, -1, -1)))
+
+    means = sf.global_means([lazy_cube])
+
+    np.testing.assert_allclose(
+        means[cube.var_name], sf.global_means([cube])[cube.var_name]
+    )
+
+
+@pytest.fixture(scope="module")
+def saved_work_dir(tmp_path_factory, anomalies, patterns):
+    """Outputs of the synthetic model, as saved in imogen_mode."""
+    work_dir = tmp_path_factory.mktemp("work")
+    model_work_dir = work_dir / "SYNTHETIC"
+    model_work_dir.mkdir()
+    cp.cube_saver(
+        [*anomalies, *patterns],
+        str(model_work_dir) + "/",
+        cp.OUTPUT_FILES,
+        "imogen_scores",
+    )
+
+    return work_dir
+
+
+def test_plots_from(tmp_path, saved_work_dir, patterns):
+    """Test redrawing all figures from the outputs of a previous run."""
+    cfg = {"plots_from": str(saved_work_dir), "plot_dir": str(tmp_path)}
+    scheduler = Scheduler(backend="serial")
+
+    cp.add_replot_tasks(scheduler, cfg)
+    scheduler.run()
+
+    names = sorted(path.name for path in (tmp_path / "SYNTHETIC").iterdir())
+    assert names == sorted(
+        FIGURES
+        + [f"R2_Scores_{cube.var_name}.png" for cube in patterns[1]]
+    )
+
+
+def test_plots_from_empty(tmp_path):
+    """Test plotting from a directory without patterns."""
+    cfg = {"plots_from": str(tmp_path), "plot_dir": str(tmp_path)}
+
+    with pytest.raises(ValueError, match="No patterns.nc"):
+        cp.add_replot_tasks(Scheduler(backend="serial"), cfg)
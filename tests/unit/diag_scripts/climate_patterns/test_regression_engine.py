@@ -0,0 +1,439 @@
+"""Tests for the regression estimators of climate_patterns."""
+
+import climate_patterns as cp
+import dask.array as da
+import iris
+import iris.cube
+import numpy as np
+import pytest
+import regression_engine as reg
+import sklearn.linear_model
+from scipy import stats
+
+
+@pytest.fixture(name="line")
+def fixture_line():
+    """Noisy lines of slope 2 and intercept 1 on a small grid."""
+    rng = np.random.default_rng(0)
+    x_val = np.linspace(0.0, 4.0, 40) + rng.normal(0.0, 0.2, 40)
+    y_val = np.ma.masked_array(
+        1.0 + 2.0 * x_val[:, None, None] + rng.normal(0.0, 0.5, (40, 3, 4))
+    )
+    y_val[5:9, 0, 0] = np.ma.masked
+    y_val[:, 1, 1] = np.ma.masked
+
+    return x_val, y_val
+
+
+def cell_fit(x_val, y_val, function):
+    """Fit every cell on its own, with a reference implementation."""
+    slopes = np.full(y_val.shape[1:], np.nan)
+    for index in np.ndindex(*y_val.shape[1:]):
+        cell = y_val[(slice(None),) + index]
+        valid = ~np.ma.getmaskarray(cell)
+        if valid.any():
+            slopes[index] = function(x_val[valid], cell.data[valid])
+    return slopes
+
+
+def test_ols_intercept(line):
+    """Test slopes with an intercept match a fit per cell."""
+    slopes, scores = reg.fit(*line, estimator="ols_intercept")
+
+    expected = cell_fit(*line, lambda x, y: np.polyfit(x, y, 1)[0])
+    np.testing.assert_allclose(slopes, expected, rtol=1e-10)
+    assert np.isnan(scores[1, 1])
+    assert np.all(scores[~np.isnan(expected)] > 0.9)
+
+
+def test_theil_sen(line):
+    """Test Theil-Sen slopes match the median of pairwise slopes."""
+    slopes, _ = reg.fit(*line, estimator="theil_sen")
+
+    expected = cell_fit(
+        *line, lambda x, y: stats.theilslopes(y, x, method="joint")[0]
+    )
+    np.testing.assert_allclose(slopes, expected, rtol=1e-10)
+
+
+@pytest.mark.parametrize("estimator", ["theil_sen", "huber"])
+def test_robust_outliers(line, estimator):
+    """Test robust slopes resist outliers which skew least squares."""
+    x_val, y_val = line
+    y_val = y_val.copy()
+    y_val[-3:] += 50.0
+
+    ols, _ = reg.fit(x_val, y_val, estimator="ols_intercept")
+    robust, _ = reg.fit(x_val, y_val, estimator=estimator)
+
+    valid = ~np.isnan(ols)
+    assert np.all(np.abs(ols[valid] - 2.0) > 1.0)
+    np.testing.assert_allclose(robust[valid], 2.0, atol=0.3)
+
+
+def test_running_means():
+    """Test running means are masked where a window is incomplete."""
+    data = np.ma.masked_array([1.0, 2.0, 3.0, 4.0, 5.0])
+    data[3] = np.ma.masked
+
+    means = reg.running_means(data, 2)
+
+    np.testing.assert_allclose(means.data[:2], [1.5, 2.5])
+    assert means.mask.tolist() == [False, False, True, True]
+    assert reg.running_means(data, 1) is data
+
+
+@pytest.mark.parametrize("n_models", [1, 2, 5])
+def test_nan_percentiles(n_models):
+    """Test percentiles with missing data match numpy."""
+    rng = np.random.default_rng(0)
+    data = rng.normal(size=(n_models, 12, 4, 6))
+    data[rng.random(data.shape) < 0.3] = np.nan
+    data[:, 0, 0, 0] = np.nan
+    percentiles = [0, 5, 50, 97.5, 100]
+
+    with np.testing.suppress_warnings() as sup:
+        sup.filter(RuntimeWarning)
+        expected = np.nanpercentile(data, percentiles, axis=0)
+    np.testing.assert_allclose(
+        reg.nan_percentiles(data, percentiles), expected, equal_nan=True
+    )
+
+
+@pytest.mark.parametrize(
+    "kwargs, message",
+    [
+        ({"estimator": "lasso"}, "Unknown estimator 'lasso'"),
+        ({"running_mean": 41}, "longer than the 40 points"),
+    ],
+)
+def test_fit_invalid(line, kwargs, message):
+    """Test unknown estimators and too long running means are rejected."""
+    with pytest.raises(ValueError, match=message):
+        reg.fit(*line, **kwargs)
+
+
+@pytest.mark.parametrize("estimator", ["ols", "huber"])
+def test_tiled_fit(line, estimator):
+    """Test fitting tile by tile matches fitting every group at once."""
+    x_val, y_val = line
+    groups = np.arange(len(x_val)) % 2
+    cell_mask = np.zeros((2,) + y_val.shape[1:], dtype=bool)
+    cell_mask[1, 2, 3] = True
+
+    fits = reg.tiled_apply(
+        reg.fit,
+        2,
+        x_val,
+        da.from_array(y_val, chunks=(10, 2, 3)),
+        groups,
+        2,
+        cell_mask=cell_mask,
+        estimator=estimator,
+        running_mean=2,
+    ).compute()
+
+    for group in range(2):
+        expected = reg.fit(
+            x_val[groups == group],
+            y_val[groups == group],
+            estimator=estimator,
+            cell_mask=cell_mask[group],
+            running_mean=2,
+        )
+        np.testing.assert_allclose(fits[group], expected, rtol=1e-10)
+
+
+@pytest.mark.parametrize("block_length", [1, 3])
+def test_resample_counts(block_length):
+    """Test every resample draws as many points as the data."""
+    counts = reg.resample_counts(10, 50, block_length=block_length)
+
+    assert counts.shape == (50, 10)
+    np.testing.assert_array_equal(counts.sum(axis=1), 10)
+    np.testing.assert_array_equal(
+        reg.resample_counts(10, 50, block_length=block_length), counts
+    )
+    with pytest.raises(ValueError, match="do not fit"):
+        reg.resample_counts(10, 50, block_length=11)
+
+
+@pytest.mark.parametrize("estimator", ["ols", "ols_intercept"])
+def test_bootstrap(line, estimator):
+    """Test batched resamples match refitting every resample per cell."""
+    x_val, y_val = line
+    counts = reg.resample_counts(len(x_val), 200, block_length=2, seed=3)
+    indices = [np.repeat(np.arange(len(x_val)), row.astype(int))
+               for row in counts]
+
+    uncertainty = reg.bootstrap(
+        x_val,
+        y_val,
+        estimator=estimator,
+        resamples=200,
+        block_length=2,
+        percentiles=[5, 95],
+        seed=3,
+        memory_budget=0,
+    )
+
+    slope = {
+        "ols": lambda x, y: np.sum(x * y) / np.sum(x * x),
+        "ols_intercept": lambda x, y: np.polyfit(x, y, 1)[0],
+    }[estimator]
+    for cell in ((0, 0), (2, 3)):
+        valid = ~np.ma.getmaskarray(y_val[(slice(None),) + cell])
+        slopes = [
+            slope(
+                x_val[index[valid[index]]],
+                y_val.data[(index[valid[index]],) + cell],
+            )
+            for index in indices
+        ]
+        np.testing.assert_allclose(
+            uncertainty[(slice(None),) + cell],
+            [np.std(slopes, ddof=1)] + list(np.percentile(slopes, [5, 95])),
+            rtol=1e-8,
+        )
+    assert np.isnan(uncertainty[:, 1, 1]).all()
+    with pytest.raises(ValueError, match="least squares"):
+        reg.bootstrap(x_val, y_val, estimator="huber")
+
+
+def test_regress_variable_estimator(anomalies, fractions, regression_years):
+    """Test monthly, single-pass and tiled regressions agree."""
+    anom_list = anomalies[1]
+    tas = anom_list.extract_cube(iris.NameConstraint(var_name="tl1_anom"))
+    predictor = cp.regression_predictor(
+        tas, *fractions, "global", yrs=regression_years
+    )
+    method = {"estimator": "huber", "running_mean": 5}
+
+    regr_cube, score_cube = cp.regress_variable(
+        tas, predictor, yrs=regression_years, **method
+    )
+    single_pass = cp.regress_variables_single_pass(
+        anom_list, predictor, yrs=regression_years, **method
+    )
+
+    index = [cube.var_name for cube in anom_list].index("tl1_anom")
+    np.testing.assert_allclose(
+        single_pass[index][0].data, regr_cube.data, rtol=1e-6
+    )
+    for cube in (regr_cube, score_cube):
+        assert cube.attributes["regression_estimator"] == "huber"
+        assert cube.attributes["regression_running_mean_years"] == 5
+
+    tiled_tas = cp.rechunk(tas.copy(), chunk_budget=0.01, tiled=True)
+    tiled_cube, _ = cp.regress_variable(
+        tiled_tas, predictor, yrs=regression_years, lazy=True, tiled=True,
+        **method
+    )
+    assert tiled_tas.lazy_data().numblocks[1:] != (1, 1)
+    np.testing.assert_allclose(tiled_cube.data, regr_cube.data, rtol=1e-10)
+
+
+@pytest.mark.parametrize("masked", [False, True])
+def test_regress_variables_single_pass(anomalies, fractions,
+                                       regression_years, masked):
+    """Test single-pass patterns and scores match per-variable ones."""
+    anom_list = iris.cube.CubeList(cube.copy() for cube in anomalies[1])
+    if masked:
+        rng = np.random.default_rng(0)
+        for cube in anom_list:
+            cube.data = np.ma.masked_where(
+                rng.random(cube.shape) < 0.1, cube.data
+            )
+    tas = anom_list.extract_cube(iris.NameConstraint(var_name="tl1_anom"))
+    predictor = cp.regression_predictor(
+        tas, *fractions, "global", yrs=regression_years
+    )
+
+    single_pass = cp.regress_variables_single_pass(
+        anom_list, predictor, yrs=regression_years
+    )
+
+    assert len(single_pass) == len(anom_list)
+    for cube, (regr_cube, score_cube) in zip(anom_list, single_pass):
+        expected = cp.regress_variable(cube, predictor, yrs=regression_years)
+        for result, expected_cube in zip((regr_cube, score_cube), expected):
+            assert result.metadata == expected_cube.metadata
+            assert result.coords() == expected_cube.coords()
+            np.testing.assert_array_equal(
+                np.ma.getmaskarray(result.data),
+                np.ma.getmaskarray(expected_cube.data),
+            )
+            np.testing.assert_allclose(
+                result.data, expected_cube.data, rtol=1e-12, atol=1e-15
+            )
+
+
+@pytest.mark.parametrize(
+    "cfg, message",
+    [
+        ({"regression_estimator": "lasso"}, "Unknown regression_estimator"),
+        ({"running_mean_years": 0}, "positive number of years"),
+        (
+            {"regression_estimator": "huber", "lazy": True},
+            "'lazy: true' only supports",
+        ),
+        (
+            {"running_mean_years": 5, "incremental": True},
+            "'incremental: true' only supports",
+        ),
+        (
+            {"bootstrap": True, "regression_estimator": "huber"},
+            "bootstrap only supports",
+        ),
+        ({"bootstrap": True, "lazy": True}, "'lazy: true' does not support"),
+        ({"bootstrap": True, "bootstrap_resamples": 1}, "at least 2"),
+    ],
+)
+def test_regression_method_invalid(cfg, message):
+    """Test invalid estimators and running means are rejected early."""
+    with pytest.raises(ValueError, match=message):
+        cp.regression_method(cfg)
+
+
+def test_regression_method_tiled():
+    """Test tiled regressions are lazy, and support every estimator."""
+    method = cp.regression_method(
+        {"tiled": True, "regression_estimator": "huber"}
+    )
+
+    assert method["lazy"] and method["tiled"]
+
+
+def test_regress_variable_bootstrap(anomalies, fractions, regression_years):
+    """Test monthly, single-pass and tiled bootstraps agree."""
+    anom_list = anomalies[1]
+    tas = anom_list.extract_cube(iris.NameConstraint(var_name="tl1_anom"))
+    predictor = cp.regression_predictor(
+        tas, *fractions, "global", yrs=regression_years
+    )
+    method = cp.regression_method(
+        {"bootstrap": True, "bootstrap_resamples": 50, "tiled": True}
+    )
+    bootstrap = method["bootstrap"]
+
+    regr_cube, _, uncertainty = cp.regress_variable(
+        tas, predictor, yrs=regression_years, bootstrap=bootstrap
+    )
+    single_pass = cp.regress_variables_single_pass(
+        anom_list, predictor, yrs=regression_years, bootstrap=bootstrap
+    )
+    tiled_tas = cp.rechunk(tas.copy(), chunk_budget=0.01, tiled=True)
+    tiled = cp.regress_variable(
+        tiled_tas, predictor, yrs=regression_years, **method
+    )
+
+    assert [cube.var_name for cube in uncertainty] == [
+        "tl1_patt_stderr", "tl1_patt_p5", "tl1_patt_p95"
+    ]
+    assert uncertainty[0].attributes["bootstrap_resamples"] == 50
+    index = [cube.var_name for cube in anom_list].index("tl1_anom")
+    for i, cube in enumerate(uncertainty):
+        assert cube.shape == regr_cube.shape
+        np.testing.assert_allclose(
+            single_pass[index][2][i].data, cube.data, rtol=1e-6
+        )
+        np.testing.assert_allclose(tiled[2][i].data, cube.data, rtol=1e-10)
+    lower, upper = uncertainty[1].data, uncertainty[2].data
+    assert np.all(lower <= regr_cube.data + 1e-10)
+    assert np.all(regr_cube.data <= upper + 1e-10)
+
+
+@pytest.mark.parametrize("offset", [0.0, 1000.0])
+def test_regress_variable_lazy(anomalies, fractions, regression_years,
+                               offset):
+    """Test lazy regressions of float32 masked data match eager ones."""
+    anom_list = anomalies[1]
+    tas = anom_list.extract_cube(iris.NameConstraint(var_name="tl1_anom"))
+    predictor = cp.regression_predictor(
+        tas, *fractions, "global", yrs=regression_years
+    )
+    rng = np.random.default_rng(0)
+    data = np.ma.masked_array(tas.data + offset, dtype=np.float32)
+    data[rng.random(data.shape) < 0.2] = np.ma.masked
+    cube = tas.copy(data=data)
+
+    regr_cube, score_cube = cp.regress_variable(
+        cube, predictor, yrs=regression_years
+    )
+    lazy_cube = cp.rechunk(cube.copy(), chunk_budget=0.05)
+    lazy_regr, lazy_score = cp.regress_variable(
+        lazy_cube, predictor, yrs=regression_years, lazy=True
+    )
+
+    assert lazy_cube.lazy_data().numblocks[0] > 1
+    np.testing.assert_allclose(lazy_regr.data, regr_cube.data, rtol=1e-10)
+    np.testing.assert_allclose(
+        lazy_score.data, score_cube.data, rtol=1e-10, atol=1e-12
+    )
+
+
+def test_combine_statistics(line):
+    """Test statistics merged chunk by chunk match those of all points."""
+    x_val, y_val = line
+    y_val = (y_val + 1e4).astype(np.float32)
+
+    stats = reg.sufficient_statistics(x_val[:1], y_val[:1])
+    for start in range(1, len(x_val), 7):
+        stats = reg.combine_statistics(
+            stats,
+            reg.sufficient_statistics(
+                x_val[start:start + 7], y_val[start:start + 7]
+            ),
+        )
+
+    expected = reg.sufficient_statistics(x_val, y_val)
+    np.testing.assert_allclose(stats, expected, rtol=1e-12)
+    np.testing.assert_allclose(
+        reg.ols_from_statistics(stats),
+        reg.ols_no_intercept(x_val, y_val),
+        rtol=1e-10,
+    )
+
+
+def sklearn_fit(x_val, y_val):
+    """Fit every cell with sklearn, as the per-cell regression did."""
+    slopes = np.full(y_val.shape[1:], np.nan)
+    scores = np.full(y_val.shape[1:], np.nan)
+    for index in np.ndindex(*y_val.shape[1:]):
+        cell = y_val[(slice(None),) + index]
+        valid = ~np.ma.getmaskarray(cell)
+        if valid.any():
+            model = sklearn.linear_model.LinearRegression(fit_intercept=False)
+            x_valid = x_val[valid].reshape(-1, 1)
+            model.fit(x_valid, cell.data[valid])
+            slopes[index] = model.coef_[0]
+            scores[index] = model.score(x_valid, cell.data[valid])
+    return slopes, scores
+
+
+@pytest.mark.parametrize("method", ["fit", "statistics"])
+def test_sklearn_parity(line, method):
+    """Test no-intercept slopes and scores match sklearn per cell."""
+    x_val, y_val = line
+    y_val = y_val.copy()
+    # a constant, an all-zero and a partly masked constant cell
+    y_val[:, 2, 0] = 3.0
+    y_val[:, 2, 1] = 0.0
+    y_val[:, 2, 2] = 3.0
+    y_val[::3, 2, 2] = np.ma.masked
+
+    if method == "fit":
+        slopes, scores = reg.fit(x_val, y_val, estimator="ols")
+    else:
+        stats = reg.sufficient_statistics(x_val, y_val)
+        slopes, scores = reg.ols_from_statistics(stats)
+
+    expected_slopes, expected_scores = sklearn_fit(x_val, y_val)
+    np.testing.assert_allclose(slopes, expected_slopes, rtol=1e-10)
+    np.testing.assert_allclose(
+        scores, expected_scores, rtol=1e-10, atol=1e-12
+    )
+    # the all-masked cell is skipped, the all-zero one fitted exactly
+    assert np.isnan(slopes[1, 1]) and np.isnan(scores[1, 1])
+    assert slopes[2, 1] == 0.0 and scores[2, 1] == 1.0
+    assert scores[2, 0] == 0.0
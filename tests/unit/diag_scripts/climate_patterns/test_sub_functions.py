@@ -0,0 +1,124 @@
+"""Tests for the sub functions of the climate_patterns diagnostic."""
+
+import datetime
+
+import climate_patterns as cp
+import iris
+import iris.coord_categorisation
+import iris.coords
+import numpy as np
+import pytest
+import sub_functions as sf
+
+from tests.unit.diag_scripts.climate_patterns import synthetic_data
+
+
+@pytest.fixture(name="daily_file")
+def fixture_daily_file(tmp_path):
+    """File of three years of daily tasmax, starting mid-year."""
+    lat, lon = synthetic_data.make_horizontal_coords(n_lat=6, n_lon=8)
+    units = synthetic_data.TIME_UNITS
+    start = units.date2num(datetime.datetime(1850, 7, 15))
+    days = start + np.arange(3 * 365)
+    time = iris.coords.DimCoord(
+        days + 0.5,
+        standard_name="time",
+        var_name="time",
+        units=units,
+        bounds=np.stack([days, days + 1], axis=-1),
+    )
+    rng = np.random.default_rng(0)
+    data = np.ma.masked_array(
+        rng.normal(290.0, 5.0, (len(days), 6, 8)).astype(np.float32)
+    )
+    data[:, 0, 0] = np.ma.masked
+    data[10:20, 1, 1] = np.ma.masked
+    cube = iris.cube.Cube(
+        data,
+        standard_name="air_temperature",
+        var_name="tasmax",
+        units="K",
+        dim_coords_and_dims=[(time, 0), (lat, 1), (lon, 2)],
+    )
+    path = tmp_path / "tasmax_day.nc"
+    iris.save(cube, str(path))
+
+    return path, cube
+
+
+def test_load_monthly_means(daily_file):
+    """Test streaming by year matches averaging the whole timeseries."""
+    path, cube = daily_file
+
+    monthly = sf.load_monthly_means(str(path))
+
+    iris.coord_categorisation.add_month_number(cube, "time")
+    iris.coord_categorisation.add_year(cube, "time")
+    expected = cube.aggregated_by(["month_number", "year"], iris.analysis.MEAN)
+    assert monthly.shape == (37, 6, 8)
+    np.testing.assert_allclose(monthly.data, expected.data, rtol=1e-6)
+    assert np.ma.getmaskarray(monthly.data)[:, 0, 0].all()
+    assert not np.ma.is_masked(monthly.data[:, 1, 1])
+    for name in ("time", "month_number", "year"):
+        np.testing.assert_array_equal(
+            monthly.coord(name).points, expected.coord(name).points
+        )
+    assert monthly.coord("month_number").points[0] == 7
+
+
+def test_load_dataset_cube_daily(daily_file):
+    """Test daily datasets are loaded as monthly means."""
+    path, _ = daily_file
+    dataset = {"filename": str(path), "frequency": "day"}
+
+    cube = cp.load_dataset_cube(dataset, "full")
+
+    assert cube.shape == (37, 6, 8)
+    assert cube.coords("month_number")
+    monthly_dataset = dict(dataset, frequency="mon")
+    assert cp.load_dataset_cube(monthly_dataset, "full").shape[0] == 3 * 365
+
+
+def reference_area_avg_landsea(cube, ocean_frac, land_frac, land=True):
+    """Average over land or ocean, as before the weights were cached."""
+    cube = cube.copy()
+    frac = (land_frac if land else ocean_frac).copy()
+    for name in ("latitude", "longitude"):
+        if not cube.coord(name).has_bounds():
+            cube.coord(name).guess_bounds()
+    global_weights = iris.analysis.cartography.area_weights(
+        cube, normalize=False
+    )
+    frac.data = np.ma.masked_less(frac.data, 0.01)
+    weights = iris.analysis.cartography.area_weights(frac, normalize=False)
+    area = (
+        frac.collapsed(
+            ["latitude", "longitude"], iris.analysis.SUM, weights=weights
+        )
+        / 1e12
+    )
+    cube.data = cube.data * global_weights * frac.data
+
+    return (
+        cube.collapsed(["latitude", "longitude"], iris.analysis.SUM)
+        / 1e12
+        / area.data
+    ).data
+
+
+@pytest.mark.parametrize("land", [True, False])
+def test_area_avg_landsea(anomalies, fractions, land):
+    """Test cached land and ocean weights average as before."""
+    tas = anomalies[1].extract_cube(iris.NameConstraint(var_name="tl1_anom"))
+    tas = tas[:24].copy()
+    tas.data[:, 3:6, 10:20] = np.ma.masked
+    assert tas.coord("latitude").coord_system != (
+        fractions[1].coord("latitude").coord_system
+    )
+
+    means = sf.area_avg_landsea(tas, *fractions, land=land, return_cube=False)
+
+    np.testing.assert_allclose(
+        means, reference_area_avg_landsea(tas, *fractions, land=land),
+        rtol=1e-12,
+    )
@@ -0,0 +1,51 @@
+"""Tests for the synthetic data of the climate_patterns tests."""
+
+import numpy as np
+import pytest
+
+from tests.unit.diag_scripts.climate_patterns import synthetic_data
+
+
+def test_make_cube():
+    """Test the shape, coords and attributes of a synthetic cube."""
+    cube = synthetic_data.make_cube("tas", n_lat=10, n_lon=20, n_years=3)
+
+    assert cube.shape == (36, 10, 20)
+    assert cube.dtype == np.float32
+    assert cube.var_name == "tas"
+    assert cube.attributes["source_id"] == "SYNTHETIC"
+    assert cube.coord("time").cell(0).point.year == 1850
+    assert cube.coord("time").cell(-1).point.year == 1852
+    np.testing.assert_array_equal(
+        cube.coord("month_number").points, np.tile(np.arange(1, 13), 3)
+    )
+    assert cube.coord("latitude").has_bounds()
+    assert not np.ma.is_masked(cube.data)
+
+
+@pytest.mark.parametrize("masked_fraction", [0.1, 0.5])
+def test_make_cube_masked_fraction(masked_fraction):
+    """Test that the same grid cells are masked at all times."""
+    cube = synthetic_data.make_cube(
+        "pr", n_lat=10, n_lon=20, n_years=1, masked_fraction=masked_fraction
+    )
+    mask = np.ma.getmaskarray(cube.data)
+
+    assert mask[0].mean() == masked_fraction
+    assert (mask == mask[0]).all()
+
+
+def test_make_cube_warming():
+    """Test that the warming signal shows in the temperature."""
+    cube = synthetic_data.make_cube("tas", n_lat=10, n_lon=20, n_years=20)
+
+    assert cube.data[-12:].mean() - cube.data[:12].mean() > 3.0
+
+
+def test_make_land_fraction():
+    """Test the range of the synthetic land fraction."""
+    sftlf = synthetic_data.make_land_fraction(n_lat=10, n_lon=20)
+
+    assert sftlf.shape == (10, 20)
+    assert sftlf.units == "%"
+    assert 0.0 <= sftlf.data.min() < sftlf.data.max() <= 100.0
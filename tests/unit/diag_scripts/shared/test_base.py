@@ -1,4 +1,5 @@
 import logging
+import multiprocessing
 import sys
 from pathlib import Path
 
@@ -73,6 +74,35 @@ def test_provenance_logger_duplicate_raises(tmp_path):
             prov.log('output.nc', record)
 
 
+def log_provenance(run_dir, worker):
+    """Log the provenance of a few files, as a worker process does."""
+    for i in range(20):
+        with shared.ProvenanceLogger({'run_dir': run_dir}) as prov:
+            prov.log(f'output_{worker}_{i}.nc', {'worker': worker})
+
+
+def test_provenance_logger_concurrent(tmp_path):
+
+    with multiprocessing.Pool(4) as pool:
+        pool.starmap(log_provenance, [(str(tmp_path), i) for i in range(8)])
+
+    provenance = yaml.safe_load(
+        (tmp_path / 'diagnostic_provenance.yml').read_bytes())
+
+    assert provenance == {
+        f'output_{worker}_{i}.nc': {'worker': worker}
+        for worker in range(8) for i in range(20)
+    }
+
+
+def test_provenance_logger_empty(tmp_path):
+
+    with shared.ProvenanceLogger({'run_dir': str(tmp_path)}):
+        pass
+
+    assert not (tmp_path / 'diagnostic_provenance.yml').exists()
+
+
 def test_select_metadata():
 
     metadata = [
@@ -325,6 +355,54 @@ def test_get_input_data_files(tmp_path):
     }
 
 
+def test_get_input_data_files_order(tmp_path):
+
+    input_files = []
+    for i in range(20):
+        metadata = {
+            'file.nc': {'short_name': 'ta', 'dataset': f'dataset{i}'},
+            f'file{i}.nc': {'short_name': 'ta', 'dataset': f'dataset{i}'},
+        }
+        metadata_file = tmp_path / f'{i}' / 'metadata.yml'
+        metadata_file.parent.mkdir()
+        metadata_file.write_text(yaml.safe_dump(metadata))
+        input_files.append(str(metadata_file))
+
+    input_data = shared._base._get_input_data_files(
+        {'input_files': input_files})
+
+    assert len(input_data) == 21
+    # later metadata files take precedence, as when read one by one
+    assert input_data['file.nc']['dataset'] == 'dataset19'
+    assert isinstance(input_data.values(), shared.MetadataList)
+
+
+def test_get_input_data_files_cache(tmp_path, monkeypatch):
+
+    metadata = {'file1.nc': {'short_name': 'ta', 'dataset': 'dataset1'}}
+    metadata_file = tmp_path / 'preproc' / 'metadata.yml'
+    metadata_file.parent.mkdir()
+    metadata_file.write_text(yaml.safe_dump(metadata))
+    cfg = {
+        'input_files': [str(metadata_file)],
+        'run_dir': str(tmp_path / 'run_dir'),
+        'cache_input_data': True,
+    }
+    input_data = shared._base._get_input_data_files(cfg)
+    assert (tmp_path / 'run_dir' / shared._base.INPUT_DATA_CACHE).exists()
+
+    def fail(_):
+        raise AssertionError("metadata file read again")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(shared._base, '_read_metadata_file', fail)
+        assert shared._base._get_input_data_files(cfg) == input_data
+
+    metadata['file2.nc'] = {'short_name': 'tas', 'dataset': 'dataset1'}
+    metadata_file.write_text(yaml.safe_dump(metadata))
+    assert shared._base._get_input_data_files(cfg) == metadata
+
+
 def create_settings(path):
 
     settings = {
@@ -367,6 +445,18 @@ def test_run_diagnostic(tmp_path, monkeypatch):
         assert 'example_setting' in cfg
 
 
+def test_run_diagnostic_startup_time(tmp_path, monkeypatch, caplog):
+    """Test the time taken to start the diagnostic is logged."""
+    settings = create_settings(tmp_path)
+    settings_file = write_settings(settings)
+
+    monkeypatch.setattr(sys, 'argv', ['', settings_file])
+
+    with caplog.at_level(logging.INFO), shared.run_diagnostic():
+        assert "Read metadata of 0 input files" in caplog.text
+        assert "Started diagnostic script in" in caplog.text
+
+
 @pytest.mark.parametrize('flag', ['-l', '--log-level'])
 def test_run_diagnostic_log_level(tmp_path, monkeypatch, flag):
     """Test if setting the log level from the command line works."""
@@ -427,3 +517,17 @@ def test_rerun_diagnostic_flag(tmp_path, monkeypatch, flag):
                 Path(settings['plot_dir']) / 'example_output.txt',
         ):
             assert file.exists() == exist
+
+
+def test_run_diagnostic_duplicate_provenance(tmp_path, monkeypatch):
+    """Test records of one file by two loggers are reported at the end."""
+    settings = create_settings(tmp_path)
+    settings_file = write_settings(settings)
+
+    monkeypatch.setattr(sys, 'argv', ['', settings_file])
+
+    with pytest.raises(KeyError, match='output.nc'):
+        with shared.run_diagnostic() as cfg:
+            for _ in range(2):
+                with shared.ProvenanceLogger(cfg) as prov:
+                    prov.log('output.nc', {'attribute1': 'xyz'})
@@ -246,6 +246,107 @@ def test_netcdf_to_metadata(mock_walk, mock_load_cube, mock_logger,
     assert mock_logger.error.call_count == n_logger
 
 
+@pytest.fixture
+def empty_index(monkeypatch):
+    """Start from an empty index of netcdf metadata."""
+    monkeypatch.setattr(io, '_METADATA_INDEX', {})
+    monkeypatch.setattr(io, '_LOADED_INDEXES', set())
+
+
+def make_netcdf_files(path):
+    """Save cubes with coordinates, cell measures and attributes."""
+    lat = iris.coords.DimCoord([-45.0, 45.0], standard_name='latitude',
+                               units='degrees', var_name='lat')
+    lat.guess_bounds()
+    cubes = []
+    for i, units in enumerate(['K', 'kg m-2 s-1', '1', 'degC']):
+        cube = iris.cube.Cube(
+            np.zeros((2, 3), dtype=np.float32),
+            var_name=f'var{i}',
+            standard_name='air_temperature' if i % 2 else None,
+            long_name=None if i == 2 else LONG_NAME,
+            units=units,
+            dim_coords_and_dims=[(lat, 0)],
+            attributes=iris.cube.CubeAttrsDict(
+                globals={'dataset': f'model{i}', 'project': 'CMIP42',
+                         'source': 'global', 'version': np.int32(i)},
+                locals={'source': 'local', 'range': np.array([0.0, 1.0])},
+            ),
+        )
+        cube.add_aux_coord(iris.coords.AuxCoord(2.0, var_name='height',
+                                                units='m'))
+        cube.add_cell_measure(
+            iris.coords.CellMeasure(np.ones((2, 3)), measure='area',
+                                    var_name='areacella', units='m2'),
+            (0, 1))
+        iris.save(cube, str(path / f'file{i}.nc'))
+        cubes.append(cube)
+    return cubes
+
+
+def assert_metadata_equal(metadata, expected):
+    """Assert metadata with array attributes are equal."""
+    assert [list(m) for m in metadata] == [list(m) for m in expected]
+    for dataset_info, expected_info in zip(metadata, expected):
+        for key, value in expected_info.items():
+            np.testing.assert_array_equal(dataset_info[key], value)
+            assert type(dataset_info[key]) is type(value)
+
+
+def test_netcdf_to_metadata_headers(tmp_path, empty_index):
+    """Test metadata read from headers match the cubes of iris."""
+    make_netcdf_files(tmp_path)
+    iris.save([iris.cube.Cube(0, var_name='a', attributes={'dataset': 'x'}),
+               iris.cube.Cube(0, var_name='b')], str(tmp_path / 'two.nc'))
+
+    with mock.patch.object(io, '_read_header',
+                           wraps=io._read_header) as read_header:
+        metadata = io.netcdf_to_metadata({}, pattern='file*', root=tmp_path)
+    assert read_header.call_count == 4
+
+    expected = []
+    for path in sorted(tmp_path.glob('file*.nc')):
+        dataset_info = io._cube_metadata(iris.load_cube(str(path)))
+        dataset_info['filename'] = str(path)
+        expected.append(dataset_info)
+    assert_metadata_equal(metadata, expected)
+    assert metadata[0]['source'] == 'local'
+    assert io._read_header(str(tmp_path / 'two.nc')) is None
+    with pytest.raises(iris.exceptions.ConstraintMismatchError):
+        io.netcdf_to_metadata({}, pattern='two.nc', root=tmp_path)
+
+
+def test_netcdf_to_metadata_index(tmp_path, monkeypatch, empty_index):
+    """Test files are only read again when they changed."""
+    make_netcdf_files(tmp_path)
+    run_dir = tmp_path / 'run'
+    run_dir.mkdir()
+    cfg = {'run_dir': str(run_dir)}
+    metadata = io.netcdf_to_metadata(cfg, pattern='*.nc', root=tmp_path)
+    assert (run_dir / io.NETCDF_METADATA_INDEX).exists()
+
+    # a rerun, with an empty index in memory
+    monkeypatch.setattr(io, '_METADATA_INDEX', {})
+    monkeypatch.setattr(io, '_LOADED_INDEXES', set())
+    with mock.patch.object(io, '_read_header', autospec=True) as read_header:
+        assert_metadata_equal(
+            io.netcdf_to_metadata(cfg, pattern='*.nc', root=tmp_path),
+            metadata)
+    read_header.assert_not_called()
+
+    metadata[0]['dataset'] = 'changed'
+    cube = iris.load_cube(str(tmp_path / 'file0.nc'))
+    cube.attributes.globals['dataset'] = 'new'
+    iris.save(cube, str(tmp_path / 'file0.nc'))
+    with mock.patch.object(io, '_read_header',
+                           wraps=io._read_header) as read_header:
+        new_metadata = io.netcdf_to_metadata(cfg, pattern='*.nc',
+                                             root=tmp_path)
+    read_header.assert_called_once_with(str(tmp_path / 'file0.nc'))
+    assert new_metadata[0]['dataset'] == 'new'
+    assert new_metadata[1]['dataset'] == 'model1'
+
+
 ATTRS_IN = [
     {
         'dataset': 'a',
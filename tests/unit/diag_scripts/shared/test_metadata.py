@@ -0,0 +1,140 @@
+"""Tests for the indexed metadata of diagnostics."""
+import pickle
+
+import pytest
+import yaml
+
+from esmvaltool.diag_scripts import shared
+from esmvaltool.diag_scripts.shared._metadata import InputData
+
+
+def make_metadata(n_datasets):
+    """Make the metadata of many datasets, as in a large recipe."""
+    metadata = []
+    for i in range(n_datasets):
+        attributes = {
+            'filename': f'file_{i}.nc',
+            'dataset': f'MODEL{i % 50}',
+            'short_name': ('tas', 'pr', 'ts', 'psl')[i % 4],
+            'exp': ('historical', 'ssp126', 'ssp585')[i % 3],
+            'project': 'CMIP6',
+            'variable_group': f'group_{i % 7}',
+            'modeling_realm': ['atmos'],
+        }
+        if i % 5 == 0:
+            del attributes['variable_group']
+        if i % 11 == 0:
+            attributes['exp'] = None
+        metadata.append(attributes)
+    return metadata
+
+
+@pytest.mark.parametrize('attributes', [
+    {'dataset': 'MODEL3'},
+    {'short_name': 'tas', 'exp': 'ssp585'},
+    {'variable_group': '*', 'short_name': 'pr'},
+    {'variable_group': None},
+    {'exp': None},
+    {'dataset': 'unknown'},
+    {'modeling_realm': ['atmos'], 'short_name': 'ts'},
+    {},
+])
+def test_select(attributes):
+    metadata = make_metadata(200)
+    indexed = shared.MetadataList(metadata)
+
+    result = shared.select_metadata(indexed, **attributes)
+
+    assert isinstance(result, shared.MetadataList)
+    assert result == shared.select_metadata(metadata, **attributes)
+    assert shared.select_metadata(indexed, **attributes) == result
+
+
+@pytest.mark.parametrize('attribute', ['dataset', 'variable_group', 'exp'])
+@pytest.mark.parametrize('sort', [None, True, 'filename'])
+def test_group(attribute, sort):
+    metadata = make_metadata(200)
+    indexed = shared.MetadataList(metadata)
+
+    result = shared.group_metadata(indexed, attribute, sort=sort)
+
+    expected = shared.group_metadata(metadata, attribute, sort=sort)
+    assert result == expected
+    assert list(result) == list(expected)
+    assert all(isinstance(group, shared.MetadataList)
+               for group in result.values())
+    with pytest.raises(TypeError):
+        shared.group_metadata(indexed, 'modeling_realm')
+
+
+def test_mutation_clears_indexes():
+    metadata = make_metadata(20)
+    indexed = shared.MetadataList(metadata)
+    assert len(shared.select_metadata(indexed, dataset='MODEL3')) == 1
+
+    indexed.append({'dataset': 'MODEL3'})
+    assert len(shared.select_metadata(indexed, dataset='MODEL3')) == 2
+    del indexed[3]
+    assert len(shared.select_metadata(indexed, dataset='MODEL3')) == 1
+    indexed.sort(key=lambda attributes: attributes.get('filename', ''))
+    assert indexed.select(dataset='MODEL3') == [{'dataset': 'MODEL3'}]
+
+    indexed[1]['dataset'] = 'MODEL3'
+    indexed.reindex()
+    assert len(shared.select_metadata(indexed, dataset='MODEL3')) == 2
+
+
+def test_input_data():
+    metadata = make_metadata(20)
+    input_data = InputData((a['filename'], a) for a in metadata)
+
+    values = input_data.values()
+    assert values == metadata
+    assert input_data.values() is values
+    selection = shared.select_metadata(values, short_name='tas')
+    assert shared.select_metadata(input_data.values(), short_name='tas') == (
+        selection)
+
+    input_data['extra.nc'] = {'filename': 'extra.nc', 'short_name': 'tas'}
+    assert len(shared.select_metadata(
+        input_data.values(), short_name='tas')) == len(selection) + 1
+
+
+def test_serialise():
+    metadata = make_metadata(20)
+    indexed = shared.MetadataList(metadata)
+    indexed.select(dataset='MODEL3')
+    input_data = InputData((a['filename'], a) for a in metadata)
+
+    assert yaml.safe_load(yaml.safe_dump(indexed)) == metadata
+    assert yaml.safe_load(yaml.dump(input_data)) == dict(input_data)
+    copy = pickle.loads(pickle.dumps(indexed))
+    assert copy.select(dataset='MODEL3') == indexed.select(dataset='MODEL3')
+
+
+def select_all(metadata):
+    """Select the metadata of every dataset and variable, one by one."""
+    return [
+        shared.select_metadata(metadata, dataset=f'MODEL{i}', short_name=name)
+        for i in range(50) for name in ('tas', 'pr', 'ts', 'psl')
+    ]
+
+
+def group_all(metadata):
+    """Group the metadata of every variable by dataset, as diagnostics do."""
+    return {
+        name: shared.group_metadata(
+            shared.select_metadata(metadata, short_name=name), 'dataset')
+        for name in ('tas', 'pr', 'ts', 'psl')
+    }
+
+
+@pytest.mark.parametrize('container', [list, shared.MetadataList])
+@pytest.mark.parametrize('function', [select_all, group_all])
+def test_benchmark(benchmark, container, function):
+    """Benchmark queries of plain lists and indexed metadata."""
+    metadata = make_metadata(5000)
+
+    result = benchmark(function, container(metadata))
+
+    assert result == function(metadata)
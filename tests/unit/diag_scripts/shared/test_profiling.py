@@ -0,0 +1,99 @@
+"""Tests for the profiling of diagnostics."""
+import csv
+import os
+import pstats
+import sys
+import time
+
+import pytest
+
+from esmvaltool.diag_scripts import shared
+from esmvaltool.diag_scripts.shared import _profiling
+from tests.unit.diag_scripts.shared.test_base import (
+    create_settings,
+    write_settings,
+)
+
+
+def busy_function(seconds):
+    """Keep the CPU busy for a while."""
+    end = time.time() + seconds
+    total = 0
+    while time.time() < end:
+        total += sum(range(1000))
+    return total
+
+
+def run(tmp_path, monkeypatch, args=(), **settings):
+    """Run a busy diagnostic."""
+    settings = dict(create_settings(tmp_path), **settings)
+    settings_file = write_settings(settings)
+    monkeypatch.setattr(sys, 'argv', ['', *args, settings_file])
+
+    with shared.run_diagnostic():
+        busy_function(0.3)
+
+    return tmp_path / 'run_dir'
+
+
+def test_cprofile(tmp_path, monkeypatch):
+    run_dir = run(tmp_path, monkeypatch, profiler='cprofile')
+
+    stats = pstats.Stats(str(run_dir / _profiling.PROFILE_FILE))
+    functions = {function for _, _, function in stats.stats}
+    assert 'busy_function' in functions
+    assert not (run_dir / _profiling.RESOURCE_USAGE_FILE).exists()
+
+
+def test_sampling(tmp_path, monkeypatch):
+    run_dir = run(tmp_path, monkeypatch, ['--profiler', 'sampling'])
+
+    lines = (run_dir / _profiling.STACKS_FILE).read_text().splitlines()
+    stacks = {}
+    for line in lines:
+        stack, count = line.rsplit(' ', 1)
+        stacks[stack] = int(count)
+    busy = sum(count for stack, count in stacks.items()
+               if 'busy_function' in stack.split(';')[-1])
+    assert busy > 10
+    assert all(stack.startswith('MainThread;') for stack in stacks
+               if 'busy_function' in stack)
+
+
+def test_resource_usage(tmp_path, monkeypatch):
+    run_dir = run(tmp_path, monkeypatch, ['-r'], resource_usage_interval=0.1)
+
+    with open(run_dir / _profiling.RESOURCE_USAGE_FILE) as file:
+        rows = list(csv.DictReader(file))
+    assert list(rows[0]) == list(_profiling.ResourceSampler.HEADER)
+    assert len(rows) >= 3
+    assert float(rows[-1]['cpu_time_s']) > 0.1
+    assert float(rows[-1]['peak_rss_mb']) > 0.
+
+
+def test_resource_usage_reset_peak(tmp_path, monkeypatch):
+    """Test the peak memory covers the run when the diagnostic resets it."""
+    if not os.path.exists('/proc/self/clear_refs'):
+        pytest.skip("the peak memory cannot be reset")
+    settings = dict(create_settings(tmp_path), resource_usage_interval=0.05)
+    monkeypatch.setattr(sys, 'argv', ['', '-r', write_settings(settings)])
+
+    with shared.run_diagnostic():
+        buffer = bytearray(300 * 1024**2)
+        time.sleep(0.2)
+        rss = _profiling._rss()
+        del buffer
+        with open('/proc/self/clear_refs', 'w') as file:
+            file.write('5')
+        time.sleep(0.2)
+
+    run_dir = tmp_path / 'run_dir'
+    with open(run_dir / _profiling.RESOURCE_USAGE_FILE) as file:
+        rows = list(csv.DictReader(file))
+    assert float(rows[-1]['peak_rss_mb']) >= rss - 1.
+    assert _profiling._peak_rss() < rss - 200.
+
+
+def test_unknown_profiler(tmp_path, monkeypatch):
+    with pytest.raises(ValueError, match="Unknown profiler 'vprof'"):
+        run(tmp_path, monkeypatch, profiler='vprof')